@@ -1,16 +1,23 @@
+import json
+import time
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from database import get_db
+from database import get_db, SessionLocal
 from auth_routes import get_current_user
 from models_db import Chat, Message, PatientState, User
 
 from schemas_chat import AIMessageRequest
-from groq_service import groq_chat
+from groq_service import groq_chat_async, groq_chat_stream, DEFAULT_MODEL
+from llm_cache import llm_cache
 from dfu_state import default_patient_state
 from qa_flow import QA_ORDER, QUESTION_TEXT, EXAMPLES
 from qa_validator import validate_answer
+from prompt_builder import prompt_builder, render_patient_details, PROMPT_HISTORY_MESSAGES
 
 router = APIRouter(prefix="/chat", tags=["AI Chat"])
 
@@ -129,78 +136,75 @@ def generate_recommendation(state: dict) -> str:
         "[[BUTTON:Find nearby doctors:/find-doctors?doctorTypes=physician,diabetologist]]"
     )
 
-# ---------------- MAIN ROUTE ----------------
+# ---------------- REPLY PLANNING ----------------
 
-@router.post("/{chat_id}/ai-message")
-def ai_message(
-    chat_id: int,
-    payload: AIMessageRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    content = payload.content.strip()
-    if not content:
-        raise HTTPException(status_code=400, detail="Message content required")
+FREE_CHAT_SYSTEM_PROMPT = """
+You are a diabetic foot ulcer (DFU) medical assistant.
+Rules:
+- Explain DFU clearly and safely.
+- Do NOT diagnose or prescribe medication.
+- Be short and patient-friendly.
+"""
 
-    chat = db.query(Chat).filter(
-        Chat.id == chat_id,
-        Chat.user_id == current_user.id
-    ).first()
+MID_QA_SYSTEM_PROMPT = """
+You are a DFU medical assistant.
+Rules:
+- Answer the user's question clearly.
+- Do NOT give final advice yet.
+- After answering, return to the pending question.
+"""
 
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
+SKIP_PHRASES = [
+    "i don't know", "dont know", "don't know",
+    "no idea", "not sure", "skip", "skip this",
+    "next", "next question"
+]
 
-    # save user message
-    db.add(Message(chat_id=chat.id, role="user", content=content))
 
-    # load / init state
-    state_row = db.query(PatientState).filter(
-        PatientState.chat_id == chat.id
-    ).first()
+class ReplyPlan:
+    """
+    What to answer a chat message with. Either `reply` is the complete
+    assistant message, or the answer comes from the LLM (`system_prompt`,
+    `user_prompt`) and `suffix` is appended to whatever it generates.
 
-    if not state_row:
-        state_row = PatientState(
-            chat_id=chat.id,
-            state_json=default_patient_state(),
-            updated_at=datetime.utcnow()
-        )
-        db.add(state_row)
-        db.commit()
-        db.refresh(state_row)
+    `cache_question` is set only when the LLM answer depends on nothing but
+    that question (free chat), making it safe to share through llm_cache.
+    """
 
-    state = dict(state_row.state_json)
+    def __init__(self, reply=None, system_prompt=None, user_prompt=None, suffix="", cache_question=None):
+        self.reply = reply
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.suffix = suffix
+        self.cache_question = cache_question
+
+    @property
+    def needs_llm(self) -> bool:
+        return self.reply is None
+
+    def complete(self, answer: str) -> str:
+        return answer + self.suffix
+
+
+def plan_reply(content: str, state: dict, context=None) -> ReplyPlan:
+    """
+    Decide the reply to one user message, updating the Q&A state in place.
+    Shared by the authenticated and guest chats. context, if given, is called
+    only when the LLM needs the conversation and returns the prompt context
+    block (see prompt_builder).
+    """
 
     # ==========================================================
     # MODE 1 — FREE CHAT (BEFORE IMAGE UPLOAD)
     # ==========================================================
     if not state.get("qa_active", False):
-        system_prompt = """
-You are a diabetic foot ulcer (DFU) medical assistant.
-Rules:
-- Explain DFU clearly and safely.
-- Do NOT diagnose or prescribe medication.
-- Be short and patient-friendly.
-"""
         user_prompt = f"""
 User message: {content}
 
 Respond normally.
 If relevant, gently mention that uploading an ulcer image allows personalized guidance.
 """
-        answer = groq_chat(system_prompt, user_prompt)
-
-        # answer += (
-        #     "\n\nIf you want personalized guidance, "
-        #     "you can upload an image of your foot ulcer."
-        # )
-
-        db.add(Message(chat_id=chat.id, role="assistant", content=answer))
-        db.commit()
-
-        return {
-            "assistant_message": answer,
-            "patient_state": state
-        }
+        return ReplyPlan(system_prompt=FREE_CHAT_SYSTEM_PROMPT, user_prompt=user_prompt, cache_question=content)
 
     # ==========================================================
     # MODE 2 — GUIDED Q&A (AFTER IMAGE UPLOAD)
@@ -219,30 +223,16 @@ If relevant, gently mention that uploading an ulcer image allows personalized gu
 
         recommendation = generate_recommendation(state)
 
-        final_msg = (
+        return ReplyPlan(reply=(
             "✅ Thank you. I now have the required information.\n\n"
             f"🧾 **Recommended Next Actions:**\n{recommendation}\n\n"
             "⚠️ This is not a medical diagnosis. Please consult a doctor."
-        )
+        ))
 
-        state_row.state_json = state
-        state_row.updated_at = datetime.utcnow()
-        db.add(Message(chat_id=chat.id, role="assistant", content=final_msg))
-        db.commit()
-
-        return {
-            "assistant_message": final_msg,
-            "patient_state": state
-        }
-    
     # ---------------------------------------------
     # USER SKIPPED CURRENT QUESTION (dont know / skip)
     # ---------------------------------------------
-    if content.lower().strip() in [
-        "i don't know", "dont know", "don't know",
-        "no idea", "not sure", "skip", "skip this",
-        "next", "next question"
-    ]:
+    if content.lower().strip() in SKIP_PHRASES:
         # treat as valid skip WITHOUT involving LLM
         state[current_key] = "unknown"
         state["retry_count"] = 0
@@ -250,63 +240,40 @@ If relevant, gently mention that uploading an ulcer image allows personalized gu
         next_key = next_unanswered_key(state)
         state["current_question_key"] = next_key
 
-        if     next_key:
-            assistant_msg = (
+        if next_key:
+            return ReplyPlan(reply=(
                 "Okay, we’ll move on.\n\n"
                 f"{format_question(next_key)}"
-            )
-        else:
-            state["qa_completed"] = True
-            state["qa_active"] = False
-            recommendation = generate_recommendation(state)
-
-            assistant_msg = (
-                "Thank you. I have enough information now.\n\n"
-                f"{recommendation}\n\n"
-                "⚠️ This is not a medical diagnosis. Please consult a doctor."
-            )
+            ))
 
-        db.add(Message(chat_id=chat.id, role="assistant", content=assistant_msg))
-        state_row.state_json = state
-        state_row.updated_at = datetime.utcnow()
-        db.commit()
-
-        return {
-            "assistant_message": assistant_msg,
-            "patient_state": state
-        }
+        state["qa_completed"] = True
+        state["qa_active"] = False
+        recommendation = generate_recommendation(state)
 
+        return ReplyPlan(reply=(
+            "Thank you. I have enough information now.\n\n"
+            f"{recommendation}\n\n"
+            "⚠️ This is not a medical diagnosis. Please consult a doctor."
+        ))
 
     # ----------------------------------------------------------
     # USER ASKS A DFU QUESTION MID-Q&A
     # ----------------------------------------------------------
     if is_dfq_question(content):
-        system_prompt = """
-You are a DFU medical assistant.
-Rules:
-- Answer the user's question clearly.
-- Do NOT give final advice yet.
-- After answering, return to the pending question.
-"""
+        context_block = context() if context is not None else render_patient_details(state)
         user_prompt = f"""
+{context_block}
+
+Pending assessment question: {QUESTION_TEXT[current_key]}
 User question: {content}
-Known severity: {state.get("severity")}
-Known info: {state}
 
 Answer briefly, then continue assessment.
 """
-        reply = groq_chat(system_prompt, user_prompt)
-
-        reply += "\n\nNow continuing your assessment:\n"
-        reply += format_question(current_key)
-
-        db.add(Message(chat_id=chat.id, role="assistant", content=reply))
-        db.commit()
-
-        return {
-            "assistant_message": reply,
-            "patient_state": state
-        }
+        return ReplyPlan(
+            system_prompt=MID_QA_SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            suffix="\n\nNow continuing your assessment:\n" + format_question(current_key),
+        )
 
     # ----------------------------------------------------------
     # USER ANSWERING CURRENT QUESTION
@@ -324,15 +291,7 @@ Answer briefly, then continue assessment.
         if state["retry_count"] >= 2:
             retry_msg += "\n\nYou may also reply with: `I don’t know`"
 
-        db.add(Message(chat_id=chat.id, role="assistant", content=retry_msg))
-        state_row.state_json = state
-        state_row.updated_at = datetime.utcnow()
-        db.commit()
-
-        return {
-            "assistant_message": retry_msg,
-            "patient_state": state
-        }
+        return ReplyPlan(reply=retry_msg)
 
     # VALID ANSWER
     state[current_key] = value
@@ -342,29 +301,196 @@ Answer briefly, then continue assessment.
     state["current_question_key"] = next_key
 
     if next_key:
-        assistant_msg = (
+        return ReplyPlan(reply=(
             f"✅ Noted: {normalized}\n\n"
             f"{format_question(next_key)}"
-        )
+        ))
+
+    state["qa_completed"] = True
+    state["qa_active"] = False
+
+    recommendation = generate_recommendation(state)
+
+    return ReplyPlan(reply=(
+        f"✅ Noted: {normalized}\n\n"
+        "🧾 **Final Assessment & Recommended Actions:**\n"
+        f"{recommendation}\n\n"
+        "⚠️ This is not a medical diagnosis. Please consult a doctor."
+    ))
+
+
+def cached_answer(plan: ReplyPlan):
+    if plan.cache_question is None:
+        return None
+    return llm_cache.get(plan.system_prompt, plan.cache_question, DEFAULT_MODEL)
+
+
+def cache_answer(plan: ReplyPlan, answer: str, latency: float):
+    if plan.cache_question is not None:
+        llm_cache.put(plan.system_prompt, plan.cache_question, answer, latency, DEFAULT_MODEL)
+
+
+async def run_plan(plan: ReplyPlan) -> str:
+    if not plan.needs_llm:
+        return plan.reply
+
+    answer = cached_answer(plan)
+    if answer is None:
+        started = time.perf_counter()
+        answer = await groq_chat_async(plan.system_prompt, plan.user_prompt)
+        cache_answer(plan, answer, time.perf_counter() - started)
+    return plan.complete(answer)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_plan(plan: ReplyPlan, state: dict, on_complete):
+    """
+    Server-sent events for one reply: `token` events with text deltas as the
+    LLM generates them, then `done` with the full message and patient state
+    once on_complete(reply) has persisted it. An LLM failure ends the stream
+    with an `error` event and nothing is persisted.
+    """
+    cached = cached_answer(plan) if plan.needs_llm else None
+
+    if not plan.needs_llm or cached is not None:
+        reply = plan.reply if cached is None else plan.complete(cached)
+        yield sse_event("token", {"delta": reply})
     else:
-        state["qa_completed"] = True
-        state["qa_active"] = False
+        parts = []
+        started = time.perf_counter()
+        try:
+            async for delta in groq_chat_stream(plan.system_prompt, plan.user_prompt):
+                parts.append(delta)
+                yield sse_event("token", {"delta": delta})
+        except Exception as e:
+            print(f"[GROQ STREAM] Error: {e}")
+            yield sse_event("error", {"detail": "The assistant is unavailable right now. Please try again."})
+            return
 
-        recommendation = generate_recommendation(state)
+        answer = "".join(parts)
+        cache_answer(plan, answer, time.perf_counter() - started)
+        if plan.suffix:
+            yield sse_event("token", {"delta": plan.suffix})
+        reply = plan.complete(answer)
 
-        assistant_msg = (
-            f"✅ Noted: {normalized}\n\n"
-            "🧾 **Final Assessment & Recommended Actions:**\n"
-            f"{recommendation}\n\n"
-            "⚠️ This is not a medical diagnosis. Please consult a doctor."
+    await on_complete(reply)
+    yield sse_event("done", {"assistant_message": reply, "patient_state": state})
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# ---------------- MAIN ROUTE ----------------
+
+def chat_context(db: Session, chat_id: int, state: dict):
+    """
+    Prompt context for a chat: patient details plus its saved messages. The
+    current message is saved together with the reply, so it is never among them.
+    """
+    def fetch_since(last_id):
+        query = db.query(Message.id, Message.role, Message.content).filter(Message.chat_id == chat_id)
+        if last_id is not None:
+            query = query.filter(Message.id > last_id)
+        rows = query.order_by(Message.id.desc()).limit(PROMPT_HISTORY_MESSAGES).all()
+        return list(reversed(rows))
+
+    return lambda: prompt_builder.build(chat_id, state, fetch_since)
+
+
+def begin_turn(db: Session, chat_id: int, user: User, content: str):
+    """
+    Load the chat and its Q&A state and plan the reply. Returns (chat_id,
+    state, plan). The user's message is not saved here but with the reply,
+    so a failed or abandoned LLM call leaves no unanswered message behind.
+    """
+    chat = db.query(Chat).filter(
+        Chat.id == chat_id,
+        Chat.user_id == user.id
+    ).first()
+
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    # load / init state
+    state_row = db.query(PatientState).filter(
+        PatientState.chat_id == chat.id
+    ).first()
+
+    if not state_row:
+        state_row = PatientState(
+            chat_id=chat.id,
+            state_json=default_patient_state(),
+            updated_at=datetime.utcnow()
         )
+        db.add(state_row)
 
-    db.add(Message(chat_id=chat.id, role="assistant", content=assistant_msg))
-    state_row.state_json = state
-    state_row.updated_at = datetime.utcnow()
     db.commit()
+    db.refresh(state_row)
+
+    state = dict(state_row.state_json)
+    plan = plan_reply(content, state, chat_context(db, chat.id, state))
+    return chat.id, state, plan
+
+
+def save_reply(db: Session, chat_id: int, state: dict, content: str, reply: str):
+    """Persist the user's message, the assistant's reply and the updated Q&A state in one commit."""
+    db.query(PatientState).filter(PatientState.chat_id == chat_id).update(
+        {"state_json": state, "updated_at": datetime.utcnow()}
+    )
+    db.add(Message(chat_id=chat_id, role="user", content=content))
+    db.add(Message(chat_id=chat_id, role="assistant", content=reply))
+    db.commit()
+
+
+def save_reply_in_new_session(chat_id: int, state: dict, content: str, reply: str):
+    # The request's session is gone by the time a streamed reply finishes
+    with SessionLocal() as db:
+        save_reply(db, chat_id, state, content, reply)
+
+
+def _message_content(payload: AIMessageRequest) -> str:
+    content = payload.content.strip()
+    if not content:
+        raise HTTPException(status_code=400, detail="Message content required")
+    return content
+
+
+@router.post("/{chat_id}/ai-message")
+async def ai_message(
+    chat_id: int,
+    payload: AIMessageRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    content = _message_content(payload)
+
+    # DB work stays on the threadpool; only the Groq wait happens on the event loop
+    chat_id, state, plan = await run_in_threadpool(begin_turn, db, chat_id, current_user, content)
+    reply = await run_plan(plan)
+    await run_in_threadpool(save_reply, db, chat_id, state, content, reply)
 
     return {
-        "assistant_message": assistant_msg,
+        "assistant_message": reply,
         "patient_state": state
-    }
\ No newline at end of file
+    }
+
+
+@router.post("/{chat_id}/ai-message/stream")
+async def ai_message_stream(
+    chat_id: int,
+    payload: AIMessageRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Same as /ai-message, streamed as server-sent events (see stream_plan)."""
+    content = _message_content(payload)
+
+    chat_id, state, plan = await run_in_threadpool(begin_turn, db, chat_id, current_user, content)
+
+    async def persist(reply):
+        await run_in_threadpool(save_reply_in_new_session, chat_id, state, content, reply)
+
+    return StreamingResponse(stream_plan(plan, state, persist), media_type="text/event-stream", headers=SSE_HEADERS)
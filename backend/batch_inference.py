@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+# Largest number of queued requests folded into one forward pass
+INFER_MAX_BATCH_SIZE = int(os.getenv("INFER_MAX_BATCH_SIZE", "8"))
+# How long the first request of a batch waits for company (milliseconds)
+INFER_MAX_WAIT_MS = float(os.getenv("INFER_MAX_WAIT_MS", "5"))
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching wrapper around a single Keras model.
+
+    Callers submit one preprocessed tensor of shape (n, 224, 224, 3). A worker
+    thread collects queued tensors until max_batch_size requests are waiting or
+    max_wait_ms has passed since the first one arrived, runs the model once on
+    the stacked batch and hands each caller back its own rows.
+
+    It exposes predict(x, verbose=0) like a Keras model, so it can be passed
+    anywhere predict_service expects a model.
+    """
+
+    def __init__(self, model, name: str, max_batch_size: int = INFER_MAX_BATCH_SIZE,
+                 max_wait_ms: float = INFER_MAX_WAIT_MS):
+        self.model = model
+        self.name = name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = Queue()
+        self._batch_buf = None
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._batched_requests = 0
+        # Rows, not requests: one submit can carry several images (batch prediction)
+        self._batched_rows = 0
+        self._filled_rows = 0  # rows counted against max_batch_size, at most that many per batch
+        self._largest_batch = 0
+        self._forward_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    # -------------------- Public API --------------------
+    def submit(self, x) -> Future:
+        """Queue one tensor and return a Future resolving to its raw model output rows."""
+        fut = Future()
+        with self._stats_lock:
+            self._requests += 1
+        self._queue.put((x, fut))
+        return fut
+
+    def predict(self, x, verbose=0):
+        return self.submit(x).result()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = self._batches
+            fill_ratio = (
+                self._filled_rows / (batches * self.max_batch_size)
+                if batches else 0.0
+            )
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000.0, 3),
+                "requests": self._requests,
+                "batches": batches,
+                "avg_batch_size": round(self._batched_rows / batches, 3) if batches else 0.0,
+                "avg_requests_per_batch": round(self._batched_requests / batches, 3) if batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "batch_fill_ratio": round(fill_ratio, 4),
+                "avg_forward_ms": round(self._forward_seconds * 1000.0 / batches, 3) if batches else 0.0,
+                "queue_depth": self._queue.qsize(),
+            }
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5)
+
+    # -------------------- Worker --------------------
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _stack(self, xs):
+        """Concatenate request tensors into a reused batch buffer instead of a fresh array."""
+        rows = sum(x.shape[0] for x in xs)
+        buf = self._batch_buf
+        if (buf is None or buf.shape[0] < rows or buf.shape[1:] != xs[0].shape[1:]
+                or buf.dtype != xs[0].dtype):
+            buf = np.empty((max(rows, self.max_batch_size),) + xs[0].shape[1:], dtype=xs[0].dtype)
+            self._batch_buf = buf
+        return np.concatenate(xs, axis=0, out=buf[:rows])
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # Requests cancelled while queued (e.g. cascade rejections) are dropped here
+            live = [(x, fut) for x, fut in batch if fut.set_running_or_notify_cancel()]
+            if not live:
+                continue
+
+            started = time.perf_counter()
+            try:
+                xs = live[0][0] if len(live) == 1 else self._stack([x for x, _ in live])
+                raw = np.asarray(self.model.predict(xs, verbose=0))
+            except Exception as e:
+                for _, fut in live:
+                    fut.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            offset = 0
+            for x, fut in live:
+                n = x.shape[0]
+                fut.set_result(raw[offset:offset + n])
+                offset += n
+
+            with self._stats_lock:
+                self._batches += 1
+                self._batched_requests += len(live)
+                self._batched_rows += offset
+                self._filled_rows += min(offset, self.max_batch_size)
+                self._largest_batch = max(self._largest_batch, offset)
+                self._forward_seconds += elapsed
+
+
+def batching_stats(*batchers) -> dict:
+    return {b.name: b.stats() for b in batchers if isinstance(b, MicroBatcher)}
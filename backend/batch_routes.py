@@ -0,0 +1,142 @@
+import asyncio
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
+
+from predict_service import get_pipeline, InvalidImageError, ImageTooLargeError, MAX_UPLOAD_BYTES
+from inference_executor import inference_executor
+from model_lifecycle import model_lifecycle
+from upload_routes import ALLOWED_IMAGE_TYPES
+
+load_dotenv()
+
+router = APIRouter(prefix="/predict", tags=["Batch Predict"])
+
+# -------------------- Config --------------------
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "64"))
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("BATCH_MAX_TOTAL_BYTES", str(200 * 1024 * 1024)))
+# Images per model forward pass; results for each chunk are streamed as soon as it finishes
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "16"))
+BATCH_DECODE_WORKERS = int(os.getenv("BATCH_DECODE_WORKERS", str(os.cpu_count() or 2)))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Pillow releases the GIL while decoding, so a thread pool decodes in parallel
+decode_pool = ThreadPoolExecutor(max_workers=BATCH_DECODE_WORKERS, thread_name_prefix="batch-decode")
+
+
+def read_zip(contents: bytes) -> list:
+    """Extract (filename, bytes) for every image in a zip archive, enforcing the batch limits."""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(contents))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive.")
+
+    entries = [
+        info for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        and not os.path.basename(info.filename).startswith(".")
+    ]
+    if len(entries) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_IMAGES} images per batch.")
+
+    # Declared sizes are checked before anything is inflated (zip bombs)
+    if sum(info.file_size for info in entries) > BATCH_MAX_TOTAL_BYTES:
+        raise HTTPException(status_code=413, detail="Archive contents are too large.")
+
+    return [(info.filename, archive.read(info)) for info in entries]
+
+
+async def stream_results(pipeline, items):
+    """
+    Decode all images in parallel and, as they finish, run them through the
+    models BATCH_CHUNK_SIZE at a time. Yields one NDJSON line per image.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def decode(index, contents):
+        try:
+            cached, pixels = await loop.run_in_executor(decode_pool, pipeline.prepare, contents, "/predict/batch")
+            return index, cached, pixels, None
+        except ImageTooLargeError:
+            return index, None, None, "Image is too large."
+        except InvalidImageError:
+            return index, None, None, "Invalid image file or corrupted image."
+
+    def line(index, **payload):
+        return json.dumps({"index": index, "filename": items[index][0], **payload}) + "\n"
+
+    pending = []  # (index, pixels) waiting for a model batch
+
+    async def flush():
+        chunk = list(pending)
+        pending.clear()
+        results = await inference_executor.run(
+            pipeline.predict_batch,
+            [pixels for _, pixels in chunk],
+            "/predict/batch",
+            [items[i][1] for i, _ in chunk],
+        )
+        return [line(i, result=r) for (i, _), r in zip(chunk, results)]
+
+    for done in asyncio.as_completed([decode(i, contents) for i, (_, contents) in enumerate(items)]):
+        index, cached, pixels, error = await done
+
+        if error is not None:
+            yield line(index, error=error)
+        elif cached is not None:
+            yield line(index, result=cached, cached=True)
+        else:
+            pending.append((index, pixels))
+            if len(pending) >= BATCH_CHUNK_SIZE:
+                for out in await flush():
+                    yield out
+
+    if pending:
+        for out in await flush():
+            yield out
+
+
+@router.post("/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(default=[]),
+    archive: Optional[UploadFile] = File(None),
+):
+    """
+    Predict many images in one request: a multipart list of `files`, a zip
+    `archive`, or both. Responds with newline-delimited JSON, one line per
+    image in completion order:
+    {"index": i, "filename": ..., "result": {<same shape as predict_ulcer>}}
+    or {"index": i, "filename": ..., "error": "..."} for images that fail.
+    """
+    pipeline = get_pipeline()
+    if pipeline is None:
+        raise model_lifecycle.not_ready_error()
+
+    items = []
+    for f in files:
+        if f.content_type not in ALLOWED_IMAGE_TYPES:
+            raise HTTPException(status_code=400, detail=f"{f.filename}: only JPG/PNG images are allowed.")
+        contents = await f.read()
+        if len(contents) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"{f.filename}: image is too large.")
+        items.append((f.filename, contents))
+
+    if archive is not None:
+        items.extend(read_zip(await archive.read()))
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No images provided.")
+    if len(items) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_IMAGES} images per batch.")
+    if sum(len(contents) for _, contents in items) > BATCH_MAX_TOTAL_BYTES:
+        raise HTTPException(status_code=413, detail="Batch is too large.")
+
+    return StreamingResponse(stream_results(pipeline, items), media_type="application/x-ndjson")
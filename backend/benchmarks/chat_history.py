@@ -0,0 +1,135 @@
+"""
+Open-chat latency as chats grow: the old full load (chat.messages) against the
+keyset-paginated first page and a page deep in the history.
+
+Run from the backend/ directory:
+    python -m benchmarks.chat_history
+    python -m benchmarks.chat_history --sizes 100,1000,10000 --database-url postgresql://.../diasure_bench
+
+Tables are created in the given database and the benchmark rows are deleted
+afterwards; point it at a scratch database, not production.
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+# database.py builds its engine at import; the benchmark uses its own below
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from chat_routes import message_page, MESSAGES_PAGE_SIZE
+from models_db import User, Chat, Message
+from schemas_chat import ChatWithMessagesResponse
+
+TABLES = [User.__table__, Chat.__table__, Message.__table__]
+
+
+def seed_chat(db, user_id: int, n_messages: int) -> int:
+    chat = Chat(user_id=user_id, title=f"bench {n_messages}")
+    db.add(chat)
+    db.flush()
+
+    started = datetime.utcnow() - timedelta(seconds=n_messages)
+    rows = [
+        {
+            "chat_id": chat.id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message {i}: " + "lorem ipsum dolor sit amet " * 6,
+            "created_at": started + timedelta(seconds=i),
+        }
+        for i in range(n_messages)
+    ]
+    for i in range(0, len(rows), 5000):
+        db.execute(insert(Message), rows[i:i + 5000])
+    db.commit()
+    return chat.id
+
+
+def serialize(chat, messages, next_cursor=None):
+    return ChatWithMessagesResponse.model_validate({
+        "chat_id": chat.id,
+        "title": chat.title,
+        "created_at": chat.created_at,
+        "messages": messages,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None,
+    }).model_dump_json()
+
+
+def open_full(Session, chat_id, page_size):
+    with Session() as db:
+        chat = db.get(Chat, chat_id)
+        return serialize(chat, chat.messages)
+
+
+def open_page(Session, chat_id, page_size, before=None):
+    with Session() as db:
+        chat = db.get(Chat, chat_id)
+        messages, cursor = message_page(db, chat.id, page_size, before)
+        return serialize(chat, messages, cursor)
+
+
+def time_ms(fn, iterations):
+    fn()  # warm-up
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000.0)
+    return statistics.median(samples)
+
+
+def deep_cursor(Session, chat_id, page_size, pages):
+    """Cursor of the page `pages` pages back from the newest."""
+    cursor = None
+    with Session() as db:
+        for _ in range(pages):
+            _, cursor = message_page(db, chat_id, page_size, cursor)
+            if cursor is None:
+                break
+    return cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,500,2000,5000,20000", help="Messages per chat")
+    parser.add_argument("--page-size", type=int, default=MESSAGES_PAGE_SIZE)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--database-url", default="sqlite:///./chat_history_bench.db")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    engine = create_engine(args.database_url)
+    for table in TABLES:
+        table.create(engine, checkfirst=True)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as db:
+        user = User(name="bench", email=f"bench-{time.time_ns()}@example.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        chat_ids = {n: seed_chat(db, user_id, n) for n in sizes}
+
+    try:
+        print(f"{'messages':>9}{'full load ms':>14}{'first page ms':>15}{'deep page ms':>14}")
+        for n, chat_id in chat_ids.items():
+            full = time_ms(lambda: open_full(Session, chat_id, args.page_size), args.iterations)
+            first = time_ms(lambda: open_page(Session, chat_id, args.page_size), args.iterations)
+            cursor = deep_cursor(Session, chat_id, args.page_size, pages=max(1, n // args.page_size // 2))
+            deep = time_ms(lambda: open_page(Session, chat_id, args.page_size, cursor), args.iterations)
+            print(f"{n:>9}{full:>14.2f}{first:>15.2f}{deep:>14.2f}")
+    finally:
+        with Session() as db:
+            db.query(Message).filter(Message.chat_id.in_(list(chat_ids.values()))).delete(synchronize_session=False)
+            db.query(Chat).filter(Chat.user_id == user_id).delete(synchronize_session=False)
+            db.query(User).filter(User.id == user_id).delete(synchronize_session=False)
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Latency / throughput benchmark for the prediction path.
+
+Scenarios:
+  in_process   predict_service.predict_ulcer called from a thread pool
+  http_predict POST /predict
+  http_guest   POST /guest/{id}/upload-image
+
+Each scenario runs for every input (format x resolution) and concurrency level,
+and reports p50/p95/p99 latency, throughput, CPU seconds and RSS. Results are
+written as JSON so runs can be diffed with --compare.
+
+Without --url the HTTP scenarios run the FastAPI app in-process (ASGI
+transport, no sockets). With --url they hit a running server; pass
+--server-pid to also sample that server's CPU and RSS, and start it with
+PREDICTION_CACHE_MAX_ENTRIES=0 so repeated images aren't served from cache.
+
+When the .h5 files (or TensorFlow) are missing, or with --stub, numpy stand-in
+models with fixed forward times are used, so the suite runs offline.
+
+Run from the backend/ directory:
+    python -m benchmarks.inference_suite --output bench.json
+    python -m benchmarks.inference_suite --scenarios http_predict --concurrency 1,8,32 --resolutions hd
+    python -m benchmarks.inference_suite --output new.json --compare bench.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from benchmarks.synthetic import RESOLUTIONS, image_pool, stub_models, real_models_available
+
+SCENARIOS = ("in_process", "http_predict", "http_guest")
+FORMATS = {"jpeg": ("JPEG", "image/jpeg", "jpg"), "png": ("PNG", "image/png", "png")}
+
+
+# -------------------- Process sampling --------------------
+def _proc_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _proc_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return None
+
+
+def cpu_seconds(pid):
+    try:
+        return _proc_cpu_seconds(pid)
+    except OSError:
+        if pid != os.getpid():
+            return None
+        t = os.times()
+        return t.user + t.system
+
+
+def rss_mb(pid):
+    try:
+        return _proc_rss_mb(pid)
+    except OSError:
+        if pid != os.getpid():
+            return None
+        try:
+            import resource
+        except ImportError:
+            return None
+        # Peak rather than current RSS, the closest portable figure (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def summarize(latencies, errors, wall, cpu, rss):
+    ordered = sorted(latencies)
+
+    def pct(p):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))], 3)
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ordered) / wall, 3) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(ordered), 3) if ordered else None,
+            "p50": pct(50),
+            "p95": pct(95),
+            "p99": pct(99),
+            "max": round(ordered[-1], 3) if ordered else None,
+        },
+        "cpu_seconds": round(cpu, 3) if cpu is not None else None,
+        "cpu_util": round(cpu / wall, 3) if cpu is not None and wall else None,
+        "rss_mb": round(rss, 1) if rss is not None else None,
+    }
+
+
+# -------------------- Models --------------------
+def load_models(force_stub, filter_ms, severity_ms):
+    """(filter, severity, label): real models when available, otherwise stubs."""
+    from predict_service import FILTER_MODEL_PATH, SEVERITY_MODEL_PATH
+
+    if not force_stub and real_models_available([FILTER_MODEL_PATH, SEVERITY_MODEL_PATH]):
+        from inference_backends import load_backend_model, INFER_BACKEND
+
+        return (
+            load_backend_model("filter", FILTER_MODEL_PATH),
+            load_backend_model("severity", SEVERITY_MODEL_PATH),
+            INFER_BACKEND,
+        )
+
+    f, s = stub_models(filter_ms, severity_ms)
+    return f, s, "stub"
+
+
+# -------------------- Scenarios --------------------
+def run_in_process(models, images, concurrency, total, pid):
+    from predict_service import predict_ulcer
+
+    foot_random_model, severity_model = models
+    errors = 0
+
+    def one(i):
+        started = time.perf_counter()
+        with Image.open(io.BytesIO(images[i % len(images)])) as img:
+            predict_ulcer(img, foot_random_model, severity_model)
+        return (time.perf_counter() - started) * 1000.0
+
+    cpu0 = cpu_seconds(pid)
+    started = time.perf_counter()
+    latencies = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for fut in [pool.submit(one, i) for i in range(total)]:
+            try:
+                latencies.append(fut.result())
+            except Exception:
+                errors += 1
+    wall = time.perf_counter() - started
+    cpu1 = cpu_seconds(pid)
+    return summarize(latencies, errors, wall, None if cpu0 is None else cpu1 - cpu0, rss_mb(pid))
+
+
+async def run_http(client_factory, path_for, images, content_type, ext, concurrency, total, pid):
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def user(client):
+        nonlocal next_index, errors
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            path = await path_for(client)
+            started = time.perf_counter()
+            try:
+                r = await client.post(path, files={"file": (f"img{i}.{ext}", images[i % len(images)], content_type)})
+                ok = r.status_code == 200
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            else:
+                errors += 1
+
+    async with client_factory() as client:
+        cpu0 = cpu_seconds(pid) if pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+        cpu1 = cpu_seconds(pid) if pid else None
+    return summarize(latencies, errors, wall, None if cpu0 is None else cpu1 - cpu0, rss_mb(pid) if pid else None)
+
+
+async def predict_path(client):
+    return "/predict"
+
+
+async def guest_path(client):
+    # Session creation isn't part of the timed upload
+    r = await client.post("/guest/start")
+    r.raise_for_status()
+    return f"/guest/{r.json()['session_id']}/upload-image"
+
+
+def http_client_factory(args, models):
+    """Returns a callable making a fresh AsyncClient; each case runs in its own event loop."""
+    import httpx
+
+    if args.url:
+        return lambda: httpx.AsyncClient(base_url=args.url, timeout=120)
+
+    # In-process app: /predict and guest uploads don't touch the DB or Groq,
+    # but their modules need these set to import
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+    import main
+    from batch_inference import MicroBatcher
+    from cascade import CascadeScheduler
+    from predict_service import InferencePipeline, set_pipeline
+
+    # Same wiring as model_lifecycle, minus the prediction cache
+    foot_random_model = MicroBatcher(models[0], "filter")
+    severity_model = MicroBatcher(models[1], "severity")
+    set_pipeline(InferencePipeline(foot_random_model, severity_model, cache=None,
+                                   cascade=CascadeScheduler(severity_model)))
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=120)
+
+
+# -------------------- Reporting --------------------
+def case_key(r):
+    return (r["scenario"], r["format"], r["resolution"], r["concurrency"])
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"]}
+
+    print(f"\nCompared with {baseline_path} (positive = slower / less throughput):")
+    print(f"{'case':<40}{'p50 Δ%':>9}{'p95 Δ%':>9}{'p99 Δ%':>9}{'rps Δ%':>9}")
+    for r in results:
+        old = baseline.get(case_key(r))
+        if old is None:
+            continue
+
+        def delta(new, prev, invert=False):
+            if not new or not prev:
+                return "n/a"
+            d = (new - prev) / prev * 100.0
+            return f"{(-d if invert else d):+.1f}"
+
+        name = "/".join(str(k) for k in case_key(r))
+        print(f"{name:<40}"
+              f"{delta(r['latency_ms']['p50'], old['latency_ms']['p50']):>9}"
+              f"{delta(r['latency_ms']['p95'], old['latency_ms']['p95']):>9}"
+              f"{delta(r['latency_ms']['p99'], old['latency_ms']['p99']):>9}"
+              f"{delta(r['throughput_rps'], old['throughput_rps'], invert=True):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--formats", default="jpeg,png")
+    parser.add_argument("--resolutions", default="vga,hd,12mp", help=f"Any of {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per case")
+    parser.add_argument("--pool", type=int, default=16, help="Distinct images per input type")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--server-pid", type=int, help="PID of the --url server, for CPU/RSS sampling")
+    parser.add_argument("--stub", action="store_true", help="Use stub models even if the .h5 files exist")
+    parser.add_argument("--stub-filter-ms", type=float, default=8.0)
+    parser.add_argument("--stub-severity-ms", type=float, default=25.0)
+    parser.add_argument("--output", default="inference_bench.json")
+    parser.add_argument("--compare", help="Earlier --output file to diff against")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    formats = [f for f in args.formats.split(",") if f]
+    resolutions = [r for r in args.resolutions.split(",") if r]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    for s in scenarios:
+        if s not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {s!r}; expected {SCENARIOS}")
+
+    needs_models = "in_process" in scenarios or (not args.url and any(s.startswith("http") for s in scenarios))
+    f, s, model_label = load_models(args.stub, args.stub_filter_ms, args.stub_severity_ms) if needs_models else (None, None, "remote")
+    print(f"Models: {model_label}")
+
+    http_clients = http_client_factory(args, (f, s)) if any(x.startswith("http") for x in scenarios) else None
+    local_pid = os.getpid()
+
+    results = []
+    print(f"{'scenario':<14}{'fmt':<6}{'res':<6}{'conc':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'cpu%':>7}{'rss MB':>8}{'err':>5}")
+    for fmt in formats:
+        pil_format, content_type, ext = FORMATS[fmt]
+        for res in resolutions:
+            images = image_pool(res, pil_format, args.pool)
+            for scenario in scenarios:
+                for conc in levels:
+                    if scenario == "in_process":
+                        r = run_in_process((f, s), images, conc, args.requests, local_pid)
+                    else:
+                        path_for = predict_path if scenario == "http_predict" else guest_path
+                        pid = args.server_pid if args.url else local_pid
+                        r = asyncio.run(run_http(http_clients, path_for, images, content_type, ext,
+                                                 conc, args.requests, pid))
+                    r.update({"scenario": scenario, "format": fmt, "resolution": res, "concurrency": conc})
+                    results.append(r)
+
+                    lat = r["latency_ms"]
+                    cpu = f"{r['cpu_util'] * 100:.0f}" if r["cpu_util"] is not None else "-"
+                    rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+                    print(f"{scenario:<14}{fmt:<6}{res:<6}{conc:>5}{r['throughput_rps']:>9.1f}"
+                          f"{lat['p50'] or 0:>9.1f}{lat['p95'] or 0:>9.1f}{lat['p99'] or 0:>9.1f}"
+                          f"{cpu:>7}{rss:>8}{r['errors']:>5}")
+
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "models": model_label,
+        "target": args.url or "in-process",
+        "requests_per_case": args.requests,
+    }
+    try:
+        import tensorflow as tf
+        meta["tensorflow"] = tf.__version__
+    except ImportError:
+        meta["tensorflow"] = None
+
+    with open(args.output, "w") as fh:
+        json.dump({"meta": meta, "results": results}, fh, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Local stand-in for the Google Places (New) Text Search and Distance Matrix
+APIs, for tests and load runs of /places/nearby without a key or billing.
+
+Run from the backend/ directory:
+    uvicorn benchmarks.mock_google:app --port 8090
+
+and point the backend at it:
+    GOOGLE_PLACES_BASE_URL=http://127.0.0.1:8090 GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8090 \\
+    GOOGLE_PLACES_API_KEY=mock uvicorn main:app
+
+MOCK_GOOGLE_LATENCY_MS adds a delay to every response and MOCK_GOOGLE_FAIL_RATE
+(0..1) answers that share of requests with 503, to exercise retries and the
+circuit breaker. GET /stats returns request counts.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from places_routes import haversine_distance
+
+MOCK_GOOGLE_LATENCY_MS = float(os.getenv("MOCK_GOOGLE_LATENCY_MS", "80"))
+MOCK_GOOGLE_FAIL_RATE = float(os.getenv("MOCK_GOOGLE_FAIL_RATE", "0"))
+# Roads are longer than the straight line
+ROAD_FACTOR = 1.3
+
+app = FastAPI(title="Mock Google APIs")
+counts = {"places": 0, "distance_matrix": 0, "failed": 0}
+
+
+async def _simulate():
+    """Latency plus an occasional failure; returns an error response or None."""
+    await asyncio.sleep(MOCK_GOOGLE_LATENCY_MS / 1000.0 * random.uniform(0.8, 1.2))
+    if random.random() < MOCK_GOOGLE_FAIL_RATE:
+        counts["failed"] += 1
+        return JSONResponse(status_code=503, content={"error": {"code": 503, "status": "UNAVAILABLE"}})
+    return None
+
+
+def mock_places(query: str, lat: float, lng: float, radius: float, n: int) -> list:
+    """The same places for the same query and neighbourhood, spread over the radius."""
+    seed = hashlib.sha1(f"{query}|{lat:.3f}|{lng:.3f}".encode()).hexdigest()
+    rng = random.Random(seed)
+    places = []
+    for i in range(n):
+        # Uniform over the disc; some land just outside to exercise the radius filter
+        d = radius * 1.1 * math.sqrt(rng.random())
+        bearing = rng.uniform(0, 2 * math.pi)
+        p_lat = lat + (d * math.cos(bearing)) / 111_320
+        p_lng = lng + (d * math.sin(bearing)) / (111_320 * max(math.cos(math.radians(lat)), 0.01))
+        place_id = f"mock-{seed[:8]}-{i}"
+        open_now = rng.random() < 0.7
+        places.append({
+            "id": place_id,
+            "displayName": {"text": f"{query.split(' near me')[0].title()} Clinic {i + 1}"},
+            "formattedAddress": f"{i + 1} Mock Street",
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "userRatingCount": rng.randint(0, 500),
+            "nationalPhoneNumber": f"0300 {rng.randint(1000000, 9999999)}",
+            "currentOpeningHours": {
+                "openNow": open_now,
+                "weekdayDescriptions": ["Monday: 9:00 AM – 5:00 PM"],
+            },
+            "regularOpeningHours": {"periods": []},
+            "location": {"latitude": p_lat, "longitude": p_lng},
+            "googleMapsUri": f"https://www.google.com/maps/place/?q=place_id:{place_id}",
+        })
+    return places
+
+
+@app.post("/v1/places:searchText")
+async def search_text(request: Request):
+    counts["places"] += 1
+    error = await _simulate()
+    if error is not None:
+        return error
+
+    body = await request.json()
+    circle = body.get("locationBias", {}).get("circle", {})
+    center = circle.get("center", {})
+    places = mock_places(
+        body.get("textQuery", ""),
+        center.get("latitude", 0.0),
+        center.get("longitude", 0.0),
+        circle.get("radius", 5000.0),
+        body.get("maxResultCount", 20),
+    )
+    return {"places": places}
+
+
+@app.get("/maps/api/distancematrix/json")
+async def distance_matrix(origins: str, destinations: str):
+    counts["distance_matrix"] += 1
+    error = await _simulate()
+    if error is not None:
+        return error
+
+    o_lat, o_lng = (float(v) for v in origins.split("|")[0].split(","))
+    elements = []
+    for destination in destinations.split("|"):
+        d_lat, d_lng = (float(v) for v in destination.split(","))
+        meters = int(haversine_distance(o_lat, o_lng, d_lat, d_lng) * 1000 * ROAD_FACTOR)
+        minutes = max(1, round(meters / 500))  # ~30 km/h in town
+        elements.append({
+            "status": "OK",
+            "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+            "duration": {"text": f"{minutes} mins", "value": minutes * 60},
+        })
+    return {"status": "OK", "rows": [{"elements": elements}]}
+
+
+@app.get("/stats")
+def stats():
+    return counts
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark for image preprocessing: the original path versus the
+buffer-reusing path in predict_service.
+
+Run from the backend/ directory:
+    python -m benchmarks.preprocess --iterations 50
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from predict_service import (
+    IMG_SIZE,
+    SEVERITY_MEAN_BGR,
+    resize_to_input,
+    filter_normalize,
+    severity_normalize,
+    PreprocessBuffers,
+)
+
+SIZES = [(640, 480), (1920, 1080), (4032, 3024)]
+
+
+def synthetic_jpeg(width, height):
+    rng = np.random.default_rng(0)
+    # Smooth gradient plus noise so the JPEG isn't trivially compressible
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = np.clip(base + rng.normal(0, 20, (height, width, 3)), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def legacy_path(img):
+    """What predict_ulcer did before: four full-size float32 arrays per image."""
+    img = img.convert("RGB").resize((IMG_SIZE, IMG_SIZE))
+    x = np.array(img).astype(np.float32)
+    x = np.expand_dims(x, axis=0)
+
+    x_filter = x.copy()
+    x_filter /= 127.5
+    x_filter -= 1.0
+
+    x_sev = x.copy()[..., ::-1]
+    x_sev -= SEVERITY_MEAN_BGR
+    return x_filter, x_sev
+
+
+def buffered_path(img, buffers):
+    pixels = resize_to_input(img)
+    filter_normalize(pixels, out=buffers.filter[0])
+    severity_normalize(pixels, out=buffers.severity[0])
+    return buffers.filter, buffers.severity
+
+
+def measure(fn, contents, iterations):
+    # Decode outside the timed region; this benchmark is about preprocessing only
+    images = [Image.open(io.BytesIO(contents)) for _ in range(iterations + 1)]
+    for img in images:
+        img.load()
+
+    fn(images[0])  # warm up
+
+    started = time.perf_counter()
+    for img in images[1:]:
+        fn(img)
+    per_image_ms = (time.perf_counter() - started) * 1000.0 / iterations
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    fn(images[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return per_image_ms, (peak - baseline) / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    buffers = PreprocessBuffers()
+
+    print(f"{'input':<12}{'path':<10}{'ms/image':>10}{'peak alloc KB':>16}")
+    for width, height in SIZES:
+        contents = synthetic_jpeg(width, height)
+        for name, fn in (("legacy", legacy_path), ("buffered", lambda img: buffered_path(img, buffers))):
+            ms, peak_kb = measure(fn, contents, args.iterations)
+            print(f"{f'{width}x{height}':<12}{name:<10}{ms:>10.2f}{peak_kb:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
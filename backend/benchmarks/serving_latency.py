@@ -0,0 +1,71 @@
+"""
+Compare per-call latency of Model.predict against the traced ServingModel path.
+
+Run from the backend/ directory:
+    python -m benchmarks.serving_latency --iterations 50 --batch-sizes 1,4,8
+    python -m benchmarks.serving_latency --xla
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from predict_service import ServingModel, IMG_SIZE
+
+DEFAULT_MODELS = {
+    "filter": "./models/dfu_filter_mobilenetv2.h5",
+    "severity": "./models/resnet50_3class_phase2_best.h5",
+}
+
+
+def time_calls(fn, x, iterations):
+    fn(x)  # first call traces / builds the predict function, not counted
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(x)
+        samples.append((time.perf_counter() - started) * 1000.0)
+    samples.sort()
+    return {
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--xla", action="store_true", help="Compile the serving graph with XLA")
+    parser.add_argument("--filter-model", default=DEFAULT_MODELS["filter"])
+    parser.add_argument("--severity-model", default=DEFAULT_MODELS["severity"])
+    args = parser.parse_args()
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",") if b.strip()]
+    paths = {"filter": args.filter_model, "severity": args.severity_model}
+
+    print(f"{'model':<10}{'batch':>6}{'predict p50':>14}{'serving p50':>14}{'speedup':>10}")
+    for name, path in paths.items():
+        model = tf.keras.models.load_model(path, compile=False)
+        serving = ServingModel(model, name, jit_compile=args.xla)
+
+        for n in batch_sizes:
+            x = np.random.uniform(-1.0, 1.0, (n, IMG_SIZE, IMG_SIZE, 3)).astype(np.float32)
+
+            keras_stats = time_calls(lambda t: model.predict(t, verbose=0), x, args.iterations)
+            serving_stats = time_calls(serving.predict, x, args.iterations)
+
+            speedup = keras_stats["p50_ms"] / serving_stats["p50_ms"] if serving_stats["p50_ms"] else 0.0
+            print(
+                f"{name:<10}{n:>6}"
+                f"{keras_stats['p50_ms']:>12.2f}ms"
+                f"{serving_stats['p50_ms']:>12.2f}ms"
+                f"{speedup:>9.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
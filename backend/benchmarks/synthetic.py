@@ -0,0 +1,102 @@
+"""
+Synthetic inputs and stand-in models for the benchmarks.
+
+Images are smooth gradients with noise and a blob so JPEG/PNG encoders do
+realistic amounts of work. Each seed gives different pixels, so the prediction
+cache does not turn a run into cache hits.
+
+StubModel has the same predict(x, verbose=0) call and output shapes as the real
+models and sleeps for a configurable forward time (releasing the GIL like a
+TensorFlow forward pass), so the pipeline can be benchmarked offline without
+the .h5 files.
+"""
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "hd": (1280, 960),
+    "12mp": (4032, 3024),
+}
+
+
+def make_image(width: int, height: int, fmt: str = "JPEG", seed: int = 0, quality: int = 90) -> bytes:
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = rng.uniform(60, 200, 3).astype(np.float32)
+    grad = (xx / max(width, 1))[..., None] * rng.uniform(-60, 60, 3) + (yy / max(height, 1))[..., None] * rng.uniform(-60, 60, 3)
+
+    cx, cy, r = rng.uniform(0.3, 0.7) * width, rng.uniform(0.3, 0.7) * height, rng.uniform(0.1, 0.25) * min(width, height)
+    blob = ((xx - cx) ** 2 + (yy - cy) ** 2 < r * r)[..., None] * rng.uniform(-80, 80, 3)
+
+    noise = rng.normal(0, 12, (height, width, 3))
+    pixels = np.clip(base + grad + blob + noise, 0, 255).astype(np.uint8)
+
+    buf = io.BytesIO()
+    if fmt.upper() == "JPEG":
+        Image.fromarray(pixels).save(buf, format="JPEG", quality=quality)
+    else:
+        Image.fromarray(pixels).save(buf, format="PNG", compress_level=6)
+    return buf.getvalue()
+
+
+def image_pool(resolution: str, fmt: str, count: int, seed: int = 0) -> list:
+    width, height = RESOLUTIONS[resolution]
+    return [make_image(width, height, fmt, seed=seed + i) for i in range(count)]
+
+
+class StubModel:
+    """
+    numpy stand-in for the filter (sigmoid, 1 output) or severity (softmax,
+    3 outputs) model. accept_rate is the share of images the filter stub
+    passes as feet.
+    """
+
+    def __init__(self, outputs: int, forward_ms: float = 0.0, per_image_ms: float = 0.0,
+                 accept_rate: float = 0.8, seed: int = 0):
+        self.outputs = outputs
+        self.forward_ms = forward_ms
+        self.per_image_ms = per_image_ms
+        self.accept_rate = accept_rate
+        self._w = np.random.default_rng(seed).standard_normal((3, outputs)).astype(np.float32)
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        delay = self.forward_ms + self.per_image_ms * len(x)
+        if delay:
+            time.sleep(delay / 1000.0)
+
+        feats = x.mean(axis=(1, 2))
+        if self.outputs == 1:
+            # p_random: low for "feet", high otherwise, decided by a stable hash of the pixels
+            frac = (np.abs(feats.sum(axis=1)) * 1000.0) % 1.0
+            return np.where(frac < self.accept_rate, 0.01, 0.99).astype(np.float32)[:, None]
+
+        logits = feats @ self._w
+        e = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return (e / e.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    def warmup(self, batch_sizes=(1,)):
+        pass
+
+
+def stub_models(filter_ms: float = 8.0, severity_ms: float = 25.0):
+    """Filter and severity stand-ins with roughly CPU-sized forward times."""
+    return (
+        StubModel(1, forward_ms=filter_ms, per_image_ms=filter_ms / 4),
+        StubModel(3, forward_ms=severity_ms, per_image_ms=severity_ms / 4, seed=1),
+    )
+
+
+def real_models_available(paths) -> bool:
+    if not all(os.path.exists(p) for p in paths):
+        return False
+    try:
+        import tensorflow  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,178 @@
+"""
+Throughput and memory against uvicorn worker count, with and without the
+shared model server.
+
+For every worker count the script starts the API (and, in shared mode, one
+model_server.py process), waits for /health/ready, fires concurrent /predict
+uploads for a fixed duration, then reports requests/s and the resident memory
+of each process. RSS is read from /proc, so memory figures need Linux.
+
+Run from the backend/ directory:
+    python -m benchmarks.workers --workers 1,2,4 --mode shared
+    python -m benchmarks.workers --workers 1,2,4 --mode both --image ./sample.jpg
+"""
+import argparse
+import asyncio
+import io
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+from PIL import Image
+
+SOCKET = "/tmp/diasure-bench-models.sock"
+
+
+def sample_jpeg(path=None) -> bytes:
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    pixels = np.random.default_rng(0).integers(0, 255, (768, 1024, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def process_tree(pid):
+    """pid plus all descendants (uvicorn's worker processes)."""
+    pids, frontier = [pid], [pid]
+    while frontier:
+        parent = frontier.pop()
+        try:
+            with open(f"/proc/{parent}/task/{parent}/children") as f:
+                children = [int(c) for c in f.read().split()]
+        except OSError:
+            children = []
+        pids.extend(children)
+        frontier.extend(children)
+    return pids
+
+
+def is_helper(pid):
+    """multiprocessing's resource tracker, started next to uvicorn's workers; not a worker."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return b"resource_tracker" in f.read()
+    except OSError:
+        return False
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    raise RuntimeError(f"{base_url} not ready after {timeout}s")
+
+
+async def load(base_url, image, concurrency, duration):
+    done = errors = 0
+    deadline = time.monotonic() + duration
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        async def user():
+            nonlocal done, errors
+            while time.monotonic() < deadline:
+                r = await client.post("/predict", files={"file": ("foot.jpg", image, "image/jpeg")})
+                if r.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return done / (time.monotonic() - started), errors
+
+
+def stop(proc):
+    if proc is None or proc.poll() is not None:
+        return
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def run_case(workers, shared, args, image):
+    env = dict(os.environ)
+    server = None
+    if shared:
+        env["MODEL_SERVER_ADDRESS"] = SOCKET
+        server = subprocess.Popen([sys.executable, "model_server.py", "--address", SOCKET], env=env)
+    else:
+        env["MODEL_SERVER_ADDRESS"] = ""
+
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        # Every worker must have its pipeline; with one port we can only poll until all answer ready
+        wait_ready(base_url, args.startup_timeout)
+        time.sleep(args.settle)
+        rps, errors = asyncio.run(load(base_url, image, args.concurrency, args.duration))
+
+        worker_rss = [rss_mb(p) for p in process_tree(api.pid)[1:] if not is_helper(p)] or [rss_mb(api.pid)]
+        worker_rss = [r for r in worker_rss if r is not None]
+        server_rss = rss_mb(server.pid) if server else 0.0
+        return {
+            "mode": "shared" if shared else "per-worker",
+            "workers": workers,
+            "rps": rps,
+            "errors": errors,
+            "rss_per_worker_mb": sum(worker_rss) / len(worker_rss) if worker_rss else float("nan"),
+            "model_server_rss_mb": server_rss or 0.0,
+            "total_rss_mb": sum(worker_rss) + (server_rss or 0.0),
+        }
+    finally:
+        stop(api)
+        stop(server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--mode", choices=("shared", "per-worker", "both"), default="both")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent upload loops")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load per case")
+    parser.add_argument("--image", help="JPEG to upload (default: synthetic 1024x768)")
+    parser.add_argument("--port", type=int, default=8077)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--settle", type=float, default=5.0, help="Extra wait so every worker finishes loading")
+    args = parser.parse_args()
+
+    image = sample_jpeg(args.image)
+    modes = {"shared": [True], "per-worker": [False], "both": [False, True]}[args.mode]
+
+    print(f"{'mode':<12}{'workers':>8}{'req/s':>10}{'errors':>8}{'RSS/worker MB':>15}{'server MB':>11}{'total MB':>10}")
+    for shared in modes:
+        for n in [int(w) for w in args.workers.split(",") if w.strip()]:
+            r = run_case(n, shared, args, image)
+            print(f"{r['mode']:<12}{r['workers']:>8}{r['rps']:>10.1f}{r['errors']:>8}"
+                  f"{r['rss_per_worker_mb']:>15.0f}{r['model_server_rss_mb']:>11.0f}{r['total_rss_mb']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+# Submit the severity pass alongside the filter pass instead of after it
+CASCADE_SPECULATIVE = os.getenv("CASCADE_SPECULATIVE", "0") == "1"
+# Only speculate while recent traffic is almost always accepted by the filter
+CASCADE_SPECULATE_MIN_ACCEPT_RATE = float(os.getenv("CASCADE_SPECULATE_MIN_ACCEPT_RATE", "0.9"))
+# Weight of the newest image in the running acceptance rate
+CASCADE_ACCEPT_RATE_ALPHA = 0.05
+
+
+class CascadeScheduler:
+    """
+    Early-exit scheduling between the filter and severity batchers.
+
+    Every image goes through the batched MobileNetV2 filter queue; only images
+    with p_foot >= FOOT_ACCEPT_THRESHOLD are forwarded to the separate ResNet50
+    severity queue, so a rejected "random" photo costs one filter pass.
+
+    With speculation enabled, and while the running acceptance rate says the
+    filter is near-certain to accept, the severity request is queued at the same
+    time as the filter request so both batches run concurrently. If the filter
+    then rejects the image, the queued severity request is cancelled before it
+    reaches the model (or its result is discarded if it already ran).
+    """
+
+    def __init__(self, severity_batcher, speculative: bool = CASCADE_SPECULATIVE,
+                 min_accept_rate: float = CASCADE_SPECULATE_MIN_ACCEPT_RATE):
+        self.severity_batcher = severity_batcher
+        self.speculative = speculative
+        self.min_accept_rate = min_accept_rate
+
+        self._lock = threading.Lock()
+        self._accept_rate = 0.0
+        self._images = 0
+        self._rejected = 0
+        self._speculated = 0
+        self._speculation_used = 0
+        self._speculation_cancelled = 0
+        self._speculation_wasted = 0
+
+    def should_speculate(self) -> bool:
+        return self.speculative and self._accept_rate >= self.min_accept_rate
+
+    def speculate(self, x_severity):
+        """Queue a severity pass before the filter decision. Returns its Future."""
+        with self._lock:
+            self._speculated += 1
+        return self.severity_batcher.submit(x_severity)
+
+    def record_filter(self, accepted: bool, speculative=None):
+        """Record one filter decision and settle any speculative severity request."""
+        with self._lock:
+            self._images += 1
+            self._accept_rate += CASCADE_ACCEPT_RATE_ALPHA * ((1.0 if accepted else 0.0) - self._accept_rate)
+            if not accepted:
+                self._rejected += 1
+
+            if speculative is None:
+                return
+            if accepted:
+                self._speculation_used += 1
+            elif speculative.cancel():
+                self._speculation_cancelled += 1
+            else:
+                self._speculation_wasted += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            # Rejected images that never reached the severity model
+            skipped = self._rejected - self._speculation_wasted
+            avg_batch = 0.0
+            if hasattr(self.severity_batcher, "stats"):
+                avg_batch = self.severity_batcher.stats().get("avg_batch_size", 0.0)
+            return {
+                "images": self._images,
+                "rejected": self._rejected,
+                "rejection_ratio": round(self._rejected / self._images, 4) if self._images else 0.0,
+                "severity_passes_skipped": skipped,
+                "severity_batches_saved": round(skipped / avg_batch, 2) if avg_batch else float(skipped),
+                "speculative": self.speculative,
+                "accept_rate": round(self._accept_rate, 4),
+                "speculated": self._speculated,
+                "speculation_used": self._speculation_used,
+                "speculation_cancelled": self._speculation_cancelled,
+                "speculation_wasted": self._speculation_wasted,
+            }
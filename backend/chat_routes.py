@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import hashlib
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.orm import Session
 
 from database import get_db
-from models_db import Chat, Message
+from models_db import Chat, Message, Prediction
 from schemas_chat import (
     CreateChatResponse,
     ChatHistoryItem,
@@ -10,11 +17,130 @@ from schemas_chat import (
     ChatWithMessagesResponse,
 )
 from auth_routes import get_current_user
+from prompt_builder import prompt_builder
 from models_db import User
 
+load_dotenv()
+
+# -------------------- Config --------------------
+# Messages returned when a chat is opened; older ones come page by page
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "50"))
+MESSAGES_PAGE_MAX = int(os.getenv("MESSAGES_PAGE_MAX", "200"))
+# Chats per page of the sidebar history
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "30"))
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "100"))
+HISTORY_PREVIEW_CHARS = int(os.getenv("HISTORY_PREVIEW_CHARS", "80"))
+
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def message_page(db: Session, chat_id: int, limit: int, before: str = None):
+    """
+    Newest `limit` messages of a chat older than the `before` cursor, walking
+    the (chat_id, created_at, id) index backwards. Returns (messages oldest
+    first, cursor for the next older page or None).
+    """
+    query = db.query(Message).filter(Message.chat_id == chat_id)
+    if before:
+        created_at, message_id = decode_cursor(before)
+        query = query.filter(tuple_(Message.created_at, Message.id) < (created_at, message_id))
+
+    rows = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, (encode_cursor(rows[0].created_at, rows[0].id) if has_more else None)
+
+
+def history_page(db: Session, user_id: int, limit: int, before: str = None):
+    """
+    One page of a user's chats, newest first, as plain rows: only the listed
+    columns plus the last message preview and latest severity, each a
+    correlated subquery served by its (chat_id, created_at, id) index.
+    Returns (items, cursor for the next page or None).
+    """
+    last_message = (
+        select(func.substr(Message.content, 1, HISTORY_PREVIEW_CHARS))
+        .where(Message.chat_id == Chat.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+    latest_severity = (
+        select(Prediction.severity)
+        .where(Prediction.chat_id == Chat.id, Prediction.severity.isnot(None))
+        .order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        .limit(1)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+
+    query = db.query(
+        Chat.id, Chat.title, Chat.created_at,
+        last_message.label("last_message"),
+        latest_severity.label("latest_severity"),
+    ).filter(Chat.user_id == user_id)
+    if before:
+        created_at, chat_id = decode_cursor(before)
+        query = query.filter(tuple_(Chat.created_at, Chat.id) < (created_at, chat_id))
+
+    rows = query.order_by(Chat.created_at.desc(), Chat.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [
+        {
+            "chat_id": r.id,
+            "title": r.title,
+            "created_at": r.created_at,
+            "last_message": r.last_message,
+            "latest_severity": r.latest_severity,
+        }
+        for r in rows
+    ]
+    return items, (encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None)
+
+
+def history_etag(db: Session, user_id: int, limit: int, before: str = None) -> str:
+    """
+    ETag for a history page from one aggregate query. Chats are only ever
+    added or deleted and messages / predictions only appended, so the count
+    and highest ids change whenever anything shown in the list does.
+    """
+    user_chats = select(Chat.id).where(Chat.user_id == user_id)
+    version = db.execute(select(
+        select(func.count(Chat.id)).where(Chat.user_id == user_id).scalar_subquery(),
+        select(func.max(Chat.id)).where(Chat.user_id == user_id).scalar_subquery(),
+        select(func.max(Message.id)).where(Message.chat_id.in_(user_chats)).scalar_subquery(),
+        select(func.max(Prediction.id)).where(Prediction.chat_id.in_(user_chats)).scalar_subquery(),
+    )).one()
+    raw = f"{user_id}:{tuple(version)}:{limit}:{before}:{HISTORY_PREVIEW_CHARS}"
+    return '"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # Weak comparison, as If-None-Match requires
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
 @router.post("/create", response_model=CreateChatResponse)
 def create_chat(
     db: Session = Depends(get_db),
@@ -34,29 +160,37 @@ def create_chat(
 
 @router.get("/history", response_model=list[ChatHistoryItem])
 def get_chat_history(
+    request: Request,
+    response: Response,
+    before: str = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    chats = (
-        db.query(Chat)
-        .filter(Chat.user_id == current_user.id)
-        .order_by(Chat.created_at.desc())
-        .all()
-    )
+    if before:
+        decode_cursor(before)  # 400 on a bad cursor before anything else
 
-    return [
-        {
-            "chat_id": c.id,
-            "title": c.title,
-            "created_at": c.created_at
-        }
-        for c in chats
-    ]
+    # Revalidate on every use, but only the owner's browser may keep a copy
+    headers = {
+        "ETag": history_etag(db, current_user.id, limit, before),
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    items, next_cursor = history_page(db, current_user.id, limit, before)
+
+    response.headers.update(headers)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 
 @router.get("/{chat_id}", response_model=ChatWithMessagesResponse)
 def get_chat_by_id(
     chat_id: int,
+    before: str = Query(None, description="next_cursor of the previous page, to load older messages"),
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_PAGE_MAX),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -64,11 +198,15 @@ def get_chat_by_id(
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
+    messages, next_cursor = message_page(db, chat.id, limit, before)
+
     return {
         "chat_id": chat.id,
         "title": chat.title,
         "created_at": chat.created_at,
-        "messages": chat.messages
+        "messages": messages,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
     }
 
 
@@ -119,6 +257,8 @@ def delete_chat(
 
     db.delete(chat)
     db.commit()
+    # SQLite can hand the id to a new chat; it must not inherit this one's cached history
+    prompt_builder.forget(chat_id)
 
     return {
         "status": "success",
@@ -0,0 +1,155 @@
+"""
+Build quantized TFLite artifacts for the filter and severity models.
+
+    python convert_tflite.py --quantization dynamic
+    python convert_tflite.py --quantization int8 --calibration-dir ./calibration_images
+
+Dynamic-range quantization stores weights as int8 and needs no data. Full int8
+quantization also quantizes activations, so it needs a folder of representative
+foot / non-foot photos to calibrate ranges. After converting, both models are
+compared against the float Keras model on the calibration images and a parity
+report is written next to the artifacts.
+
+Switch the server over with INFER_BACKEND=tflite and TFLITE_QUANTIZATION=<mode>.
+"""
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from predict_service import (
+    preprocess_image,
+    get_filter_probs,
+    get_severity_probs,
+    filter_normalize,
+    severity_normalize,
+    FILTER_MODEL_PATH,
+    SEVERITY_MODEL_PATH,
+    FOOT_ACCEPT_THRESHOLD,
+)
+from inference_backends import TFLiteModel, tflite_path, TFLITE_MODEL_DIR, SUPPORTED_QUANTIZATIONS
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+MODELS = {
+    "filter": (FILTER_MODEL_PATH, filter_normalize),
+    "severity": (SEVERITY_MODEL_PATH, severity_normalize),
+}
+
+
+def load_calibration_images(folder: str, limit: int):
+    """Preprocess up to `limit` images from folder into raw (1, 224, 224, 3) float32 arrays."""
+    paths = [
+        os.path.join(root, f)
+        for root, _, files in os.walk(folder)
+        for f in files
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    random.Random(0).shuffle(paths)
+
+    images = []
+    for path in paths[:limit]:
+        try:
+            with Image.open(path) as img:
+                images.append(preprocess_image(img))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    return images
+
+
+def convert(model, quantization: str, calibration, preprocess):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == "int8":
+        if not calibration:
+            raise SystemExit("int8 quantization needs --calibration-dir with at least one image")
+
+        def representative_dataset():
+            for x in calibration:
+                yield [preprocess(x)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Keep float input/output so the serving code doesn't change between backends
+
+    return converter.convert()
+
+
+def parity_report(name, keras_model, tflite_model, calibration, preprocess):
+    """Compare the quantized model's probabilities and decisions against the float model."""
+    if not calibration:
+        return {"images": 0}
+
+    agree = 0
+    diffs = []
+
+    for x in calibration:
+        xp = preprocess(x)
+
+        if name == "filter":
+            ref = np.array(get_filter_probs(keras_model, xp))
+            got = np.array(get_filter_probs(tflite_model, xp))
+            same = (ref[0] >= FOOT_ACCEPT_THRESHOLD) == (got[0] >= FOOT_ACCEPT_THRESHOLD)
+        else:
+            ref = get_severity_probs(keras_model, xp)
+            got = get_severity_probs(tflite_model, xp)
+            same = int(np.argmax(ref)) == int(np.argmax(got))
+
+        agree += int(same)
+        diffs.append(float(np.max(np.abs(ref - got))))
+
+    return {
+        "images": len(calibration),
+        "decision_agreement": round(agree / len(calibration), 4),
+        "mean_abs_prob_diff": round(float(np.mean(diffs)), 6),
+        "max_abs_prob_diff": round(max(diffs), 6),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quantization", choices=SUPPORTED_QUANTIZATIONS, default="dynamic")
+    parser.add_argument("--calibration-dir", help="Folder of sample images (required for int8)")
+    parser.add_argument("--calibration-limit", type=int, default=200)
+    args = parser.parse_args()
+
+    calibration = []
+    if args.calibration_dir:
+        calibration = load_calibration_images(args.calibration_dir, args.calibration_limit)
+        print(f"Loaded {len(calibration)} calibration images")
+
+    os.makedirs(TFLITE_MODEL_DIR, exist_ok=True)
+    report = {"quantization": args.quantization, "models": {}}
+
+    for name, (keras_path, preprocess) in MODELS.items():
+        print(f"Converting {name} model ({keras_path}) with {args.quantization} quantization...")
+        keras_model = tf.keras.models.load_model(keras_path, compile=False)
+
+        flatbuffer = convert(keras_model, args.quantization, calibration, preprocess)
+        out_path = tflite_path(keras_path, args.quantization)
+        with open(out_path, "wb") as f:
+            f.write(flatbuffer)
+
+        parity = parity_report(name, keras_model, TFLiteModel(out_path, name), calibration, preprocess)
+        report["models"][name] = {
+            "source": keras_path,
+            "artifact": out_path,
+            "source_bytes": os.path.getsize(keras_path),
+            "artifact_bytes": len(flatbuffer),
+            "parity": parity,
+        }
+        print(f"✅ {out_path} ({len(flatbuffer) / 1e6:.1f} MB) parity: {parity}")
+
+    report_path = os.path.join(TFLITE_MODEL_DIR, f"parity_{args.quantization}.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Parity report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Export the filter and severity models into memory-mappable float flatbuffers.
+
+    python export_models.py
+    python export_models.py --check     # verify existing artifacts against the manifest
+
+Loading the .h5 checkpoints parses HDF5 and copies every weight into freshly
+built Keras layers on each boot. The exported TFLite flatbuffers keep float32
+weights (no quantization, same predictions up to float rounding) and are
+mmapped by the interpreter, so startup only maps the file, pages are read on
+first use, and processes on one host share them through the OS page cache.
+
+A manifest.json next to the artifacts records the sha256 and size of every
+artifact plus the size and mtime of the .h5 it came from. With
+MODEL_EXPORT_PREFER=1 the server serves an export only while it still
+matches its source.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from predict_service import IMG_SIZE, FILTER_MODEL_PATH, SEVERITY_MODEL_PATH
+from inference_backends import (
+    TFLiteModel,
+    MODEL_EXPORT_DIR,
+    EXPORT_MANIFEST,
+    exported_artifact,
+    file_sha256,
+    read_export_manifest,
+)
+
+MODELS = {
+    "filter": FILTER_MODEL_PATH,
+    "severity": SEVERITY_MODEL_PATH,
+}
+
+MANIFEST_FORMAT = 1
+
+
+def convert_float(model) -> bytes:
+    # No optimizations: weights stay float32 so outputs match the Keras model
+    return tf.lite.TFLiteConverter.from_keras_model(model).convert()
+
+
+def max_output_diff(keras_model, artifact: str, samples: int = 4) -> float:
+    x = np.random.default_rng(0).uniform(-1.0, 1.0, (samples, IMG_SIZE, IMG_SIZE, 3)).astype(np.float32)
+    ref = keras_model(x, training=False).numpy()
+    got = TFLiteModel(artifact).predict(x)
+    return float(np.max(np.abs(ref - got)))
+
+
+def export(export_dir: str):
+    os.makedirs(export_dir, exist_ok=True)
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "tensorflow": tf.__version__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "models": {},
+    }
+
+    for name, keras_path in MODELS.items():
+        print(f"Exporting {name} model ({keras_path})...")
+        started = time.perf_counter()
+        keras_model = tf.keras.models.load_model(keras_path, compile=False)
+        load_seconds = time.perf_counter() - started
+
+        artifact_name = os.path.splitext(os.path.basename(keras_path))[0] + ".tflite"
+        artifact = os.path.join(export_dir, artifact_name)
+        flatbuffer = convert_float(keras_model)
+        with open(artifact, "wb") as f:
+            f.write(flatbuffer)
+
+        started = time.perf_counter()
+        TFLiteModel(artifact, name)
+        mmap_seconds = time.perf_counter() - started
+
+        st = os.stat(keras_path)
+        diff = max_output_diff(keras_model, artifact)
+        manifest["models"][name] = {
+            "source": os.path.basename(keras_path),
+            "source_bytes": st.st_size,
+            "source_mtime": int(st.st_mtime),
+            "source_sha256": file_sha256(keras_path),
+            "artifact": artifact_name,
+            "bytes": len(flatbuffer),
+            "sha256": file_sha256(artifact),
+            "max_abs_output_diff": round(diff, 8),
+        }
+        print(f"✅ {artifact} ({len(flatbuffer) / 1e6:.1f} MB) "
+              f"h5 load {load_seconds:.2f}s -> flatbuffer load {mmap_seconds:.3f}s, max output diff {diff:.2e}")
+
+    manifest_path = os.path.join(export_dir, EXPORT_MANIFEST)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Manifest written to {manifest_path}")
+    print("Set MODEL_EXPORT_PREFER=1 to serve these instead of the .h5 files.")
+
+
+def check(export_dir: str) -> bool:
+    manifest = read_export_manifest(export_dir)
+    if not manifest:
+        print(f"No {EXPORT_MANIFEST} in {export_dir}. Run: python export_models.py")
+        return False
+
+    ok = True
+    for name, keras_path in MODELS.items():
+        artifact = exported_artifact(keras_path, export_dir, verify=True)
+        ok = ok and artifact is not None
+        print(f"{name}: {'OK ' + artifact if artifact else 'missing or stale'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--export-dir", default=MODEL_EXPORT_DIR)
+    parser.add_argument("--check", action="store_true", help="Only verify artifacts against the manifest")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check(args.export_dir) else 1)
+    export(args.export_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,102 @@
 import os
+import time
+
+import httpx
 from dotenv import load_dotenv
-from groq import Groq
+from groq import Groq, AsyncGroq
+
+from metrics import stage_timer, observe_stage, record_upstream_error
 
 load_dotenv()
 
+DEFAULT_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+
+# -------------------- Config --------------------
+# Pool shared by every async Groq call in this process
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "10"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "30"))
+
+TEMPERATURE = 0.4
+MAX_TOKENS = 500
+
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-DEFAULT_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+async_client = AsyncGroq(
+    api_key=os.getenv("GROQ_API_KEY"),
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS, max_keepalive_connections=GROQ_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(GROQ_TIMEOUT, connect=5.0),
+    ),
+)
+
+
+def _messages(system_prompt: str, user_prompt: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
 
 def groq_chat(system_prompt: str, user_prompt: str, model: str = DEFAULT_MODEL) -> str:
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.4,
-        max_tokens=500,
-    )
-    return response.choices[0].message.content
\ No newline at end of file
+    try:
+        with stage_timer("groq"):
+            response = client.chat.completions.create(
+                model=model,
+                messages=_messages(system_prompt, user_prompt),
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+            )
+    except Exception:
+        record_upstream_error("groq")
+        raise
+    return response.choices[0].message.content
+
+
+async def groq_chat_async(system_prompt: str, user_prompt: str, model: str = DEFAULT_MODEL) -> str:
+    """groq_chat for async routes: waits on the pooled connection without holding a thread."""
+    try:
+        with stage_timer("groq"):
+            response = await async_client.chat.completions.create(
+                model=model,
+                messages=_messages(system_prompt, user_prompt),
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+            )
+    except Exception:
+        record_upstream_error("groq")
+        raise
+    return response.choices[0].message.content
+
+
+async def groq_chat_stream(system_prompt: str, user_prompt: str, model: str = DEFAULT_MODEL):
+    """Yield the answer in text deltas as Groq generates them."""
+    started = time.perf_counter()
+    first = True
+    try:
+        stream = await async_client.chat.completions.create(
+            model=model,
+            messages=_messages(system_prompt, user_prompt),
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            stream=True,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first:
+                observe_stage("groq_first_token", time.perf_counter() - started)
+                first = False
+            yield delta
+    except Exception:
+        record_upstream_error("groq")
+        raise
+    finally:
+        observe_stage("groq", time.perf_counter() - started)
+
+
+async def close_async_client():
+    await async_client.close()
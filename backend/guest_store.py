@@ -1,22 +1,507 @@
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from uuid import uuid4
+
+from dotenv import load_dotenv
+from sqlalchemy import Column, Float, LargeBinary, MetaData, String, Table, create_engine, delete, select
+
 from dfu_state import default_patient_state
 
-# In-memory volatile storage
-GUEST_SESSIONS = {}
+load_dotenv()
+
+# -------------------- Config --------------------
+# Sessions idle for longer than this are dropped
+GUEST_SESSION_TTL_SECONDS = float(os.getenv("GUEST_SESSION_TTL_SECONDS", str(2 * 3600)))
+# Hard caps; past either one the least recently used sessions are evicted
+GUEST_MAX_SESSIONS = int(os.getenv("GUEST_MAX_SESSIONS", "10000"))
+GUEST_MAX_BYTES = int(os.getenv("GUEST_MAX_BYTES", str(64 * 1024 * 1024)))
+# Only the most recent messages of a session are kept
+GUEST_MAX_MESSAGES = int(os.getenv("GUEST_MAX_MESSAGES", "50"))
+GUEST_SWEEP_INTERVAL = float(os.getenv("GUEST_SWEEP_INTERVAL", "60"))
+
+# memory: sessions live in this process (default, single worker)
+# sql: shared table so any worker / node can serve any guest
+GUEST_STORE_BACKEND = os.getenv("GUEST_STORE_BACKEND", "memory")
+# Database for the sql backend; empty = DATABASE_URL (sqlite:///guest_sessions.db works on one host)
+GUEST_STORE_URL = os.getenv("GUEST_STORE_URL", "")
+# sql backend: how long a worker trusts its local copy before re-reading the row
+GUEST_LOCAL_CACHE_SECONDS = float(os.getenv("GUEST_LOCAL_CACHE_SECONDS", "1"))
+GUEST_LOCAL_CACHE_SESSIONS = int(os.getenv("GUEST_LOCAL_CACHE_SESSIONS", "1000"))
+# sql backend: changed sessions are written together every interval, or sooner once this many are waiting
+GUEST_FLUSH_INTERVAL = float(os.getenv("GUEST_FLUSH_INTERVAL", "0.1"))
+GUEST_FLUSH_BATCH = int(os.getenv("GUEST_FLUSH_BATCH", "200"))
+
+# Per-object overhead of a message dict and its strings, beyond the text itself
+_MESSAGE_OVERHEAD = sys.getsizeof({"role": "", "content": ""}) + 2 * sys.getsizeof("")
+
+
+def approx_session_bytes(session: dict) -> int:
+    """Rough in-memory size of one session: state values plus message text."""
+    state = session["state"]
+    size = sys.getsizeof(session) + sys.getsizeof(state)
+    size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in state.items())
+    size += sys.getsizeof(session["messages"])
+    size += sum(_MESSAGE_OVERHEAD + len(m["content"]) + len(m["role"]) for m in session["messages"])
+    return size
+
+
+def new_session() -> dict:
+    return {"state": default_patient_state(), "messages": []}
+
+
+def encode_session(session: dict) -> bytes:
+    """
+    Compact form for the shared backend: only state fields that differ from
+    the defaults, messages as [role, content] pairs, zlib-compressed JSON.
+    """
+    defaults = default_patient_state()
+    state = {k: v for k, v in session["state"].items() if k not in defaults or defaults[k] != v}
+    messages = [[m["role"], m["content"]] for m in session["messages"]]
+    return zlib.compress(json.dumps({"s": state, "m": messages}, separators=(",", ":")).encode())
+
+
+def decode_session(data: bytes) -> dict:
+    payload = json.loads(zlib.decompress(data))
+    state = default_patient_state()
+    state.update(payload["s"])
+    return {"state": state, "messages": [{"role": r, "content": c} for r, c in payload["m"]]}
+
+
+class GuestSessionStore:
+    """
+    In-memory guest sessions with idle expiry and LRU eviction.
+
+    Each access moves a session to the most-recent end. get() and save()
+    re-measure it, so the byte cap applies as soon as a turn adds messages.
+    Expired sessions are dropped on access and by a background sweeper.
+    """
+
+    def __init__(self, ttl: float = GUEST_SESSION_TTL_SECONDS, max_sessions: int = GUEST_MAX_SESSIONS,
+                 max_bytes: int = GUEST_MAX_BYTES, max_messages: int = GUEST_MAX_MESSAGES):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+
+        self._sessions = OrderedDict()  # session_id -> {"session", "last_seen", "bytes"}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = {"sessions": 0, "bytes": 0}
+
+        self._stop = threading.Event()
+        self._sweeper = None
+
+    # -------------------- Internals --------------------
+    def _drop(self, session_id):
+        entry = self._sessions.pop(session_id)
+        self._bytes -= entry["bytes"]
+
+    def _measure(self, entry):
+        new_bytes = approx_session_bytes(entry["session"])
+        self._bytes += new_bytes - entry["bytes"]
+        entry["bytes"] = new_bytes
+
+    def _evict(self, keep=None):
+        """Drop least recently used sessions until both caps hold (never `keep`)."""
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+            self.evicted["sessions"] += 1
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+            self.evicted["bytes"] += 1
+
+    def trim_messages(self, session: dict):
+        excess = len(session["messages"]) - self.max_messages
+        if excess > 0:
+            del session["messages"][:excess]
+
+    # -------------------- Sessions --------------------
+    def create(self) -> str:
+        session_id = str(uuid4())
+        entry = {
+            "session": new_session(),
+            "last_seen": time.monotonic(),
+            "bytes": 0,
+        }
+        with self._lock:
+            self._sessions[session_id] = entry
+            self._measure(entry)
+            self.created += 1
+            self._evict(keep=session_id)
+        return session_id
+
+    def get(self, session_id: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if now - entry["last_seen"] > self.ttl:
+                self._drop(session_id)
+                self.expired += 1
+                return None
+
+            entry["last_seen"] = now
+            self._sessions.move_to_end(session_id)
+            self.trim_messages(entry["session"])
+            self._measure(entry)
+            self._evict(keep=session_id)
+            return entry["session"]
+
+    def save(self, session_id: str, session: dict):
+        # Sessions are edited in place, so there is nothing to write back; only the size changed
+        self.trim_messages(session)
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry["session"] is not session:
+                return  # expired, evicted or deleted during the turn
+            self._measure(entry)
+            self._evict(keep=session_id)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+
+    def sweep(self) -> int:
+        """Drop every expired session; returns how many were dropped."""
+        cutoff = time.monotonic() - self.ttl
+        dropped = 0
+        with self._lock:
+            # Oldest access first, so stop at the first live one
+            for session_id, entry in list(self._sessions.items()):
+                if entry["last_seen"] >= cutoff:
+                    break
+                self._drop(session_id)
+                dropped += 1
+            self.expired += dropped
+        return dropped
+
+    # -------------------- Sweeper --------------------
+    def _sweep_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                dropped = self.sweep()
+                if dropped:
+                    print(f"[GUEST] Expired {dropped} idle guest sessions")
+            except Exception as e:
+                print(f"[GUEST] Sweep failed: {e}")
+
+    def start(self, interval: float = GUEST_SWEEP_INTERVAL):
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, args=(interval,), name="guest-sweeper",
+                                         daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "approx_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "max_messages": self.max_messages,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted_for_count": self.evicted["sessions"],
+                "evicted_for_bytes": self.evicted["bytes"],
+            }
+
+
+class SharedGuestStore:
+    """
+    Guest sessions in a shared table, so a session created on one worker
+    can be served by any other without sticky sessions.
+
+    Reads go through a small local cache that is trusted for
+    GUEST_LOCAL_CACHE_SECONDS. That is well under the time a person takes to
+    send the next message, so a request routed to another worker re-reads
+    the row. save() only marks a session dirty; a background thread writes
+    all dirty sessions in one upsert every GUEST_FLUSH_INTERVAL. New sessions
+    are inserted right away, because the client's next request may land
+    anywhere. On PostgreSQL the table is UNLOGGED: guest chats are
+    disposable and skipping the WAL makes writes cheaper.
+    """
+
+    def __init__(self, engine, ttl: float = GUEST_SESSION_TTL_SECONDS, max_messages: int = GUEST_MAX_MESSAGES,
+                 cache_seconds: float = GUEST_LOCAL_CACHE_SECONDS, cache_sessions: int = GUEST_LOCAL_CACHE_SESSIONS,
+                 flush_interval: float = GUEST_FLUSH_INTERVAL, flush_batch: int = GUEST_FLUSH_BATCH):
+        self.engine = engine
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.cache_seconds = cache_seconds
+        self.cache_sessions = cache_sessions
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        prefixes = ["UNLOGGED"] if engine.dialect.name == "postgresql" else []
+        self.table = Table(
+            "guest_sessions", MetaData(),
+            Column("id", String(36), primary_key=True),
+            Column("data", LargeBinary, nullable=False),
+            Column("updated_at", Float, nullable=False, index=True),  # unix time, for expiry
+            prefixes=prefixes,
+        )
+        self._table_ready = False
+
+        self._cache = OrderedDict()  # session_id -> {"session", "loaded"}
+        self._dirty = {}  # session_id -> session awaiting write-back
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+
+        self.cache_hits = 0
+        self.reads = 0
+        self.expired = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.flush_errors = 0
+
+    # -------------------- Storage --------------------
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.table.create(self.engine, checkfirst=True)
+            self._table_ready = True
+
+    def _upsert(self, rows):
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise RuntimeError(f"Shared guest store does not support {dialect}")
+
+        stmt = insert(self.table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.table.c.id],
+            set_={"data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt, rows)
+
+    def _cache_put(self, session_id, session):
+        self._cache[session_id] = {"session": session, "loaded": time.monotonic()}
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_sessions:
+            oldest = next(iter(self._cache))
+            if oldest in self._dirty:
+                break  # written on the next flush, then evictable
+            self._cache.pop(oldest)
+
+    def trim_messages(self, session: dict):
+        excess = len(session["messages"]) - self.max_messages
+        if excess > 0:
+            del session["messages"][:excess]
+
+    # -------------------- Sessions --------------------
+    def create(self) -> str:
+        self._ensure_table()
+        session_id = str(uuid4())
+        session = new_session()
+        data = encode_session(session)
+        self._upsert([{"id": session_id, "data": data, "updated_at": time.time()}])
+        with self._lock:
+            self._cache_put(session_id, session)
+            self.rows_written += 1
+            self.bytes_written += len(data)
+        return session_id
+
+    def get(self, session_id: str):
+        self._ensure_table()
+        with self._lock:
+            entry = self._cache.get(session_id)
+            # A dirty session is newer than the row, whatever its age
+            if entry is not None and (session_id in self._dirty
+                                      or time.monotonic() - entry["loaded"] < self.cache_seconds):
+                self._cache.move_to_end(session_id)
+                self.cache_hits += 1
+                return entry["session"]
+
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data, self.table.c.updated_at).where(self.table.c.id == session_id)
+            ).first()
+
+        with self._lock:
+            self.reads += 1
+            if row is None:
+                self._cache.pop(session_id, None)
+                return None
+            if time.time() - row.updated_at > self.ttl:
+                self._cache.pop(session_id, None)
+                self.expired += 1
+                return None
+            session = decode_session(row.data)
+            self._cache_put(session_id, session)
+            return session
+
+    def save(self, session_id: str, session: dict):
+        self.trim_messages(session)
+        with self._lock:
+            self._dirty[session_id] = session
+            self._cache_put(session_id, session)
+            pending = len(self._dirty)
+        if pending >= self.flush_batch:
+            self._wake.set()
+
+    def delete(self, session_id: str):
+        self._ensure_table()
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._dirty.pop(session_id, None)
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.id == session_id))
+
+    def flush(self) -> int:
+        """Write every dirty session in one upsert; returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+            if not batch:
+                return 0
+
+            now = time.time()
+            rows = [{"id": sid, "data": encode_session(session), "updated_at": now} for sid, session in batch.items()]
+            try:
+                self._upsert(rows)
+            except Exception:
+                with self._lock:
+                    # Retry on the next flush unless a newer save already queued it
+                    for sid, session in batch.items():
+                        self._dirty.setdefault(sid, session)
+                    self.flush_errors += 1
+                raise
+
+            with self._lock:
+                self.flushes += 1
+                self.rows_written += len(rows)
+                self.bytes_written += sum(len(r["data"]) for r in rows)
+            return len(rows)
+
+    def sweep(self) -> int:
+        self._ensure_table()
+        with self.engine.begin() as conn:
+            result = conn.execute(delete(self.table).where(self.table.c.updated_at < time.time() - self.ttl))
+        return result.rowcount or 0
+
+    # -------------------- Background write-back --------------------
+    def _run(self, sweep_interval):
+        next_sweep = time.monotonic() + sweep_interval
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + sweep_interval
+                    dropped = self.sweep()
+                    if dropped:
+                        print(f"[GUEST] Expired {dropped} idle guest sessions")
+            except Exception as e:
+                print(f"[GUEST] Write-back failed: {e}")
+
+    def start(self, interval: float = GUEST_SWEEP_INTERVAL):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._ensure_table()
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, args=(interval,), name="guest-writeback", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+            self._worker = None
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[GUEST] Final write-back failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = [entry["session"] for entry in self._cache.values()]
+            stats = {
+                "backend": "sql",
+                "sessions": len(sessions),  # cached locally
+                "approx_bytes": 0,
+                "ttl_seconds": self.ttl,
+                "max_messages": self.max_messages,
+                "dirty": len(self._dirty),
+                "cache_hits": self.cache_hits,
+                "reads": self.reads,
+                "expired": self.expired,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "avg_row_bytes": round(self.bytes_written / self.rows_written) if self.rows_written else 0,
+                "flush_errors": self.flush_errors,
+            }
+        stats["approx_bytes"] = sum(approx_session_bytes(s) for s in sessions)
+        return stats
+
+
+def make_guest_store():
+    if GUEST_STORE_BACKEND == "memory":
+        return GuestSessionStore()
+    if GUEST_STORE_BACKEND == "sql":
+        if GUEST_STORE_URL:
+            engine = create_engine(GUEST_STORE_URL)
+        else:
+            from database import engine
+        return SharedGuestStore(engine)
+    raise ValueError(f"Unknown GUEST_STORE_BACKEND {GUEST_STORE_BACKEND!r} (expected memory or sql)")
+
+
+guest_store = make_guest_store()
 
 
 def create_guest_session():
-    session_id = str(uuid4())
-    GUEST_SESSIONS[session_id] = {
-        "state": default_patient_state(),
-        "messages": []
-    }
-    return session_id
+    return guest_store.create()
 
 
 def get_guest_session(session_id: str):
-    return GUEST_SESSIONS.get(session_id)
+    return guest_store.get(session_id)
+
+
+def save_guest_session(session_id: str, session: dict):
+    """Call after changing a session; the shared backend writes it back."""
+    guest_store.save(session_id, session)
 
 
 def delete_guest_session(session_id: str):
-    GUEST_SESSIONS.pop(session_id, None)
\ No newline at end of file
+    guest_store.delete(session_id)
+
+
+def append_guest_message(session: dict, role: str, content: str):
+    """Add a message, keeping only the newest GUEST_MAX_MESSAGES."""
+    session["messages"].append({"role": role, "content": content})
+    guest_store.trim_messages(session)
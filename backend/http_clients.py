@@ -0,0 +1,225 @@
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+# One pool for every outbound call to Google, shared for the app's lifetime
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+# HTTP/2 multiplexes concurrent requests to one host over a single connection;
+# needs the h2 package (pip install "httpx[http2]"), otherwise HTTP/1.1 keep-alive
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1" and importlib.util.find_spec("h2") is not None
+# Retries for connection errors, 429 and 5xx, with full-jitter exponential backoff
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))
+# A host is skipped for CIRCUIT_RESET_SECONDS after this many failures in a row
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker: closed -> open after `threshold` consecutive failures;
+    after `reset_after` seconds one trial request is let through (half-open)
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_after: float = CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release(self):
+        """The trial request ended without an outcome (cancelled); let another one through."""
+        with self._lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial_running:
+                    self.times_opened += 1
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class OutboundHTTP:
+    """
+    App-lifetime httpx.AsyncClient for calls to external APIs: pooled
+    keep-alive connections (HTTP/2 when available), retries with jitter and
+    a circuit breaker per host. Created and closed from the FastAPI lifespan;
+    used before start() (scripts), it creates its client on first use.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._breakers = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.retries = 0
+        self.short_circuited = 0
+
+    def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_ENABLED,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=5.0),
+            )
+            print(f"[HTTP] Outbound client ready (http2={HTTP2_ENABLED}, max_connections={HTTP_MAX_CONNECTIONS})")
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker()
+            return breaker
+
+    def _track(self, host, delta):
+        with self._lock:
+            self._in_flight[host] = self._in_flight.get(host, 0) + delta
+
+    async def request(self, method: str, url: str, upstream: str, retries: int = HTTP_RETRIES, **kwargs) -> httpx.Response:
+        """
+        Send a request through the shared pool. Connection errors, timeouts,
+        429 and 5xx are retried; the last response (or error) is returned
+        (or raised). Raises CircuitOpenError while the host is failing.
+        """
+        client = self.start()
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                with self._lock:
+                    self.short_circuited += 1
+                raise CircuitOpenError(f"{upstream}: circuit open for {host}")
+
+            # Every path from allow() must report an outcome or release the
+            # half-open trial slot, or the host stays short-circuited for good
+            outcome = None
+            try:
+                if attempt:
+                    with self._lock:
+                        self.retries += 1
+                    # Full jitter: spread retries from many requests over the backoff window
+                    await asyncio.sleep(random.uniform(0, HTTP_RETRY_BACKOFF * (2 ** (attempt - 1))))
+
+                with self._lock:
+                    self.requests += 1
+                self._track(host, 1)
+                try:
+                    response = await client.request(method, url, **kwargs)
+                finally:
+                    self._track(host, -1)
+                outcome = "failure" if response.status_code in RETRY_STATUSES else "success"
+            except httpx.TransportError:
+                outcome = "failure"
+                if attempt == retries:
+                    raise
+                continue
+            finally:
+                if outcome == "success":
+                    breaker.record_success()
+                elif outcome == "failure":
+                    breaker.record_failure()
+                else:
+                    # Cancelled (e.g. the caller's overall deadline ran out) or an
+                    # error that says nothing about the host's health
+                    breaker.release()
+
+            if outcome == "failure" and attempt < retries:
+                continue
+            return response
+
+    def pool_stats(self) -> dict:
+        """Connections in the pool by state, read from httpcore (not a public httpx API)."""
+        try:
+            connections = self._client._transport._pool.connections
+        except AttributeError:
+            return {"active": 0, "idle": 0}
+        idle = sum(1 for c in connections if c.is_idle())
+        return {"active": len(connections) - idle, "idle": idle}
+
+    def stats(self) -> dict:
+        pool = self.pool_stats()
+        with self._lock:
+            in_flight = {host: n for host, n in self._in_flight.items() if n}
+            breakers = {
+                host: {"state": b.state, "consecutive_failures": b.failures, "times_opened": b.times_opened}
+                for host, b in self._breakers.items()
+            }
+            return {
+                "started": self._client is not None,
+                "http2": HTTP2_ENABLED,
+                "max_connections": HTTP_MAX_CONNECTIONS,
+                "connections_active": pool["active"],
+                "connections_idle": pool["idle"],
+                "pool_utilisation": round(pool["active"] / HTTP_MAX_CONNECTIONS, 4) if HTTP_MAX_CONNECTIONS else 0.0,
+                "in_flight": in_flight,
+                "requests": self.requests,
+                "retries": self.retries,
+                "short_circuited": self.short_circuited,
+                "circuit_breakers": breakers,
+            }
+
+
+outbound_http = OutboundHTTP()
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from predict_service import ServingModel, IMG_SIZE, INFER_XLA
+from inference_executor import TF_INTRA_OP_THREADS
+from batch_inference import INFER_MAX_BATCH_SIZE
+
+load_dotenv()
+
+# -------------------- Config --------------------
+# "keras" serves the .h5 models through tf.function, "tflite" serves quantized flatbuffers
+INFER_BACKEND = os.getenv("INFER_BACKEND", "keras").lower()
+# Which converted artifact the tflite backend loads: "dynamic" or "int8"
+TFLITE_QUANTIZATION = os.getenv("TFLITE_QUANTIZATION", "dynamic").lower()
+TFLITE_MODEL_DIR = os.getenv("TFLITE_MODEL_DIR", "./models/tflite")
+# Batch sizes a TFLite model keeps an allocated interpreter for; other batches are split
+# into these, so tensors are never re-planned per call. The default, powers of two up to
+# INFER_MAX_BATCH_SIZE (1,2,4,8), runs any micro-batch in at most three invokes. Each size
+# costs a full interpreter (~230 MB for float ResNet50 with XNNPACK); "1" saves the memory
+# but runs every micro-batch one image at a time.
+TFLITE_BATCH_SIZES = sorted({
+    max(1, int(n)) for n in os.getenv("TFLITE_BATCH_SIZES", "").split(",") if n.strip()
+}) or sorted({2 ** i for i in range(INFER_MAX_BATCH_SIZE.bit_length())} | {INFER_MAX_BATCH_SIZE})
+
+# Float flatbuffers written by export_models.py
+MODEL_EXPORT_DIR = os.getenv("MODEL_EXPORT_DIR", "./models/export")
+# Opt-in: the keras backend then serves matching exports through TFLite. Cold starts
+# are much faster, but without XNNPACK (below) every prediction is slower than Keras.
+MODEL_EXPORT_PREFER = os.getenv("MODEL_EXPORT_PREFER", "0") == "1"
+# Hash the artifacts against the manifest on every boot (slower; size/mtime checks always run)
+MODEL_EXPORT_VERIFY = os.getenv("MODEL_EXPORT_VERIFY", "0") == "1"
+# XNNPACK repacks float weights into private memory, so every process holds its
+# own copy. Off by default: exports run straight from the mmapped file and the
+# page cache shares the weights; set to 1 for faster kernels at that memory cost.
+MODEL_EXPORT_XNNPACK = os.getenv("MODEL_EXPORT_XNNPACK", "0") == "1"
+
+EXPORT_MANIFEST = "manifest.json"
+
+SUPPORTED_BACKENDS = ("keras", "tflite")
+SUPPORTED_QUANTIZATIONS = ("dynamic", "int8")
+
+
+def tflite_path(keras_path: str, quantization: str = TFLITE_QUANTIZATION) -> str:
+    """./models/foo.h5 -> ./models/tflite/foo_<quantization>.tflite"""
+    stem = os.path.splitext(os.path.basename(keras_path))[0]
+    return os.path.join(TFLITE_MODEL_DIR, f"{stem}_{quantization}.tflite")
+
+
+class TFLiteModel:
+    """
+    TFLite interpreters with the same predict(x, verbose=0) call as a Keras model.
+
+    resize_tensor_input + allocate_tensors re-plans every tensor and the delegate
+    re-prepares on the next invoke, which the micro-batcher used to trigger
+    whenever its batch size changed. Instead one interpreter is allocated per
+    size in batch_sizes and a batch is split into those sizes, never padded.
+    Quantizes / dequantizes when the flatbuffer has integer inputs or outputs.
+    Interpreters are not thread-safe, so each has its own lock.
+    """
+
+    def __init__(self, model_path: str, name: str = "model", num_threads: int = TF_INTRA_OP_THREADS,
+                 default_delegates: bool = True, batch_sizes=TFLITE_BATCH_SIZES, engine: str = "tflite"):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        self.name = name
+        self.engine = engine
+        self.batch_sizes = sorted(set(batch_sizes) | {1})
+        # Each interpreter mmaps model_path, so weights are paged in lazily by the OS
+        kwargs = {}
+        if not default_delegates:
+            kwargs["experimental_op_resolver_type"] = tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+
+        self._slots = {}
+        for n in self.batch_sizes:
+            interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads, **kwargs)
+            interpreter.resize_tensor_input(interpreter.get_input_details()[0]["index"], [n, IMG_SIZE, IMG_SIZE, 3])
+            interpreter.allocate_tensors()
+            self._slots[n] = {
+                "interpreter": interpreter,
+                "input": interpreter.get_input_details()[0],
+                "output": interpreter.get_output_details()[0],
+                "lock": threading.Lock(),
+            }
+
+    def _invoke(self, x):
+        """One batch whose size is one of the allocated batch_sizes."""
+        slot = self._slots[x.shape[0]]
+        inp, outp = slot["input"], slot["output"]
+
+        in_dtype = inp["dtype"]
+        if in_dtype in (np.int8, np.uint8):
+            scale, zero_point = inp["quantization"]
+            info = np.iinfo(in_dtype)
+            x = np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(in_dtype)
+
+        with slot["lock"]:
+            slot["interpreter"].set_tensor(inp["index"], x)
+            slot["interpreter"].invoke()
+            out = slot["interpreter"].get_tensor(outp["index"])
+
+            if outp["dtype"] in (np.int8, np.uint8):
+                scale, zero_point = outp["quantization"]
+                out = (out.astype(np.float32) - zero_point) * scale
+
+            return np.array(out, dtype=np.float32)
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        # Greedy split into allocated sizes (7 -> 4 + 2 + 1 with 1,2,4,8); size 1 is
+        # always allocated, so no padded rows are ever computed
+        outputs, start = [], 0
+        while start < x.shape[0]:
+            size = max(b for b in self.batch_sizes if b <= x.shape[0] - start)
+            outputs.append(self._invoke(x[start:start + size]))
+            start += size
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+    def warmup(self, batch_sizes=(1,)):
+        # Every batch runs on one of the allocated interpreters, so warming each covers them all
+        for n in self.batch_sizes:
+            self.predict(np.zeros((n, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32))
+
+
+# -------------------- Exported artifacts --------------------
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_export_manifest(export_dir: str = MODEL_EXPORT_DIR):
+    path = os.path.join(export_dir, EXPORT_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def exported_artifact(keras_path: str, export_dir: str = MODEL_EXPORT_DIR, verify: bool = MODEL_EXPORT_VERIFY):
+    """
+    Path of the exported flatbuffer for keras_path, or None when there is no
+    usable export. An export is skipped if the .h5 changed since it was built
+    or the artifact doesn't match the manifest.
+    """
+    try:
+        manifest = read_export_manifest(export_dir)
+    except (OSError, ValueError) as e:
+        print(f"[EXPORT] unreadable manifest in {export_dir}: {e}")
+        return None
+    if not manifest:
+        return None
+
+    source = os.path.basename(keras_path)
+    entry = next((m for m in manifest.get("models", {}).values() if m.get("source") == source), None)
+    if entry is None:
+        return None
+
+    artifact = os.path.join(export_dir, entry["artifact"])
+    if not os.path.exists(artifact):
+        return None
+
+    if os.path.exists(keras_path):
+        st = os.stat(keras_path)
+        # A copied-but-identical .h5 only has a different mtime; fall back to the checksum then
+        changed = st.st_size != entry["source_bytes"] or (
+            int(st.st_mtime) != entry["source_mtime"] and file_sha256(keras_path) != entry.get("source_sha256")
+        )
+        if changed:
+            print(f"[EXPORT] {artifact} is stale ({source} changed); re-run export_models.py")
+            return None
+
+    if os.path.getsize(artifact) != entry["bytes"]:
+        print(f"[EXPORT] {artifact} size does not match the manifest; ignoring it")
+        return None
+    if verify and file_sha256(artifact) != entry["sha256"]:
+        print(f"[EXPORT] {artifact} checksum does not match the manifest; ignoring it")
+        return None
+
+    return artifact
+
+
+def active_model_path(keras_path: str, backend: str = INFER_BACKEND) -> str:
+    """File the configured backend actually loads for a model."""
+    if backend == "tflite":
+        return tflite_path(keras_path)
+    if MODEL_EXPORT_PREFER:
+        return exported_artifact(keras_path, verify=False) or keras_path
+    return keras_path
+
+
+def load_backend_model(name: str, keras_path: str, backend: str = INFER_BACKEND):
+    """Load one model with the configured backend. Returns an object with predict(x, verbose=0)."""
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unknown INFER_BACKEND '{backend}', expected one of {SUPPORTED_BACKENDS}")
+
+    if backend == "tflite":
+        path = tflite_path(keras_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found. Build it with: python convert_tflite.py --quantization {TFLITE_QUANTIZATION}"
+            )
+        return TFLiteModel(path, name, engine=f"tflite-{TFLITE_QUANTIZATION}")
+
+    if MODEL_EXPORT_PREFER:
+        artifact = exported_artifact(keras_path)
+        if artifact is not None:
+            engine = "tflite-export+xnnpack" if MODEL_EXPORT_XNNPACK else "tflite-export"
+            note = "; INFER_XLA has no effect on it" if INFER_XLA else ""
+            print(f"[EXPORT] {name}: serving {artifact} through TFLite ({engine}) instead of Keras{note}. "
+                  f"Set MODEL_EXPORT_PREFER=0 to load the .h5.")
+            return TFLiteModel(artifact, name, default_delegates=MODEL_EXPORT_XNNPACK, engine=engine)
+
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    return ServingModel(model, name)
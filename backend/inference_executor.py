@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from batch_inference import INFER_MAX_BATCH_SIZE
+
+load_dotenv()
+
+# -------------------- Config --------------------
+CPU_COUNT = os.cpu_count() or 1
+
+# TensorFlow op parallelism. The batchers are the only threads that call into
+# TF, so intra-op threads can use every core without oversubscribing.
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", str(CPU_COUNT)))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "2"))
+
+# Worker threads that run predict_ulcer. Most of their time is spent waiting on
+# a batch, so there must be at least one per batch slot for batches to fill.
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", str(max(INFER_MAX_BATCH_SIZE, 4))))
+# Requests allowed in the executor (running + waiting) before we return 503
+INFER_QUEUE_SIZE = int(os.getenv("INFER_QUEUE_SIZE", str(INFER_WORKERS * 4)))
+
+
+def configure_tf_threads(tf):
+    """Apply the intra/inter-op thread settings. Must run before any model is loaded."""
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+    except RuntimeError as e:
+        # TF refuses once the runtime has been initialised
+        print(f"[INFERENCE] Could not set TF thread counts: {e}")
+
+
+class InferenceExecutor:
+    """
+    Bounded worker pool for blocking CNN inference.
+
+    Async handlers await run(), which executes the callable on a dedicated
+    thread pool instead of the event loop, so /health, auth and chat routes
+    keep serving while a forward pass is running. Once max_pending requests
+    are in flight, new ones are rejected with 503 and a Retry-After hint.
+    """
+
+    def __init__(self, max_workers: int = INFER_WORKERS, max_pending: int = INFER_QUEUE_SIZE):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+
+    def _retry_after(self) -> int:
+        avg = self._busy_seconds / self._completed if self._completed else 1.0
+        return max(1, math.ceil(avg * self._pending / self.max_workers))
+
+    def _timed(self, fn, args, kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._busy_seconds += elapsed
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Image analysis is busy. Please retry shortly.",
+                    headers={"Retry-After": str(self._retry_after())},
+                )
+            self._pending += 1
+
+        # Run in a copy of the caller's context so contextvars (e.g. the metrics
+        # route label) reach the worker thread; run_in_executor doesn't copy them
+        context = contextvars.copy_context()
+        try:
+            future = self._pool.submit(context.run, self._timed, fn, args, kwargs)
+        except RuntimeError:
+            # Pool already shut down
+            self._finish(None)
+            raise
+        # Count the request as pending until the thread is done with it, even
+        # if the awaiting handler is cancelled (client gone) while it runs
+        future.add_done_callback(self._finish)
+        return await asyncio.wrap_future(future)
+
+    def _finish(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "tf_intra_op_threads": TF_INTRA_OP_THREADS,
+                "tf_inter_op_threads": TF_INTER_OP_THREADS,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+inference_executor = InferenceExecutor()
@@ -0,0 +1,201 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Also serve answers to near-duplicate questions (word n-gram similarity)
+LLM_CACHE_SIMILAR = os.getenv("LLM_CACHE_SIMILAR", "1") == "1"
+# Jaccard similarity of the question n-grams needed for a near-duplicate hit. Kept
+# high: one changed word can change the medical meaning of a question.
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.9"))
+
+# Words that don't change what is being asked
+_FILLER = {"please", "pls", "plz", "kindly", "hi", "hello", "hey", "thanks"}
+# Words that do, however similar the rest is: near-duplicates must agree on these and on numbers
+_NEGATIONS = {"not", "no", "never", "without", "cannot", "nor", "none", "neither", "avoid", "stop"}
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+
+
+def normalize_question(text: str) -> str:
+    """'What is a Diabetic Foot Ulcer??' -> 'what is a diabetic foot ulcer'; "don't" -> 'do not'"""
+    words = _NON_WORD.sub(" ", text.lower().replace("n't", " not")).split()
+    kept = [w for w in words if w not in _FILLER]
+    return " ".join(kept or words)
+
+
+def meaning_guard(normalized: str) -> frozenset:
+    """Negations and numbers in a question; "can I walk" must never answer "can I not walk"."""
+    return frozenset(w for w in normalized.split() if w in _NEGATIONS or any(c.isdigit() for c in w))
+
+
+def question_ngrams(normalized: str) -> frozenset:
+    """Word unigrams plus bigrams; bigrams keep "foot ulcer" apart from "ulcer foot"."""
+    words = normalized.split()
+    return frozenset(words) | frozenset(" ".join(pair) for pair in zip(words, words[1:]))
+
+
+def _scope(system_prompt: str, model: str) -> str:
+    return hashlib.blake2b(f"{model}\0{system_prompt}".encode(), digest_size=12).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache of LLM answers to free-chat questions.
+
+    Keyed on the model + system prompt and the normalized user message.
+    Exact matches are a dict lookup. With similarity enabled, a miss falls
+    back to the cached question with the highest n-gram Jaccard similarity,
+    among those with the same negations and numbers. Candidates come from an
+    inverted n-gram index, probing only the question's rarest n-grams (prefix
+    filtering: a match above the threshold must share at least one of them),
+    so a lookup doesn't scan every entry that shares "what" or "is". Entries
+    expire after a TTL and the least recently used are evicted past max_entries.
+
+    Only store answers that depend on nothing but the question. Anything built
+    from per-patient state must not go through this cache.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: float = LLM_CACHE_TTL_SECONDS,
+                 similar: bool = LLM_CACHE_SIMILAR, min_similarity: float = LLM_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similar = similar
+        self.min_similarity = min_similarity
+
+        # key -> {"answer", "ngrams", "guard", "scope", "expires", "latency"}
+        self._entries = OrderedDict()
+        self._index = {}  # (scope, ngram) -> set of keys
+        self._lock = threading.Lock()
+
+        self.hits = {"exact": 0, "similar": 0}
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+
+    # -------------------- Internals --------------------
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        for gram in entry["ngrams"]:
+            keys = self._index.get((entry["scope"], gram))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(entry["scope"], gram)]
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] <= now:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _most_similar(self, scope, ngrams, guard, now):
+        # Jaccard >= t needs at least ceil(t * |ngrams|) shared n-grams, so any
+        # |ngrams| - ceil(t * |ngrams|) + 1 of them must include a shared one
+        probe = len(ngrams) - math.ceil(self.min_similarity * len(ngrams)) + 1
+        rarest = sorted(ngrams, key=lambda gram: len(self._index.get((scope, gram), ())))[:max(probe, 1)]
+        candidates = set()
+        for gram in rarest:
+            candidates |= self._index.get((scope, gram), set())
+
+        best_key, best_score = None, 0.0
+        for key in candidates:
+            entry = self._live(key, now)
+            if entry is None or entry["guard"] != guard:
+                continue
+            score = len(ngrams & entry["ngrams"]) / len(ngrams | entry["ngrams"])
+            if score > best_score:
+                best_key, best_score = key, score
+        return (best_key, best_score) if best_score >= self.min_similarity else (None, best_score)
+
+    # -------------------- Lookup / store --------------------
+    def get(self, system_prompt: str, question: str, model: str = ""):
+        """Cached answer or None. Counts a hit or a miss."""
+        scope = _scope(system_prompt, model)
+        normalized = normalize_question(question)
+        key = scope + ":" + normalized
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._live(key, now)
+            kind = "exact"
+            if entry is None and self.similar and normalized:
+                similar_key, _ = self._most_similar(scope, question_ngrams(normalized), meaning_guard(normalized), now)
+                if similar_key is not None:
+                    key, entry, kind = similar_key, self._entries[similar_key], "similar"
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits[kind] += 1
+            self.saved_seconds += entry["latency"]
+            return entry["answer"]
+
+    def put(self, system_prompt: str, question: str, answer: str, latency: float = 0.0, model: str = ""):
+        """Store an answer; latency is how long the LLM took, reported as time saved on later hits."""
+        scope = _scope(system_prompt, model)
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        key = scope + ":" + normalized
+        ngrams = question_ngrams(normalized)
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "answer": answer,
+                "ngrams": ngrams,
+                "guard": meaning_guard(normalized),
+                "scope": scope,
+                "expires": time.monotonic() + self.ttl,
+                "latency": latency,
+            }
+            for gram in ngrams:
+                self._index.setdefault((scope, gram), set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.hits["exact"] + self.hits["similar"]
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similar_matching": self.similar,
+                "hits_exact": self.hits["exact"],
+                "hits_similar": self.hits["similar"],
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "llm_seconds_saved": round(self.saved_seconds, 3),
+            }
+
+
+llm_cache = LLMResponseCache()
@@ -1,34 +1,62 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from chat_routes import router as chat_router
 from ai_chat_routes import router as ai_chat_router
 from guest_chat_routes import router as guest_router
 from upload_routes import router as upload_router
 from places_routes import router as places_router
-from upload_routes import set_models
-from guest_chat_routes import set_guest_models
-import numpy as np
-import tensorflow as tf
-from PIL import Image, UnidentifiedImageError
-import io
-
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input as filter_preprocess
-from tensorflow.keras.applications.resnet50 import preprocess_input as severity_preprocess
+from batch_routes import router as batch_router
+from upload_routes import read_and_predict
+from batch_inference import batching_stats
+from inference_backends import INFER_BACKEND
+from predict_service import get_pipeline, prediction_cache
+from inference_executor import inference_executor
+from model_lifecycle import model_lifecycle
+from groq_service import close_async_client
+from llm_cache import llm_cache
+from prompt_builder import prompt_builder
+from guest_store import guest_store
+from http_clients import outbound_http
+from places_cache import places_cache
+from predict_service import add_pipeline_timing_hook
+from metrics import MetricsMiddleware, registry, register_gauge, observe_stage, instrument_sessions
 
 # DB + Auth imports
-from database import Base, engine
+from database import Base, engine, SessionLocal
 from auth_routes import router as auth_router
 
-app = FastAPI()
+
+def create_tables():
+    Base.metadata.create_all(bind=engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables first (quick), so auth and chat routes never see a fresh database without them;
+    # models load in the background and image routes answer 503 until they're ready
+    model_lifecycle.init_db(create_tables)
+    model_lifecycle.start()
+    guest_store.start()
+    outbound_http.start()
+    places_cache.load()
+    yield
+    places_cache.save()
+    guest_store.stop()
+    inference_executor.shutdown()
+    await close_async_client()
+    await outbound_http.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(chat_router)
 app.include_router(ai_chat_router)
 app.include_router(guest_router)
 app.include_router(upload_router)
 app.include_router(places_router)
-
-# Create DB tables
-Base.metadata.create_all(bind=engine)
+app.include_router(batch_router)
 
 # -------------------- CORS (React) --------------------
 app.add_middleware(
@@ -37,85 +65,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 # Include auth routes
 app.include_router(auth_router)
 
-# -------------------- Config --------------------
-IMG_SIZE = 224
-
-SEVERITY_CLASSES = ["high", "low", "medium"]
-FILTER_CLASSES = ["foot", "random"]
-
-FOOT_ACCEPT_THRESHOLD = 0.95
-
-# -------------------- Load Models --------------------
-FILTER_MODEL_PATH = "./models/dfu_filter_mobilenetv2.h5"
-SEVERITY_MODEL_PATH = "./models/resnet50_3class_phase2_best.h5"
-
-try:
-    foot_random_model = tf.keras.models.load_model(FILTER_MODEL_PATH, compile=False)
-    print("Foot/Random filter model loaded!")
-except Exception as e:
-    print("Failed to load filter model:", e)
-    raise e
-
-try:
-    severity_model = tf.keras.models.load_model(SEVERITY_MODEL_PATH, compile=False)
-    print("ResNet severity model loaded!")
-except Exception as e:
-    print("Failed to load severity model:", e)
-    raise e
-
-# Inject models into both upload_routes and guest_chat_routes
-set_models(foot_random_model, severity_model)
-set_guest_models(foot_random_model, severity_model)
-
-# -------------------- Helpers --------------------
-def preprocess_image(pil_img):
-    pil_img = pil_img.convert("RGB").resize((IMG_SIZE, IMG_SIZE))
-    x = np.array(pil_img).astype(np.float32)
-    x = np.expand_dims(x, axis=0)
-    return x
-
-
-def softmax_probs(logits_or_probs):
-    arr = np.array(logits_or_probs)
-
-    if arr.ndim == 2:
-        arr = arr[0]
-
-    s = float(np.sum(arr))
-    if 0.95 <= s <= 1.05:
-        return arr
-
-    exp = np.exp(arr - np.max(arr))
-    return exp / np.sum(exp)
 
+# -------------------- Metrics --------------------
+app.add_middleware(MetricsMiddleware)
+add_pipeline_timing_hook(observe_stage)
+instrument_sessions(SessionLocal)
 
-def get_filter_probs(x):
-    raw = foot_random_model.predict(x, verbose=0)
-    raw = np.array(raw)
 
-    if raw.shape[-1] == 1:
-        p_pos = float(raw[0][0])
-        p_random = p_pos
-        p_foot = 1.0 - p_random
-        return p_foot, p_random
-
-    probs = softmax_probs(raw)
-
-    p_foot = float(probs[0])
-    p_random = float(probs[1])
-
-    return p_foot, p_random
+def _batch_queue_depths():
+    pipeline = get_pipeline()
+    if pipeline is None:
+        return {}
+    return {
+        (name,): model.queue_depth()
+        for name, model in (("filter", pipeline.foot_random_model), ("severity", pipeline.severity_model))
+        if hasattr(model, "queue_depth")
+    }
 
 
-def get_severity_probs(x):
-    raw = severity_model.predict(x, verbose=0)
-    probs = softmax_probs(raw)
-    return probs
+register_gauge("diasure_models_ready", "1 once both models are loaded and warmed up", (),
+               lambda: {(): int(model_lifecycle.is_ready())})
+register_gauge("diasure_inference_pending", "Predictions running or queued on the inference executor", (),
+               lambda: {(): inference_executor.stats()["pending"]})
+register_gauge("diasure_inference_rejected", "Predictions turned away with 503 because the executor was full", (),
+               lambda: {(): inference_executor.stats()["rejected"]})
+register_gauge("diasure_batch_queue_depth", "Tensors waiting in a micro-batcher queue", ("model",),
+               _batch_queue_depths)
+register_gauge("diasure_prediction_cache_hit_ratio", "Share of predictions answered from the cache", (),
+               lambda: {(): prediction_cache.stats()["hit_ratio"]})
+register_gauge("diasure_prediction_cache_entries", "Results held in the prediction cache", (),
+               lambda: {(): prediction_cache.stats()["entries"]})
+register_gauge("diasure_llm_cache_hit_ratio", "Share of free-chat answers served from the LLM cache", (),
+               lambda: {(): llm_cache.stats()["hit_ratio"]})
+register_gauge("diasure_llm_cache_seconds_saved", "Groq generation time avoided by LLM cache hits", (),
+               lambda: {(): llm_cache.stats()["llm_seconds_saved"]})
+register_gauge("diasure_outbound_connections", "Pooled connections to external APIs", ("state",),
+               lambda: {(state,): n for state, n in outbound_http.pool_stats().items()})
+register_gauge("diasure_outbound_pool_utilisation", "Share of the outbound connection limit in use", (),
+               lambda: {(): outbound_http.stats()["pool_utilisation"]})
+register_gauge("diasure_outbound_in_flight", "Outbound requests waiting on a response", ("host",),
+               lambda: {(host,): n for host, n in outbound_http.stats()["in_flight"].items()})
+register_gauge("diasure_circuit_open", "1 while the circuit breaker for a host is open", ("host",),
+               lambda: {(host,): int(b["state"] == "open")
+                        for host, b in outbound_http.stats()["circuit_breakers"].items()})
+register_gauge("diasure_places_cache_hit_ratio", "Share of nearby-doctor searches answered from the places cache", (),
+               lambda: {(): places_cache.stats()["hit_ratio"]})
+register_gauge("diasure_places_cache_entries", "Search results held in the places cache", (),
+               lambda: {(): places_cache.stats()["entries"]})
+register_gauge("diasure_guest_sessions", "Guest sessions held in this worker's memory", (),
+               lambda: {(): guest_store.stats()["sessions"]})
+register_gauge("diasure_guest_sessions_bytes", "Approximate memory used by guest sessions", (),
+               lambda: {(): guest_store.stats()["approx_bytes"]})
 
 
 # -------------------- Routes --------------------
@@ -124,69 +130,86 @@ def home():
     return {"message": "API running. Use POST /predict and /auth/*"}
 
 
+@app.get("/health/live")
+def health_live():
+    # The process is up and serving requests
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def health_ready():
+    # Ready once both models are loaded and warmed up
+    status = model_lifecycle.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
 @app.get("/health")
 def health():
-    return {
-        "status": "ok",
-        "filter_model_loaded": True,
-        "severity_model_loaded": True,
-        "foot_accept_threshold": FOOT_ACCEPT_THRESHOLD,
-        "severity_classes": SEVERITY_CLASSES,
-        "filter_classes": FILTER_CLASSES
+    lifecycle = model_lifecycle.status()
+    pipeline = get_pipeline()
+    health = {
+        "status": "ok" if lifecycle["ready"] else lifecycle["state"],
+        "inference_backend": INFER_BACKEND,
+        # What actually serves each model: an export can replace the .h5 under the keras backend
+        "inference_engines": lifecycle["engines"],
+        "filter_model_loaded": lifecycle["components"]["filter_model"],
+        "severity_model_loaded": lifecycle["components"]["severity_model"],
+        "model_lifecycle": lifecycle,
+        "inference_executor": inference_executor.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "prompt_builder": prompt_builder.stats(),
+        "guest_sessions": guest_store.stats(),
+        "outbound_http": outbound_http.stats(),
+        "places_cache": places_cache.stats(),
     }
 
+    if pipeline is not None:
+        health.update({
+            "foot_accept_threshold": pipeline.foot_accept_threshold,
+            "severity_classes": pipeline.severity_classes,
+            "filter_classes": pipeline.filter_classes,
+            "batching": batching_stats(pipeline.foot_random_model, pipeline.severity_model),
+            "cascade": pipeline.cascade.stats() if pipeline.cascade else None,
+            "stage_timings": pipeline.stats()
+        })
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
-        raise HTTPException(status_code=400, detail="Only JPG/PNG images are allowed.")
+    return health
 
-    try:
-        contents = await file.read()
-        pil_img = Image.open(io.BytesIO(contents))
-    except UnidentifiedImageError:
-        raise HTTPException(status_code=400, detail="Invalid image file or corrupted image.")
-    except Exception:
-        raise HTTPException(status_code=500, detail="Failed to read image.")
 
-    x = preprocess_image(pil_img)
+@app.get("/metrics")
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
-    x_filter = filter_preprocess(x.copy())
-    p_foot, p_random = get_filter_probs(x_filter)
 
-    print(f"[FILTER] p_foot={p_foot:.4f}, p_random={p_random:.4f}")
+@app.post("/predict")
+async def predict(file: UploadFile = File(...)):
+    result = await read_and_predict(file, route="/predict")
+    threshold = get_pipeline().foot_accept_threshold
 
-    if p_foot < FOOT_ACCEPT_THRESHOLD:
+    if not result["is_foot"]:
         return {
             "status": "REJECTED",
             "message": "Rejected: This image does not look like a foot. Upload a clear foot/DFU image.",
             "dfu_filter": {
                 "predicted": "random",
-                "p_foot": round(p_foot, 6),
-                "p_random": round(p_random, 6),
-                "foot_accept_threshold": FOOT_ACCEPT_THRESHOLD
+                "p_foot": round(result["p_foot"], 6),
+                "p_random": round(result["p_random"], 6),
+                "foot_accept_threshold": threshold
             }
         }
 
-    x_sev = severity_preprocess(x.copy())
-    sev_probs = get_severity_probs(x_sev)
-
-    pred_idx = int(np.argmax(sev_probs))
-    pred_label = SEVERITY_CLASSES[pred_idx]
-    confidence = float(sev_probs[pred_idx])
-
-    probs_dict = {SEVERITY_CLASSES[i]: float(sev_probs[i]) for i in range(len(SEVERITY_CLASSES))}
-
     return {
         "status": "ACCEPTED",
         "message": "Foot image accepted. Severity predicted successfully.",
         "dfu_filter": {
             "predicted": "foot",
-            "p_foot": round(p_foot, 6),
-            "p_random": round(p_random, 6),
-            "foot_accept_threshold": FOOT_ACCEPT_THRESHOLD
+            "p_foot": round(result["p_foot"], 6),
+            "p_random": round(result["p_random"], 6),
+            "foot_accept_threshold": threshold
         },
-        "predicted_severity": pred_label,
-        "confidence": round(confidence, 6),
-        "probabilities": probs_dict
-    }
\ No newline at end of file
+        "predicted_severity": result["severity"],
+        "confidence": round(result["confidence"], 6),
+        "probabilities": result["probabilities"]
+    }
@@ -0,0 +1,285 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# 1ms .. 30s: covers tensor forwards as well as Groq / Google round trips
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# ASGI scope of the request being handled, set by MetricsMiddleware so code deep
+# in a handler can label its timings with the matched route template
+_current_scope = contextvars.ContextVar("current_scope", default=None)
+
+
+def route_label(scope) -> str:
+    """Route template ("/chat/{chat_id}/upload-image") once the router has matched, never the raw path."""
+    if scope is None:
+        return "none"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def current_route() -> str:
+    return route_label(_current_scope.get())
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+# -------------------- Metric types --------------------
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Set directly, or give a callback returning {label_values_tuple: value} read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.callback is not None:
+            try:
+                items = list(self.callback().items())
+            except Exception as e:
+                print(f"[METRICS] {self.name} collection failed: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _fmt(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# -------------------- Metrics --------------------
+STAGE_SECONDS = registry.register(Histogram(
+    "diasure_stage_seconds",
+    "Time spent in one stage of a request (image_read, decode, preprocess, filter_forward, "
+    "severity_forward, db_commit, groq, places, distance_matrix)",
+    ("stage", "route"),
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "diasure_http_request_seconds", "HTTP request latency", ("method", "route", "status"),
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "diasure_http_requests_in_flight", "Requests currently being handled",
+))
+UPSTREAM_ERRORS = registry.register(Counter(
+    "diasure_upstream_errors_total", "Failed calls to external services", ("upstream", "route"),
+))
+
+# Pipeline stage names -> metric stage label
+_PIPELINE_STAGES = {"resize": "preprocess"}
+
+
+def observe_stage(stage: str, seconds: float, route=None):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=_PIPELINE_STAGES.get(stage, stage), route=route or current_route())
+
+
+@contextmanager
+def stage_timer(stage: str, route=None):
+    """Time a block into diasure_stage_seconds, labelled with the current request's route."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started, route)
+
+
+def record_upstream_error(upstream: str):
+    if METRICS_ENABLED:
+        UPSTREAM_ERRORS.inc(upstream=upstream, route=current_route())
+
+
+def register_gauge(name: str, help: str, labelnames, callback):
+    """Gauge computed at scrape time from callback() -> {label_values_tuple: value}."""
+    return registry.register(Gauge(name, help, labelnames, callback=callback))
+
+
+def instrument_sessions(session_factory):
+    """Time every Session.commit() (flush + COMMIT) made through session_factory."""
+    from sqlalchemy import event
+
+    @event.listens_for(session_factory, "before_commit")
+    def _before_commit(session):
+        session.info["commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("commit_started", None)
+        if started is not None:
+            observe_stage("db_commit", time.perf_counter() - started)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("commit_started", None)
+
+
+# -------------------- ASGI middleware --------------------
+class MetricsMiddleware:
+    """
+    Records request latency per route template and the in-flight count, and
+    publishes the request scope so stage timings inside the handler get the
+    same route label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_scope.set(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router has filled in scope["route"] by now
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route_label(scope),
+                                    status=status["code"])
+            _current_scope.reset(token)
@@ -0,0 +1,40 @@
+"""
+Database migration script to add the indexes used by paginated chat queries.
+Run this once on databases created before the indexes were added to models_db.py.
+"""
+from sqlalchemy import text
+from database import engine
+
+INDEXES = [
+    # GET /chat/{chat_id}: newest messages of one chat, keyset-paginated
+    ("ix_messages_chat_created_id", "messages (chat_id, created_at, id)"),
+    # GET /chat/history: a user's chats newest first, and each chat's latest severity
+    ("ix_chats_user_created_id", "chats (user_id, created_at DESC, id DESC)"),
+    ("ix_predictions_chat_created_id", "predictions (chat_id, created_at, id)"),
+]
+
+
+def migrate_add_chat_indexes():
+    """Create missing indexes without blocking writes (CONCURRENTLY needs autocommit)"""
+
+    concurrently = "CONCURRENTLY " if engine.dialect.name == "postgresql" else ""
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, definition in INDEXES:
+            try:
+                conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {definition}"))
+                print(f"✅ {name}")
+            except Exception as e:
+                print(f"❌ Creating {name} failed: {e}")
+                raise
+
+        if engine.dialect.name == "postgresql":
+            for table in ("messages", "chats", "predictions"):
+                conn.execute(text(f"ANALYZE {table}"))
+
+    print("✅ Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    print("Starting database migration...")
+    migrate_add_chat_indexes()
@@ -0,0 +1,212 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from batch_inference import MicroBatcher, INFER_MAX_BATCH_SIZE
+from cascade import CascadeScheduler
+from inference_backends import load_backend_model, active_model_path, INFER_BACKEND
+from inference_executor import configure_tf_threads
+from model_server import ModelServerClient, RemoteModel, MODEL_SERVER_ADDRESS
+from predict_service import (
+    InferencePipeline,
+    set_pipeline,
+    prediction_cache,
+    FILTER_MODEL_PATH,
+    SEVERITY_MODEL_PATH,
+)
+
+# Rough hint for clients hitting ML routes during a cold start (seconds)
+NOT_READY_RETRY_AFTER = 5
+
+
+class ModelLifecycle:
+    """
+    Loads the filter and severity models in the background at startup.
+
+    TensorFlow is imported and both models are loaded concurrently on a
+    background thread, so auth, chat history and places routes serve traffic
+    while the ML side warms up. Readiness is published through /health/ready
+    and a breakdown of where cold-start time went is kept in `timings`.
+
+    With MODEL_SERVER_ADDRESS set, the worker skips TensorFlow entirely and
+    connects to the shared model server (model_server.py) instead.
+    """
+
+    def __init__(self):
+        self.state = "pending"  # pending -> loading -> ready | failed
+        self.error = None
+        self.components = {"filter_model": False, "severity_model": False, "database": False}
+        self.timings = {}
+        self.engines = {}  # model name -> what actually runs it (keras, keras+xla, tflite-export, ...)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._started = None
+        self.model_server = None
+
+    # -------------------- Public API --------------------
+    def start(self, model_server=MODEL_SERVER_ADDRESS):
+        """
+        Kick off loading in the background. A non-empty model_server address
+        connects to the shared model server rather than loading the models in
+        this process.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._started = time.perf_counter()
+            self.model_server = model_server or None
+            target = self._connect_model_server if self.model_server else self._load_all
+            self._thread = threading.Thread(target=target, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None) -> bool:
+        return self._ready.wait(timeout)
+
+    def not_ready_error(self) -> HTTPException:
+        if self.state == "failed":
+            return HTTPException(status_code=500, detail="Models failed to load on server")
+        return HTTPException(
+            status_code=503,
+            detail="Image analysis is starting up. Please retry shortly.",
+            headers={"Retry-After": str(NOT_READY_RETRY_AFTER)},
+        )
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self._ready.is_set(),
+                "components": dict(self.components),
+                "error": self.error,
+                "model_server": self.model_server,
+                "engines": dict(self.engines),
+                "cold_start_seconds": {k: round(v, 3) for k, v in self.timings.items()},
+            }
+
+    # -------------------- Loading --------------------
+    def _timed(self, step, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.timings[step] = time.perf_counter() - started
+
+    def _mark(self, component):
+        with self._lock:
+            self.components[component] = True
+
+    def init_db(self, db_init):
+        """
+        Create the DB tables. Runs at startup before any route serves, since
+        auth and chat routes need the tables and it only takes a moment.
+        """
+        try:
+            self._timed("create_tables", db_init)
+            self._mark("database")
+        except Exception as e:
+            # Tables normally exist already; don't take the ML side down with it
+            print("Failed to create DB tables:", e)
+
+    def _load_model(self, name, path):
+        model = self._timed(f"load_{name}", load_backend_model, name, path)
+        engine = getattr(model, "engine", INFER_BACKEND)
+        with self._lock:
+            self.engines[name] = engine
+        print(f"{name} model loaded from {active_model_path(path)} in {self.timings[f'load_{name}']:.2f}s "
+              f"(backend: {INFER_BACKEND}, engine: {engine})")
+        return model
+
+    def _load_all(self):
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-load")
+        try:
+            tf = self._timed("import_tensorflow", __import__, "tensorflow")
+            # Thread counts must be fixed before TF initialises its runtime
+            configure_tf_threads(tf)
+
+            filter_future = pool.submit(self._load_model, "filter", FILTER_MODEL_PATH)
+            severity_future = pool.submit(self._load_model, "severity", SEVERITY_MODEL_PATH)
+            foot_random_model = filter_future.result()
+            self._mark("filter_model")
+            severity_model = severity_future.result()
+            self._mark("severity_model")
+
+            # Keras models are served through traced tf.function graphs instead of Model.predict.
+            # With XLA every batch size compiles separately, so warm up all of them.
+            # An exported model under the keras backend runs on TFLite, where XLA doesn't apply.
+            def warmup_sizes(name):
+                return range(1, INFER_MAX_BATCH_SIZE + 1) if self.engines.get(name) == "keras+xla" else (1,)
+
+            warm = [
+                pool.submit(self._timed, "warmup_filter", foot_random_model.warmup, warmup_sizes("filter")),
+                pool.submit(self._timed, "warmup_severity", severity_model.warmup, warmup_sizes("severity")),
+            ]
+            for f in warm:
+                f.result()
+
+            # Cache invalidation watches whichever files the backend actually loaded
+            prediction_cache.set_model_paths([
+                active_model_path(FILTER_MODEL_PATH),
+                active_model_path(SEVERITY_MODEL_PATH),
+            ])
+
+            # Micro-batchers so concurrent uploads share forward passes; the cascade
+            # only forwards filter-accepted images to the severity queue
+            foot_random_model = MicroBatcher(foot_random_model, "filter")
+            severity_model = MicroBatcher(severity_model, "severity")
+            cascade = CascadeScheduler(severity_model)
+
+            # One pipeline shared by /predict, /chat/{id}/upload-image and /guest/{id}/upload-image
+            set_pipeline(InferencePipeline(foot_random_model, severity_model, cascade=cascade))
+
+            self._set_ready()
+        except Exception as e:
+            self._set_failed(e)
+        finally:
+            pool.shutdown(wait=False)
+
+    def _connect_model_server(self):
+        try:
+            client = ModelServerClient(self.model_server)
+            info = self._timed("connect_model_server", client.wait_until_up)
+            print(f"Connected to model server {self.model_server} (pid {info['pid']})")
+            with self._lock:
+                self.engines = {name: f"model-server:{engine}" for name, engine in info.get("engines", {}).items()}
+
+            # Batching happens in the server across all workers, so no local MicroBatchers.
+            # The prediction cache stays per worker; its invalidation check only sees
+            # model files when they are on this host.
+            foot_random_model = RemoteModel(client, "filter")
+            self._mark("filter_model")
+            severity_model = RemoteModel(client, "severity")
+            self._mark("severity_model")
+            cascade = CascadeScheduler(severity_model)
+
+            set_pipeline(InferencePipeline(foot_random_model, severity_model, cascade=cascade))
+            self._set_ready()
+        except Exception as e:
+            self._set_failed(e)
+
+    def _set_ready(self):
+        with self._lock:
+            self.timings["total"] = time.perf_counter() - self._started
+            self.state = "ready"
+        self._ready.set()
+        print(f"Models ready. Cold start breakdown: {self.status()['cold_start_seconds']}")
+
+    def _set_failed(self, e):
+        with self._lock:
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            self.timings["total"] = time.perf_counter() - self._started
+        print("Failed to load models:", e)
+
+
+model_lifecycle = ModelLifecycle()
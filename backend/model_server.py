@@ -0,0 +1,309 @@
+import argparse
+import atexit
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+# Where the shared model server listens. A filesystem path is a Unix socket,
+# "host:port" is TCP on localhost (use that on Windows). Empty = every worker
+# loads its own models, as before.
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "")
+# Shared secret for the connection handshake. Messages are pickled, so anyone
+# holding it can run code in the model server. Required for TCP; on a Unix
+# socket an unset key is generated by the server and written to <socket>.key (0600).
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "").encode()
+# How long a web worker waits for the model server to come up (seconds)
+MODEL_SERVER_CONNECT_TIMEOUT = float(os.getenv("MODEL_SERVER_CONNECT_TIMEOUT", "120"))
+
+# Shared segment per connection; grows if a larger batch comes through
+_MIN_SHM_BYTES = 4 * 224 * 224 * 3 * 4
+
+
+def parse_address(address: str):
+    """'/tmp/x.sock' -> (path, 'AF_UNIX'); '127.0.0.1:8765' -> ((host, port), 'AF_INET')."""
+    if ":" in address and not address.startswith(("/", ".")) and not os.path.isabs(address):
+        host, port = address.rsplit(":", 1)
+        return (host or "127.0.0.1", int(port)), "AF_INET"
+    return address, "AF_UNIX"
+
+
+def key_file(address) -> str:
+    return f"{address}.key"
+
+
+def server_authkey(address, family, authkey: bytes) -> bytes:
+    """The configured key, or a fresh one published next to the Unix socket."""
+    if authkey:
+        return authkey
+    if family != "AF_UNIX":
+        raise SystemExit("MODEL_SERVER_AUTHKEY must be set to serve models over TCP")
+
+    authkey = secrets.token_bytes(32)
+    path = key_file(address)
+    if os.path.exists(path):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+def client_authkey(address, authkey: bytes) -> bytes:
+    """The configured key, or the one the server wrote next to its Unix socket."""
+    if authkey:
+        return authkey
+    # Read on every connect: a restarted server writes a new key
+    with open(key_file(address), "rb") as f:
+        return f.read()
+
+
+# -------------------- Server --------------------
+class ModelServer:
+    """
+    Holds the only copy of the filter and severity models for all web workers.
+
+    Each worker connection owns a shared-memory segment. The worker writes its
+    preprocessed float32 batch into it and sends a small control message
+    {"op": "predict", "model": ..., "shape": ...} over the socket; the server
+    reads the tensor in place, runs it through the model (the micro-batchers
+    fold requests from every worker into the same forward passes) and sends
+    back the raw model output, which is only a few floats per image.
+    """
+
+    def __init__(self, models: dict, address: str = MODEL_SERVER_ADDRESS, authkey: bytes = MODEL_SERVER_AUTHKEY):
+        self.models = models
+        self.address, self.family = parse_address(address)
+        self.authkey = server_authkey(self.address, self.family, authkey)
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._requests = 0
+
+    def serve_forever(self):
+        if self.family == "AF_UNIX" and os.path.exists(self.address):
+            os.unlink(self.address)
+
+        with Listener(self.address, family=self.family, authkey=self.authkey) as listener:
+            print(f"[MODEL-SERVER] listening on {self.address} models={list(self.models)}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Failed handshake (bad authkey, client gone); keep serving
+                    print("[MODEL-SERVER] rejected connection:", e)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), name="model-conn", daemon=True).start()
+
+    def engines(self) -> dict:
+        # Models are usually wrapped in a MicroBatcher; the engine is on the model inside
+        return {name: getattr(getattr(m, "model", m), "engine", "unknown") for name, m in self.models.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {"connections": self._connections, "requests": self._requests}
+        out["models"] = {name: m.stats() for name, m in self.models.items() if hasattr(m, "stats")}
+        return out
+
+    def _handle(self, conn):
+        with self._lock:
+            self._connections += 1
+        shm = None
+        try:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                op = msg.get("op")
+                try:
+                    if op == "attach":
+                        if shm is not None:
+                            shm.close()
+                        shm = SharedMemory(name=msg["name"])
+                        # The worker owns the segment; stop this process's tracker from unlinking it
+                        resource_tracker.unregister(shm._name, "shared_memory")
+                        conn.send({"ok": True})
+                    elif op == "predict":
+                        x = np.ndarray(tuple(msg["shape"]), dtype=np.float32, buffer=shm.buf)
+                        out = self.models[msg["model"]].predict(x, verbose=0)
+                        del x
+                        with self._lock:
+                            self._requests += 1
+                        conn.send({"ok": True, "out": np.asarray(out, dtype=np.float32)})
+                    elif op == "ping":
+                        conn.send({"ok": True, "models": list(self.models), "pid": os.getpid(),
+                                   "engines": self.engines()})
+                    elif op == "stats":
+                        conn.send({"ok": True, "stats": self.stats()})
+                    else:
+                        conn.send({"ok": False, "error": f"unknown op {op!r}"})
+                except Exception as e:
+                    conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            if shm is not None:
+                shm.close()
+            conn.close()
+            with self._lock:
+                self._connections -= 1
+
+
+# -------------------- Client --------------------
+class ModelServerClient:
+    """
+    Connection to the model server from a web worker.
+
+    Connections are not thread-safe, so each inference thread lazily opens its
+    own connection and shared-memory segment and reuses them for every call.
+    """
+
+    def __init__(self, address: str = MODEL_SERVER_ADDRESS, authkey: bytes = MODEL_SERVER_AUTHKEY):
+        self.address, self.family = parse_address(address)
+        if not authkey and self.family != "AF_UNIX":
+            raise RuntimeError("MODEL_SERVER_AUTHKEY must be set to reach the model server over TCP")
+        self.authkey = authkey
+        self._local = threading.local()
+        self._segments = []
+        self._segments_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _connect(self):
+        authkey = client_authkey(self.address, self.authkey)
+        return Client(self.address, family=self.family, authkey=authkey)
+
+    def _call(self, conn, msg):
+        conn.send(msg)
+        reply = conn.recv()
+        if not reply.get("ok"):
+            raise RuntimeError(f"Model server error: {reply.get('error')}")
+        return reply
+
+    def _attach(self, nbytes: int):
+        local = self._local
+        if getattr(local, "conn", None) is None:
+            local.conn = self._connect()
+            local.shm = None
+
+        if local.shm is None or local.shm.size < nbytes:
+            shm = SharedMemory(create=True, size=max(nbytes, _MIN_SHM_BYTES))
+            with self._segments_lock:
+                self._segments.append(shm)
+            self._call(local.conn, {"op": "attach", "name": shm.name})
+            if local.shm is not None:
+                self._release(local.shm)
+            local.shm = shm
+        return local.conn, local.shm
+
+    def _release(self, shm):
+        with self._segments_lock:
+            if shm in self._segments:
+                self._segments.remove(shm)
+        shm.close()
+        shm.unlink()
+
+    def predict(self, model: str, x):
+        x = np.asarray(x, dtype=np.float32)
+        try:
+            conn, shm = self._attach(x.nbytes)
+            np.ndarray(x.shape, dtype=np.float32, buffer=shm.buf)[...] = x
+            return self._call(conn, {"op": "predict", "model": model, "shape": x.shape})["out"]
+        except (EOFError, OSError):
+            # Server restarted: drop this thread's connection so the next call reconnects
+            self._reset_local()
+            raise
+
+    def _reset_local(self):
+        local = self._local
+        if getattr(local, "conn", None) is not None:
+            try:
+                local.conn.close()
+            except OSError:
+                pass
+        if getattr(local, "shm", None) is not None:
+            self._release(local.shm)
+        local.conn = None
+        local.shm = None
+
+    def ping(self) -> dict:
+        with self._connect() as conn:
+            return self._call(conn, {"op": "ping"})
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            return self._call(conn, {"op": "stats"})["stats"]
+
+    def wait_until_up(self, timeout: float = MODEL_SERVER_CONNECT_TIMEOUT) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.ping()
+            except (OSError, EOFError, AuthenticationError):
+                # Not listening yet, or a key file left by the previous server
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+    def close(self):
+        with self._segments_lock:
+            segments, self._segments = self._segments, []
+        for shm in segments:
+            try:
+                shm.close()
+                shm.unlink()
+            except (OSError, BufferError):
+                pass
+
+
+class RemoteModel:
+    """
+    Stand-in for a local model that forwards predict(x, verbose=0) to the model
+    server. submit() mirrors MicroBatcher so the cascade can still speculate.
+    """
+
+    def __init__(self, client: ModelServerClient, name: str, max_pending: int = 8):
+        self.client = client
+        self.name = name
+        self._pool = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix=f"remote-{name}")
+
+    def predict(self, x, verbose=0):
+        return self.client.predict(self.name, x)
+
+    def submit(self, x):
+        return self._pool.submit(self.predict, x)
+
+
+# -------------------- Entrypoint --------------------
+def main():
+    parser = argparse.ArgumentParser(description="Serve the DiAsure models to uvicorn workers over shared memory.")
+    parser.add_argument("--address", default=MODEL_SERVER_ADDRESS or "/tmp/diasure-models.sock",
+                        help="Unix socket path or host:port (default: MODEL_SERVER_ADDRESS)")
+    args = parser.parse_args()
+
+    from model_lifecycle import model_lifecycle
+    from predict_service import get_pipeline
+
+    # Load locally, whatever MODEL_SERVER_ADDRESS says; this process *is* the model server
+    model_lifecycle.start(model_server="")
+    model_lifecycle.wait_ready()
+    pipeline = get_pipeline()
+    if pipeline is None:
+        raise SystemExit(f"Models failed to load: {model_lifecycle.error}")
+
+    ModelServer(
+        {"filter": pipeline.foot_random_model, "severity": pipeline.severity_model},
+        address=args.address,
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Float, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -47,6 +47,10 @@ class Chat(Base):
         "Message", back_populates="chat", cascade="all, delete-orphan")
 
 
+# Serves the paginated chat history (GET /chat/history), newest first
+Index("ix_chats_user_created_id", Chat.user_id, Chat.created_at.desc(), Chat.id.desc())
+
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -62,6 +66,11 @@ class Message(Base):
 
     chat = relationship("Chat", back_populates="messages")
 
+    # Serves the keyset-paginated message history (GET /chat/{chat_id})
+    __table_args__ = (
+        Index("ix_messages_chat_created_id", "chat_id", "created_at", "id"),
+    )
+
 
 class Prediction(Base):
     __tablename__ = "predictions"
@@ -76,6 +85,11 @@ class Prediction(Base):
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Latest severity per chat for the history listing
+    __table_args__ = (
+        Index("ix_predictions_chat_created_id", "chat_id", "created_at", "id"),
+    )
+
 
 class PatientState(Base):
     __tablename__ = "patient_states"
@@ -0,0 +1,209 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+PLACES_CACHE_ENABLED = os.getenv("PLACES_CACHE_ENABLED", "1") == "1"
+# Geohash cell shared by nearby users: precision 6 is about 1.2 km x 0.6 km
+PLACES_CACHE_GEOHASH_PRECISION = int(os.getenv("PLACES_CACHE_GEOHASH_PRECISION", "6"))
+# Place records (name, address, phone, location) change rarely...
+PLACES_CACHE_TTL_SECONDS = float(os.getenv("PLACES_CACHE_TTL_SECONDS", str(24 * 3600)))
+# ...opening status changes through the day
+PLACES_OPEN_NOW_TTL_SECONDS = float(os.getenv("PLACES_OPEN_NOW_TTL_SECONDS", "900"))
+PLACES_CACHE_MAX_ENTRIES = int(os.getenv("PLACES_CACHE_MAX_ENTRIES", "2000"))
+PLACES_CACHE_MAX_BYTES = int(os.getenv("PLACES_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Optional gzip JSON snapshot, loaded at startup and written at shutdown
+PLACES_CACHE_FILE = os.getenv("PLACES_CACHE_FILE", "")
+# approx: scale cached road distances to the user's position; recompute: ask Distance Matrix again
+PLACES_CACHE_ROAD_DISTANCE = os.getenv("PLACES_CACHE_ROAD_DISTANCE", "approx")
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude: float, longitude: float, precision: int = PLACES_CACHE_GEOHASH_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+class PlacesCache:
+    """
+    Nearby-search results shared by users in the same geohash cell, keyed on
+    cell + radius + doctor types. The radius is not rounded up to a shared
+    bucket: a search returns at most 20 places, so searching a wider circle
+    can push the closest ones out of the results.
+
+    An entry holds the raw place records, the position they were searched
+    from and the road distances measured from there. Callers re-filter and
+    re-measure for the exact user position. Records expire after `ttl`;
+    opening hours are reported stale after `hours_ttl` so the caller can
+    refresh just those. Least recently used entries are evicted past
+    max_entries or max_bytes (approximate, from the serialized size).
+    """
+
+    def __init__(self, ttl: float = PLACES_CACHE_TTL_SECONDS, hours_ttl: float = PLACES_OPEN_NOW_TTL_SECONDS,
+                 max_entries: int = PLACES_CACHE_MAX_ENTRIES, max_bytes: int = PLACES_CACHE_MAX_BYTES,
+                 path: str = PLACES_CACHE_FILE):
+        self.ttl = ttl
+        self.hours_ttl = hours_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+
+        # key -> {"places", "origin", "roads", "fetched", "hours_fetched", "bytes"}; times are unix time
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.hours_refreshes = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(latitude: float, longitude: float, radius: int, doctor_types) -> str:
+        types = ",".join(sorted(doctor_types)) or "hospital"
+        return f"{geohash(latitude, longitude)}:{int(radius)}:{types}"
+
+    # -------------------- Internals --------------------
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["bytes"]
+
+    def _store(self, key, entry):
+        if key in self._entries:
+            self._drop(key)
+        entry["bytes"] = len(json.dumps(entry["places"], separators=(",", ":"))) + 200 * len(entry["roads"])
+        self._entries[key] = entry
+        self._bytes += entry["bytes"]
+        while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    # -------------------- Lookup / store --------------------
+    def get(self, key: str):
+        """(entry, hours_stale) or None. Counts a hit or a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["fetched"] > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry, now - entry["hours_fetched"] > self.hours_ttl
+
+    def put(self, key: str, places: list, origin: tuple, roads: dict):
+        """places: raw Places records; roads: place id -> road distance measured from origin."""
+        now = time.time()
+        with self._lock:
+            self._store(key, {
+                "places": places,
+                "origin": list(origin),
+                "roads": roads,
+                "fetched": now,
+                "hours_fetched": now,
+            })
+
+    def update_hours(self, key: str, hours_by_id: dict):
+        """Swap in fresh currentOpeningHours without touching the rest of the records."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            for place in entry["places"]:
+                hours = hours_by_id.get(place.get("id"))
+                if hours is not None:
+                    place["currentOpeningHours"] = hours
+            entry["hours_fetched"] = time.time()
+            self.hours_refreshes += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # -------------------- Persistence --------------------
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except Exception as e:
+            print(f"[PLACES CACHE] Could not read {self.path}: {e}")
+            return
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for key, entry in snapshot.get("entries", []):
+                if now - entry["fetched"] <= self.ttl:
+                    self._store(key, entry)
+                    loaded += 1
+        print(f"[PLACES CACHE] Loaded {loaded} entries from {self.path}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = [[key, {k: v for k, v in entry.items() if k != "bytes"}] for key, entry in self._entries.items()]
+
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": entries}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            print(f"[PLACES CACHE] Saved {len(entries)} entries to {self.path}")
+        except Exception as e:
+            print(f"[PLACES CACHE] Could not write {self.path}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": PLACES_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "approx_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "opening_hours_refreshes": self.hours_refreshes,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "road_distance_mode": PLACES_CACHE_ROAD_DISTANCE,
+                "persisted_to": self.path or None,
+            }
+
+
+places_cache = PlacesCache()
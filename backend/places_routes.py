@@ -1,16 +1,40 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
-import httpx
+import asyncio
 import os
 import math
+import httpx
 from dotenv import load_dotenv
 
+from metrics import stage_timer, record_upstream_error
+from http_clients import outbound_http
+from places_cache import places_cache, PLACES_CACHE_ENABLED, PLACES_CACHE_ROAD_DISTANCE
+
 load_dotenv()
 
 router = APIRouter(prefix="/places", tags=["places"])
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
 
+# -------------------- Config --------------------
+# Whole-call budgets; a search that runs over is dropped, a distance lookup
+# that runs over falls back to straight-line distance
+PLACES_TIMEOUT = float(os.getenv("PLACES_TIMEOUT", "8"))
+DISTANCE_MATRIX_TIMEOUT = float(os.getenv("DISTANCE_MATRIX_TIMEOUT", "4"))
+# Distance Matrix accepts at most 25 destinations per request
+DISTANCE_MATRIX_MAX_DESTINATIONS = 25
+# Largest locationBias circle Text Search accepts (meters)
+PLACES_MAX_SEARCH_RADIUS = 50000
+# Point these at a mock server (benchmarks/mock_google.py) for tests
+GOOGLE_PLACES_BASE_URL = os.getenv("GOOGLE_PLACES_BASE_URL", "https://places.googleapis.com").rstrip("/")
+GOOGLE_MAPS_BASE_URL = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com").rstrip("/")
+
+PLACE_FIELD_MASK = "places.id,places.displayName,places.formattedAddress,places.rating,places.userRatingCount,places.nationalPhoneNumber,places.currentOpeningHours,places.regularOpeningHours,places.location,places.googleMapsUri,places.websiteUri"
+# Enough to refresh open-now on cached results
+OPENING_HOURS_FIELD_MASK = "places.id,places.currentOpeningHours"
+# Road distance / straight-line distance when there is nothing better to go on
+DEFAULT_DETOUR_FACTOR = 1.3
+
 # Doctor type to search keyword mapping
 DOCTOR_TYPE_KEYWORDS = {
     "podiatrist": "podiatrist",
@@ -32,45 +56,75 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return R * c
 
 
-async def get_road_distance(origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> dict:
-    """Get road distance using Distance Matrix API"""
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
+async def _distance_matrix_chunk(origin: str, destinations: list) -> list:
+    """One Distance Matrix request; one result (or None) per destination."""
+    url = f"{GOOGLE_MAPS_BASE_URL}/maps/api/distancematrix/json"
     params = {
-        "origins": f"{origin_lat},{origin_lng}",
-        "destinations": f"{dest_lat},{dest_lng}",
+        "origins": origin,
+        "destinations": "|".join(f"{lat},{lng}" for lat, lng in destinations),
         "key": GOOGLE_API_KEY
     }
-    
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
+        with stage_timer("distance_matrix"):
+            response = await asyncio.wait_for(
+                outbound_http.request("GET", url, upstream="distance_matrix", params=params,
+                                      timeout=DISTANCE_MATRIX_TIMEOUT),
+                DISTANCE_MATRIX_TIMEOUT
+            )
             data = response.json()
-        
-        if data.get("status") != "OK":
-            return None
-        
-        element = data["rows"][0]["elements"][0]
+    except Exception as e:
+        record_upstream_error("distance_matrix")
+        print(f"[DISTANCE MATRIX] Error: {e!r}")
+        return [None] * len(destinations)
+
+    if data.get("status") != "OK":
+        record_upstream_error("distance_matrix")
+        print(f"[DISTANCE MATRIX] Status: {data.get('status')}")
+        return [None] * len(destinations)
+
+    rows = data.get("rows") or [{}]
+    elements = rows[0].get("elements", [])
+    results = []
+    for element in elements[:len(destinations)]:
         if element.get("status") != "OK":
-            return None
-        
-        return {
+            results.append(None)
+            continue
+        results.append({
             "distance_text": element["distance"]["text"],
             "distance_meters": element["distance"]["value"],
             "duration_text": element["duration"]["text"]
-        }
-    except Exception as e:
-        print(f"[DISTANCE MATRIX] Error: {e}")
-        return None
+        })
+    return results + [None] * (len(destinations) - len(results))
+
+
+async def get_road_distances(origin_lat: float, origin_lng: float, destinations: list) -> list:
+    """
+    Road distances from one origin to many (lat, lng) destinations using the
+    Distance Matrix API: chunks of 25 destinations, requested concurrently.
+    Returns one dict per destination, or None where no road distance came back.
+    """
+    if not destinations:
+        return []
+
+    origin = f"{origin_lat},{origin_lng}"
+    chunks = [
+        destinations[i:i + DISTANCE_MATRIX_MAX_DESTINATIONS]
+        for i in range(0, len(destinations), DISTANCE_MATRIX_MAX_DESTINATIONS)
+    ]
+    chunk_results = await asyncio.gather(*(_distance_matrix_chunk(origin, chunk) for chunk in chunks))
+    return [result for chunk in chunk_results for result in chunk]
 
 
-async def search_places_new_api(query: str, latitude: float, longitude: float, radius: int) -> list:
+async def search_places_new_api(query: str, latitude: float, longitude: float, radius: int,
+                                field_mask: str = PLACE_FIELD_MASK) -> list:
     """Use Google Places API (New) Text Search"""
-    url = "https://places.googleapis.com/v1/places:searchText"
+    url = f"{GOOGLE_PLACES_BASE_URL}/v1/places:searchText"
     
     headers = {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": GOOGLE_API_KEY,
-        "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.rating,places.userRatingCount,places.nationalPhoneNumber,places.currentOpeningHours,places.regularOpeningHours,places.location,places.googleMapsUri,places.websiteUri"
+        "X-Goog-FieldMask": field_mask
     }
     
     body = {
@@ -87,19 +141,111 @@ async def search_places_new_api(query: str, latitude: float, longitude: float, r
         "maxResultCount": 20
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=body, headers=headers)
-        data = response.json()
+    try:
+        with stage_timer("places"):
+            # Text Search is read-only, so retrying the POST is safe
+            response = await asyncio.wait_for(
+                outbound_http.request("POST", url, upstream="places", json=body, headers=headers,
+                                      timeout=PLACES_TIMEOUT),
+                PLACES_TIMEOUT
+            )
+            data = response.json()
+    except Exception:
+        record_upstream_error("places")
+        raise
     
     print(f"[PLACES API NEW] Query: {query}, Status: {response.status_code}")
     
     if response.status_code != 200:
+        # Raise so search_all counts it as failed: an error must not pass for "no places here"
+        record_upstream_error("places")
         print(f"[PLACES API NEW] Error: {data}")
-        return []
+        raise httpx.HTTPStatusError(f"Places search returned {response.status_code}",
+                                    request=response.request, response=response)
     
     return data.get("places", [])
 
 
+async def search_all(queries: list, latitude: float, longitude: float, radius: int,
+                     field_mask: str = PLACE_FIELD_MASK):
+    """
+    All text searches at once, deduplicated by place id. One that fails or
+    times out only loses its own results. Returns (places, failed_count).
+    """
+    search_results = await asyncio.gather(
+        *(search_places_new_api(query, latitude, longitude, radius, field_mask) for query in queries),
+        return_exceptions=True
+    )
+
+    places = []
+    seen_place_ids = set()
+    failed = 0
+    for result in search_results:
+        if isinstance(result, BaseException):
+            print(f"[PLACES API] Search failed: {result!r}")
+            failed += 1
+            continue
+        for place in result:
+            if place.get("id") in seen_place_ids:
+                continue
+            seen_place_ids.add(place.get("id"))
+            places.append(place)
+    return places, failed
+
+
+def within_radius(places: list, latitude: float, longitude: float, radius: int) -> list:
+    """(place, lat, lng, straight-line km) for every place inside the radius."""
+    candidates = []
+    for place in places:
+        # Get location
+        location = place.get("location", {})
+        place_lat = location.get("latitude", 0)
+        place_lng = location.get("longitude", 0)
+
+        # Calculate straight-line distance for filtering
+        distance_km = haversine_distance(latitude, longitude, place_lat, place_lng)
+
+        # Filter by radius (using straight-line for initial filter)
+        if distance_km > (radius / 1000):
+            continue
+
+        candidates.append((place, place_lat, place_lng, distance_km))
+    return candidates
+
+
+def approximate_road_distance(entry: dict, place_id: str, place_lat: float, place_lng: float,
+                              latitude: float, longitude: float, distance_km: float):
+    """
+    Road distance from the user's exact position, estimated from a cached one:
+    the road / straight-line ratio measured from the cached search origin is
+    applied to the user's own straight-line distance.
+    """
+    road = entry["roads"].get(place_id)
+    if road is None:
+        return None
+
+    origin_lat, origin_lng = entry["origin"]
+    if haversine_distance(origin_lat, origin_lng, latitude, longitude) < 0.05:
+        return road  # searched from (practically) the same spot
+
+    origin_km = haversine_distance(origin_lat, origin_lng, place_lat, place_lng)
+    detour = road["distance_meters"] / (origin_km * 1000) if origin_km > 0.05 else DEFAULT_DETOUR_FACTOR
+    meters = int(distance_km * 1000 * detour)
+    return {
+        "distance_text": f"~{meters / 1000:.1f} km",
+        "distance_meters": meters,
+        "duration_text": None
+    }
+
+
+async def refresh_opening_hours(cache_key: str, queries: list, latitude: float, longitude: float, radius: int):
+    """Re-run the searches for opening hours only and update the cached records."""
+    places, failed = await search_all(queries, latitude, longitude, radius, OPENING_HOURS_FIELD_MASK)
+    if failed:
+        return  # keep serving the previous hours; try again on the next request
+    places_cache.update_hours(cache_key, {p.get("id"): p.get("currentOpeningHours", {}) for p in places})
+
+
 @router.get("/nearby")
 async def get_nearby_doctors(
     latitude: float = Query(..., description="User's latitude"),
@@ -116,80 +262,94 @@ async def get_nearby_doctors(
     
     print(f"[PLACES API] Searching at lat={latitude}, lng={longitude}, radius={radius}")
     
-    # Parse doctor types
-    queries = []
-    if doctor_types:
-        for dt in doctor_types.split(","):
-            dt = dt.strip()
-            if dt in DOCTOR_TYPE_KEYWORDS:
-                queries.append(f"{DOCTOR_TYPE_KEYWORDS[dt]} doctor near me")
+    # Parse doctor types (order and repeats don't change the search)
+    types = sorted({dt.strip() for dt in (doctor_types or "").split(",")} & DOCTOR_TYPE_KEYWORDS.keys())
+    queries = [f"{DOCTOR_TYPE_KEYWORDS[dt]} doctor near me" for dt in types]
     
     # Default: search for hospitals
     if not queries:
         queries = ["hospital near me"]
-    
+
+    cache_key = places_cache.key(latitude, longitude, radius, types)
+    cached = places_cache.get(cache_key) if PLACES_CACHE_ENABLED else None
+
+    if cached is None:
+        # Search the requested radius itself: results are capped at 20 per query, so a wider
+        # circle would trade the requester's closest places for ones they didn't ask for
+        places, failed = await search_all(queries, latitude, longitude, min(radius, PLACES_MAX_SEARCH_RADIUS))
+        if failed and failed == len(queries):
+            raise HTTPException(status_code=502, detail="Places search failed, please try again")
+
+        candidates = within_radius(places, latitude, longitude, radius)
+
+        # Road distances for every candidate in a few batched Distance Matrix requests
+        road_distances = await get_road_distances(
+            latitude, longitude, [(place_lat, place_lng) for _, place_lat, place_lng, _ in candidates]
+        )
+
+        # Partial results are served but not cached: a failed search (exception, timeout or
+        # error status) loses places, and a failed Distance Matrix batch would pin
+        # straight-line distances for the TTL
+        if PLACES_CACHE_ENABLED and not failed and all(road_distances):
+            roads = {c[0].get("id"): road for c, road in zip(candidates, road_distances)}
+            places_cache.put(cache_key, places, (latitude, longitude), roads)
+    else:
+        entry, hours_stale = cached
+        if hours_stale:
+            await refresh_opening_hours(cache_key, queries, latitude, longitude,
+                                        min(radius, PLACES_MAX_SEARCH_RADIUS))
+
+        candidates = within_radius(entry["places"], latitude, longitude, radius)
+
+        if PLACES_CACHE_ROAD_DISTANCE == "recompute":
+            road_distances = await get_road_distances(
+                latitude, longitude, [(place_lat, place_lng) for _, place_lat, place_lng, _ in candidates]
+            )
+        else:
+            road_distances = [
+                approximate_road_distance(entry, place.get("id"), place_lat, place_lng, latitude, longitude, distance_km)
+                for place, place_lat, place_lng, distance_km in candidates
+            ]
+
     all_places = []
-    seen_place_ids = set()
-    
-    for query in queries:
-        places = await search_places_new_api(query, latitude, longitude, radius)
-        
-        for place in places:
-            place_id = place.get("id")
-            if place_id in seen_place_ids:
-                continue
-            seen_place_ids.add(place_id)
-            
-            # Get location
-            location = place.get("location", {})
-            place_lat = location.get("latitude", 0)
-            place_lng = location.get("longitude", 0)
-            
-            # Calculate straight-line distance for filtering
-            distance_km = haversine_distance(latitude, longitude, place_lat, place_lng)
-            
-            # Filter by radius (using straight-line for initial filter)
-            if distance_km > (radius / 1000):
-                continue
-            
-            # Get road distance using Distance Matrix API
-            road_distance = await get_road_distance(latitude, longitude, place_lat, place_lng)
-            
-            if road_distance:
-                distance_text = road_distance["distance_text"]
-                distance_meters = road_distance["distance_meters"]
-                duration_text = road_distance["duration_text"]
-            else:
-                # Fallback to straight-line distance
-                distance_text = f"{distance_km:.1f} km"
-                distance_meters = int(distance_km * 1000)
-                duration_text = None
-            
-            # Get opening hours
-            current_hours = place.get("currentOpeningHours", {})
-            regular_hours = place.get("regularOpeningHours", {})
-            
-            all_places.append({
-                "place_id": place_id,
-                "name": place.get("displayName", {}).get("text", "Unknown"),
-                "address": place.get("formattedAddress", ""),
-                "rating": place.get("rating"),
-                "user_ratings_total": place.get("userRatingCount", 0),
-                "phone": place.get("nationalPhoneNumber"),
-                "website": place.get("websiteUri"),
-                "opening_hours": current_hours.get("weekdayDescriptions", []),
-                "open_now": current_hours.get("openNow"),
-                "next_open_close": current_hours.get("nextOpenTime") or current_hours.get("nextCloseTime"),
-                "regular_hours": regular_hours.get("periods", []),
-                "distance_text": distance_text,
-                "distance_meters": distance_meters,
-                "location": {
-                    "lat": place_lat,
-                    "lng": place_lng
-                },
-                "google_maps_url": place.get("googleMapsUri", f"https://www.google.com/maps/place/?q=place_id:{place_id}")
-            })
-    
+    for (place, place_lat, place_lng, distance_km), road_distance in zip(candidates, road_distances):
+        place_id = place.get("id")
+
+        if road_distance:
+            distance_text = road_distance["distance_text"]
+            distance_meters = road_distance["distance_meters"]
+            duration_text = road_distance["duration_text"]
+        else:
+            # Fallback to straight-line distance
+            distance_text = f"{distance_km:.1f} km"
+            distance_meters = int(distance_km * 1000)
+            duration_text = None
+
+        # Get opening hours
+        current_hours = place.get("currentOpeningHours", {})
+        regular_hours = place.get("regularOpeningHours", {})
+
+        all_places.append({
+            "place_id": place_id,
+            "name": place.get("displayName", {}).get("text", "Unknown"),
+            "address": place.get("formattedAddress", ""),
+            "rating": place.get("rating"),
+            "user_ratings_total": place.get("userRatingCount", 0),
+            "phone": place.get("nationalPhoneNumber"),
+            "website": place.get("websiteUri"),
+            "opening_hours": current_hours.get("weekdayDescriptions", []),
+            "open_now": current_hours.get("openNow"),
+            "next_open_close": current_hours.get("nextOpenTime") or current_hours.get("nextCloseTime"),
+            "regular_hours": regular_hours.get("periods", []),
+            "distance_text": distance_text,
+            "distance_meters": distance_meters,
+            "location": {
+                "lat": place_lat,
+                "lng": place_lng
+            },
+            "google_maps_url": place.get("googleMapsUri", f"https://www.google.com/maps/place/?q=place_id:{place_id}")
+        })
+
     # Sort by distance (nearest first)
     all_places.sort(key=lambda x: x.get("distance_meters") or float('inf'))
     
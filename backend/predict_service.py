@@ -1,20 +1,196 @@
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 import numpy as np
-from PIL import Image
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input as filter_preprocess
-from tensorflow.keras.applications.resnet50 import preprocess_input as severity_preprocess
+from PIL import Image, UnidentifiedImageError
+from dotenv import load_dotenv
+
+from prediction_cache import PredictionCache, bytes_key, pixel_key
 
 IMG_SIZE = 224
 SEVERITY_CLASSES = ["high", "low", "medium"]
+FILTER_CLASSES = ["foot", "random"]
 FOOT_ACCEPT_THRESHOLD = 0.95
 
+FILTER_MODEL_PATH = "./models/dfu_filter_mobilenetv2.h5"
+SEVERITY_MODEL_PATH = "./models/resnet50_3class_phase2_best.h5"
+
+load_dotenv()
+
+# Results keyed by upload bytes and decoded pixels; cleared when a model file changes
+prediction_cache = PredictionCache([FILTER_MODEL_PATH, SEVERITY_MODEL_PATH])
+
+# Compile the serving graphs with XLA (faster on some CPUs, slower first call per batch size)
+INFER_XLA = os.getenv("INFER_XLA", "0") == "1"
+
+# MobileNetV2 ("tf" mode) scales to [-1, 1]; ResNet50 ("caffe" mode) flips to BGR
+# and subtracts the ImageNet channel means. Same maths as keras preprocess_input.
+FILTER_SCALE = np.float32(1.0 / 127.5)
+SEVERITY_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+# Images at least this many times larger than the target are box-reduced first
+RESIZE_REDUCING_GAP = 2.0
+
+# -------------------- Decode limits --------------------
+# Uploads larger than this are refused before decoding
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# Pixel count declared in the image header; anything above is treated as a decompression bomb
+MAX_DECODE_PIXELS = int(os.getenv("MAX_DECODE_PIXELS", str(50_000_000)))
+# Let libjpeg decode at 1/2, 1/4 or 1/8 scale, keeping at least this many pixels per side
+DECODE_JPEG_DRAFT = os.getenv("DECODE_JPEG_DRAFT", "1") == "1"
+DECODE_DRAFT_SIDE = IMG_SIZE * 2
+
+# Pillow's own bomb check fires after ours, as a backstop
+Image.MAX_IMAGE_PIXELS = MAX_DECODE_PIXELS
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes cannot be decoded as an image."""
+
+
+class ImageTooLargeError(InvalidImageError):
+    """Raised when an upload exceeds the byte or pixel limits."""
+
+
+def decode_image(contents: bytes):
+    """
+    Decode uploaded bytes, refusing oversized images before any pixels are
+    decoded. JPEGs are decoded in draft mode, so a 12 MP phone photo is
+    produced at about 1000x750 by libjpeg instead of at full resolution.
+
+    Returns (pil_img, info) where info describes the source and decoded sizes.
+    """
+    if len(contents) > MAX_UPLOAD_BYTES:
+        raise ImageTooLargeError(f"Upload is {len(contents)} bytes, limit is {MAX_UPLOAD_BYTES}")
+
+    try:
+        # Only parses the header; no pixel data is decoded yet
+        pil_img = Image.open(io.BytesIO(contents))
+        width, height = pil_img.size
+        if width * height > MAX_DECODE_PIXELS:
+            raise ImageTooLargeError(f"Image is {width}x{height}, limit is {MAX_DECODE_PIXELS} pixels")
+
+        drafted = False
+        if DECODE_JPEG_DRAFT and pil_img.format == "JPEG":
+            drafted = pil_img.draft("RGB", (DECODE_DRAFT_SIDE, DECODE_DRAFT_SIDE)) is not None
+
+        pil_img.load()
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError) as e:
+        if isinstance(e, ImageTooLargeError):
+            raise
+        raise InvalidImageError(str(e)) from e
+
+    info = {
+        "format": pil_img.format,
+        "source_size": (width, height),
+        "decoded_size": pil_img.size,
+        "draft": drafted,
+        # Pillow holds the decoded raster in memory; this is the request's peak image buffer
+        "decoded_bytes": pil_img.size[0] * pil_img.size[1] * len(pil_img.getbands()),
+    }
+    return pil_img, info
+
+
+class ServingModel:
+    """
+    Serves a Keras model through a traced tf.function with a fixed input spec.
+
+    Model.predict builds a tf.data pipeline and runs callbacks on every call,
+    which costs more than the forward pass for a single image. Calling the
+    traced graph directly skips all of that. Exposes predict(x, verbose=0)
+    so it is a drop-in replacement for the Keras model.
+    """
+
+    def __init__(self, model, name: str = "model", jit_compile: bool = INFER_XLA):
+        # Imported here so route modules can load without pulling in TensorFlow
+        import tensorflow as tf
+
+        self._tf = tf
+        self.model = model
+        self.name = name
+        self.jit_compile = jit_compile
+        self.engine = "keras+xla" if jit_compile else "keras"
+        self._serve = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec([None, IMG_SIZE, IMG_SIZE, 3], tf.float32)],
+            jit_compile=jit_compile,
+        )
+
+    def predict(self, x, verbose=0):
+        return self._serve(self._tf.convert_to_tensor(x, dtype=self._tf.float32)).numpy()
+
+    def warmup(self, batch_sizes=(1,)):
+        """Trace (and with XLA, compile) the graph so the first request doesn't pay for it."""
+        for n in batch_sizes:
+            self.predict(np.zeros((n, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32))
+
+
+def resize_to_input(pil_img):
+    """
+    Resize to IMG_SIZE x IMG_SIZE RGB and return the uint8 pixels (224, 224, 3).
+
+    RGB/L images are resized before converting, so a large photo is never
+    copied at full resolution, and reducing_gap lets Pillow box-reduce by an
+    integer factor before the final bicubic pass.
+    """
+    if pil_img.mode not in ("RGB", "L"):
+        pil_img = pil_img.convert("RGB")
+    pil_img = pil_img.resize((IMG_SIZE, IMG_SIZE), Image.BICUBIC, reducing_gap=RESIZE_REDUCING_GAP)
+    if pil_img.mode != "RGB":
+        pil_img = pil_img.convert("RGB")
+    return np.asarray(pil_img)
+
+
+def filter_normalize(pixels, out=None):
+    """MobileNetV2 preprocessing (x / 127.5 - 1) written straight into out."""
+    out = np.multiply(pixels, FILTER_SCALE, out=out, dtype=np.float32)
+    out -= 1.0
+    return out
+
+
+def severity_normalize(pixels, out=None):
+    """ResNet50 preprocessing (RGB -> BGR, minus channel means) written straight into out."""
+    return np.subtract(pixels[..., ::-1], SEVERITY_MEAN_BGR, out=out, dtype=np.float32)
+
 
 def preprocess_image(pil_img):
-    pil_img = pil_img.convert("RGB").resize((IMG_SIZE, IMG_SIZE))
-    x = np.array(pil_img).astype(np.float32)
+    x = resize_to_input(pil_img).astype(np.float32)
     x = np.expand_dims(x, axis=0)
     return x
 
 
+class PreprocessBuffers:
+    """
+    Preallocated float32 input tensors for one in-flight image. Each inference
+    worker thread owns one set and reuses it for every image it handles, so
+    normalisation allocates nothing per request.
+    """
+
+    def __init__(self):
+        self.filter = np.empty((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        self.severity = np.empty((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+
+
+_thread_buffers = threading.local()
+
+
+def thread_buffers() -> PreprocessBuffers:
+    buffers = getattr(_thread_buffers, "buffers", None)
+    if buffers is None:
+        buffers = PreprocessBuffers()
+        _thread_buffers.buffers = buffers
+    return buffers
+
+
 def softmax_probs(logits_or_probs):
     arr = np.array(logits_or_probs)
 
@@ -47,46 +223,294 @@ def get_filter_probs(foot_random_model, x):
     return p_foot, p_random
 
 
+def filter_probs_batch(raw):
+    """Per-row (p_foot, p_random) arrays for a batched filter output."""
+    raw = np.asarray(raw)
+
+    # sigmoid (n,1)
+    if raw.shape[-1] == 1:
+        p_random = raw[:, 0].astype(np.float64)
+        return 1.0 - p_random, p_random
+
+    # softmax (n,2)
+    probs = np.stack([softmax_probs(row) for row in raw])
+    return probs[:, 0], probs[:, 1]
+
+
 def get_severity_probs(severity_model, x):
     raw = severity_model.predict(x, verbose=0)
     probs = softmax_probs(raw)
     return probs
 
 
-def predict_ulcer(pil_img, foot_random_model, severity_model):
-    x = preprocess_image(pil_img)
+class InferencePipeline:
+    """
+    The single image prediction pipeline used by every upload route.
+
+    Owns both models, preprocessing, the foot acceptance threshold and the
+    class labels, and puts the content-hash cache in front of TensorFlow.
+    Each stage (decode, resize, filter_forward, severity_forward) is timed
+    and reported to any registered timing hooks as hook(stage, seconds, route).
+    """
+
+    STAGES = ("decode", "resize", "filter_forward", "severity_forward")
+
+    def __init__(self, foot_random_model, severity_model, cache=prediction_cache,
+                 foot_accept_threshold: float = FOOT_ACCEPT_THRESHOLD, cascade=None):
+        self.foot_random_model = foot_random_model
+        self.severity_model = severity_model
+        self.cache = cache
+        self.cascade = cascade
+        self.foot_accept_threshold = foot_accept_threshold
+        self.img_size = IMG_SIZE
+        self.severity_classes = SEVERITY_CLASSES
+        self.filter_classes = FILTER_CLASSES
+
+        self._hooks = []
+        self._stage_totals = {stage: [0, 0.0] for stage in self.STAGES}
+        self._decode_totals = {"images": 0, "drafted": 0, "decoded_bytes": 0, "max_decoded_bytes": 0}
+        self._stats_lock = threading.Lock()
+
+    # -------------------- Timing hooks --------------------
+    def add_timing_hook(self, hook):
+        self._hooks.append(hook)
+
+    @contextmanager
+    def _timed(self, stage: str, route=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                totals = self._stage_totals.setdefault(stage, [0, 0.0])
+                totals[0] += 1
+                totals[1] += elapsed
+            for hook in self._hooks:
+                try:
+                    hook(stage, elapsed, route)
+                except Exception as e:
+                    print(f"[PIPELINE] Timing hook failed: {e}")
+
+    # -------------------- Stages --------------------
+    def decode(self, contents: bytes, route=None):
+        # Per-image timings go to the decode stage histogram and these totals, not the log
+        with self._timed("decode", route):
+            pil_img, info = decode_image(contents)
+
+        with self._stats_lock:
+            self._decode_totals["images"] += 1
+            self._decode_totals["drafted"] += int(info["draft"])
+            self._decode_totals["decoded_bytes"] += info["decoded_bytes"]
+            self._decode_totals["max_decoded_bytes"] = max(
+                self._decode_totals["max_decoded_bytes"], info["decoded_bytes"]
+            )
+        return pil_img
+
+    def preprocess(self, pil_img, route=None):
+        """Resize to the model input size. Returns uint8 pixels (224, 224, 3)."""
+        with self._timed("resize", route):
+            return resize_to_input(pil_img)
+
+    def filter_probs(self, pixels, route=None):
+        x = filter_normalize(pixels, out=thread_buffers().filter[0])
+        with self._timed("filter_forward", route):
+            return get_filter_probs(self.foot_random_model, x[np.newaxis])
+
+    def severity_probs(self, pixels, route=None, speculative=None):
+        if speculative is not None:
+            # Already queued by the cascade scheduler; just wait for it
+            with self._timed("severity_forward", route):
+                return softmax_probs(speculative.result())
 
-    # FILTER
-    x_filter = filter_preprocess(x.copy())
-    p_foot, p_random = get_filter_probs(foot_random_model, x_filter)
+        x = severity_normalize(pixels, out=thread_buffers().severity[0])
+        with self._timed("severity_forward", route):
+            return get_severity_probs(self.severity_model, x[np.newaxis])
+
+    # -------------------- Prediction --------------------
+    def predict(self, pil_img, route=None, pixels=None):
+        """Run filter then severity on one PIL image. Returns the predict_ulcer result dict."""
+        if pixels is None:
+            pixels = self.preprocess(pil_img, route)
+
+        # Speculative severity pass, queued alongside the filter
+        speculative = None
+        if self.cascade is not None and self.cascade.should_speculate():
+            x_sev = severity_normalize(pixels, out=thread_buffers().severity[0])
+            speculative = self.cascade.speculate(x_sev[np.newaxis])
+
+        # FILTER
+        p_foot, p_random = self.filter_probs(pixels, route)
+
+        accepted = p_foot >= self.foot_accept_threshold
+        if self.cascade is not None:
+            self.cascade.record_filter(accepted, speculative)
+
+        if not accepted:
+            return self._build_result(p_foot, p_random)
+
+        # SEVERITY
+        sev_probs = self.severity_probs(pixels, route, speculative=speculative)
+        return self._build_result(p_foot, p_random, sev_probs)
+
+    def _build_result(self, p_foot, p_random, sev_probs=None):
+        if sev_probs is None:
+            return {
+                "status": "REJECTED",
+                "is_foot": False,
+                "p_foot": float(p_foot),
+                "p_random": float(p_random),
+                "severity": None,
+                "confidence": None,
+                "probabilities": None
+            }
+
+        pred_idx = int(np.argmax(sev_probs))
+        pred_label = self.severity_classes[pred_idx]
+        confidence = float(sev_probs[pred_idx])
+
+        probs_dict = {self.severity_classes[i]: float(sev_probs[i]) for i in range(len(self.severity_classes))}
 
-    if p_foot < FOOT_ACCEPT_THRESHOLD:
         return {
-            "status": "REJECTED",
-            "is_foot": False,
+            "status": "ACCEPTED",
+            "is_foot": True,
             "p_foot": float(p_foot),
             "p_random": float(p_random),
-            "severity": None,
-            "confidence": None,
-            "probabilities": None
+            "severity": pred_label,
+            "confidence": confidence,
+            "probabilities": probs_dict
         }
 
-    # SEVERITY
-    x_sev = severity_preprocess(x.copy())
-    sev_probs = get_severity_probs(severity_model, x_sev)
-
-    pred_idx = int(np.argmax(sev_probs))
-    pred_label = SEVERITY_CLASSES[pred_idx]
-    confidence = float(sev_probs[pred_idx])
-
-    probs_dict = {SEVERITY_CLASSES[i]: float(sev_probs[i]) for i in range(len(SEVERITY_CLASSES))}
-
-    return {
-        "status": "ACCEPTED",
-        "is_foot": True,
-        "p_foot": float(p_foot),
-        "p_random": float(p_random),
-        "severity": pred_label,
-        "confidence": confidence,
-        "probabilities": probs_dict
-    }
\ No newline at end of file
+    # -------------------- Batch prediction --------------------
+    def prepare(self, contents: bytes, route=None):
+        """
+        Decode and resize one upload for predict_batch. Returns (cached_result, None)
+        when the cache already knows the image, otherwise (None, pixels).
+        """
+        if self.cache is not None:
+            result = self.cache.get(bytes_key(contents))
+            if result is not None:
+                return result, None
+
+        pixels = self.preprocess(self.decode(contents, route), route)
+
+        if self.cache is not None:
+            result = self.cache.get(pixel_key(pixels))
+            if result is not None:
+                return result, None
+
+        return None, pixels
+
+    def predict_batch(self, pixels_list, route=None, contents_list=None):
+        """
+        Run many prepared images through both models as real batched tensors:
+        one filter pass over the whole list, then one severity pass over the
+        accepted subset. Returns predict_ulcer-shaped dicts in input order.
+        """
+        n = len(pixels_list)
+        if n == 0:
+            return []
+
+        x = np.empty((n, self.img_size, self.img_size, 3), dtype=np.float32)
+        for i, pixels in enumerate(pixels_list):
+            filter_normalize(pixels, out=x[i])
+        with self._timed("filter_forward", route):
+            p_foot, p_random = filter_probs_batch(self.foot_random_model.predict(x, verbose=0))
+
+        accepted = [i for i in range(n) if p_foot[i] >= self.foot_accept_threshold]
+        if self.cascade is not None:
+            for i in range(n):
+                self.cascade.record_filter(p_foot[i] >= self.foot_accept_threshold)
+
+        sev_rows = {}
+        if accepted:
+            # Reuse the filter buffer for the accepted subset
+            xs = x[:len(accepted)]
+            for row, i in enumerate(accepted):
+                severity_normalize(pixels_list[i], out=xs[row])
+            with self._timed("severity_forward", route):
+                raw = np.asarray(self.severity_model.predict(xs, verbose=0))
+            sev_rows = {i: softmax_probs(raw[row]) for row, i in enumerate(accepted)}
+
+        results = [self._build_result(p_foot[i], p_random[i], sev_rows.get(i)) for i in range(n)]
+
+        if self.cache is not None:
+            for i, result in enumerate(results):
+                self.cache.record_miss()
+                self.cache.put(pixel_key(pixels_list[i]), result)
+                if contents_list is not None:
+                    self.cache.put(bytes_key(contents_list[i]), result)
+
+        return results
+
+    def predict_bytes(self, contents: bytes, route=None):
+        """
+        Full path for an uploaded file. Duplicate uploads (same bytes, or a
+        re-encoded copy with the same pixels) return the cached result without
+        touching TensorFlow. Raises InvalidImageError for undecodable files.
+        """
+        if self.cache is None:
+            return self.predict(self.decode(contents, route), route)
+
+        b_key = bytes_key(contents)
+        result = self.cache.get(b_key)
+        if result is not None:
+            return result
+
+        pil_img = self.decode(contents, route)
+        pixels = self.preprocess(pil_img, route)
+        p_key = pixel_key(pixels)
+        result = self.cache.get(p_key)
+        if result is None:
+            self.cache.record_miss()
+            result = self.predict(pil_img, route, pixels=pixels)
+            self.cache.put(p_key, result)
+
+        self.cache.put(b_key, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = {
+                stage: {
+                    "count": count,
+                    "avg_ms": round(total * 1000.0 / count, 3) if count else 0.0,
+                }
+                for stage, (count, total) in self._stage_totals.items()
+            }
+            images = self._decode_totals["images"]
+            stats["decode"].update({
+                "jpeg_draft": self._decode_totals["drafted"],
+                "avg_decoded_bytes": self._decode_totals["decoded_bytes"] // images if images else 0,
+                "max_decoded_bytes": self._decode_totals["max_decoded_bytes"],
+                # Process-wide high-water mark (KB on Linux)
+                "process_max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+            })
+            return stats
+
+
+# Set from main.py once the models are loaded
+pipeline = None
+# Timing hooks attached to every pipeline installed with set_pipeline (e.g. metrics)
+pipeline_timing_hooks = []
+
+
+def set_pipeline(p: InferencePipeline):
+    global pipeline
+    for hook in pipeline_timing_hooks:
+        p.add_timing_hook(hook)
+    pipeline = p
+
+
+def add_pipeline_timing_hook(hook):
+    pipeline_timing_hooks.append(hook)
+    if pipeline is not None:
+        pipeline.add_timing_hook(hook)
+
+
+def get_pipeline():
+    return pipeline
+
+
+def predict_ulcer(pil_img, foot_random_model, severity_model):
+    return InferencePipeline(foot_random_model, severity_model, cache=None).predict(pil_img)
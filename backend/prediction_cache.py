@@ -0,0 +1,143 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "2048"))
+PREDICTION_CACHE_MAX_BYTES = int(os.getenv("PREDICTION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+# How often (seconds) the model files are re-checked for changes
+PREDICTION_CACHE_CHECK_INTERVAL = float(os.getenv("PREDICTION_CACHE_CHECK_INTERVAL", "5"))
+
+# Rough per-entry overhead of the OrderedDict slot, key string and dict object
+_ENTRY_OVERHEAD = 400
+
+
+def bytes_key(contents: bytes) -> str:
+    """Key for the raw uploaded file."""
+    return "b:" + hashlib.blake2b(contents, digest_size=20).hexdigest()
+
+
+def pixel_key(x) -> str:
+    """Key for the decoded 224x224 pixels (catches re-encoded copies of the same photo)."""
+    return "p:" + hashlib.blake2b(x.tobytes(), digest_size=20).hexdigest()
+
+
+class PredictionCache:
+    """
+    LRU cache of predict_ulcer result dicts, bounded by entry count and an
+    approximate byte budget. The whole cache is dropped when any of the model
+    files changes on disk, so a redeployed model never serves stale results.
+    """
+
+    def __init__(self, model_paths=(), max_entries: int = PREDICTION_CACHE_MAX_ENTRIES,
+                 max_bytes: int = PREDICTION_CACHE_MAX_BYTES):
+        self.model_paths = tuple(model_paths)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._fingerprint = self._model_fingerprint()
+        self._next_check = time.monotonic() + PREDICTION_CACHE_CHECK_INTERVAL
+
+        self.hits = {"bytes": 0, "pixels": 0}
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # -------------------- Model invalidation --------------------
+    def _model_fingerprint(self):
+        fingerprint = []
+        for path in self.model_paths:
+            try:
+                st = os.stat(path)
+                fingerprint.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def _check_models(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + PREDICTION_CACHE_CHECK_INTERVAL
+
+        fingerprint = self._model_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+            print("[PREDICTION CACHE] Model files changed, cache cleared")
+
+    def set_model_paths(self, model_paths):
+        with self._lock:
+            self.model_paths = tuple(model_paths)
+            self._fingerprint = self._model_fingerprint()
+            self._entries.clear()
+            self._bytes = 0
+
+    # -------------------- Lookup / store --------------------
+    def get(self, key: str):
+        with self._lock:
+            self._check_models()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits["bytes" if key.startswith("b:") else "pixels"] += 1
+            return copy.deepcopy(entry[0])
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, result: dict):
+        size = len(json.dumps(result, default=str)) + len(key) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (copy.deepcopy(result), size)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.hits["bytes"] + self.hits["pixels"]
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "approx_bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits_bytes": self.hits["bytes"],
+                "hits_pixels": self.hits["pixels"],
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,183 @@
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------- Config --------------------
+# Token budget for the context block (patient details + recent conversation)
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "800"))
+# Most recent messages considered for the conversation part
+PROMPT_HISTORY_MESSAGES = int(os.getenv("PROMPT_HISTORY_MESSAGES", "10"))
+# Longer messages (e.g. the final recommendation) are clipped to this many tokens
+PROMPT_MESSAGE_TOKENS = int(os.getenv("PROMPT_MESSAGE_TOKENS", "120"))
+# Chats whose rendered history is kept in memory
+PROMPT_CACHE_CHATS = int(os.getenv("PROMPT_CACHE_CHATS", "2000"))
+
+# Only what matters clinically; workflow fields (qa_active, retry_count, ...) stay out
+CLINICAL_FIELDS = {
+    "severity": "Ulcer severity (image model)",
+    "ulcer_duration_days": "Ulcer duration (days)",
+    "discharge": "Pus / discharge",
+    "fever": "Fever",
+    "black_tissue": "Black tissue",
+    "blood_sugar_recent": "Recent blood sugar",
+    "redness_swelling": "Redness / swelling",
+    "pain_level": "Pain (0-10)",
+    "notes": "Notes",
+}
+
+ROLE_NAMES = {"user": "Patient", "assistant": "Assistant"}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate for Llama-family tokenizers: about four characters
+    per token for English, never less than one token per word.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(text.split()))
+
+
+def clip_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max_tokens * 4].rsplit(" ", 1)[0] + " …"
+
+
+def _format_value(value) -> str:
+    if value is True:
+        return "yes"
+    if value is False:
+        return "no"
+    return str(value)
+
+
+def render_patient_details(state: dict) -> str:
+    lines = [
+        f"- {label}: {_format_value(state[key])}"
+        for key, label in CLINICAL_FIELDS.items()
+        if state.get(key) not in (None, "")
+    ]
+    return "Patient details:\n" + "\n".join(lines) if lines else ""
+
+
+class PromptBuilder:
+    """
+    Builds the context block for LLM prompts: clinically relevant patient
+    state plus as much recent conversation as fits the token budget.
+
+    Rendered conversation lines are cached per chat together with the id of
+    the last message seen, so each turn only fetches and renders the messages
+    added since the previous one.
+    """
+
+    def __init__(self, budget: int = PROMPT_CONTEXT_TOKENS, max_messages: int = PROMPT_HISTORY_MESSAGES,
+                 max_message_tokens: int = PROMPT_MESSAGE_TOKENS, max_chats: int = PROMPT_CACHE_CHATS):
+        self.budget = budget
+        self.max_messages = max_messages
+        self.max_message_tokens = max_message_tokens
+        self.max_chats = max_chats
+
+        self._chats = OrderedDict()  # chat key -> {"last_id", "lines": deque[(text, tokens)]}
+        self._lock = threading.Lock()
+
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.cache_hits = 0
+        self.messages_dropped = 0
+
+    def _render(self, rows):
+        rendered = []
+        for _, role, content in rows:
+            text = f"{ROLE_NAMES.get(role, role)}: {clip_to_tokens(content.strip(), self.max_message_tokens)}"
+            rendered.append((text, estimate_tokens(text)))
+        return rendered
+
+    def _history(self, chat_key, fetch_since):
+        if chat_key is None:
+            return self._render(fetch_since(None))[-self.max_messages:]
+
+        with self._lock:
+            cached = self._chats.get(chat_key)
+            if cached is not None:
+                self._chats.move_to_end(chat_key)
+                self.cache_hits += 1
+            last_id = cached["last_id"] if cached else None
+
+        # fetch_since(last_id) -> [(id, role, content)] oldest first, at most max_messages
+        new_rows = fetch_since(last_id)
+        rendered = self._render(new_rows)
+
+        with self._lock:
+            entry = self._chats.get(chat_key)
+            if entry is None:
+                entry = self._chats[chat_key] = {"last_id": None, "lines": deque(maxlen=self.max_messages)}
+                while len(self._chats) > self.max_chats:
+                    self._chats.popitem(last=False)
+            # A concurrent turn on the same chat may already have added some of these
+            for (row_id, _, _), line in zip(new_rows, rendered):
+                if entry["last_id"] is None or row_id > entry["last_id"]:
+                    entry["lines"].append(line)
+                    entry["last_id"] = row_id
+            return list(entry["lines"])
+
+    def build(self, chat_key, state: dict, fetch_since) -> str:
+        """
+        Context block for one prompt, within the token budget. chat_key=None
+        skips the per-chat cache (in-memory guest conversations).
+        """
+        details = render_patient_details(state)
+        used = estimate_tokens(details)
+
+        kept = []
+        lines = self._history(chat_key, fetch_since)
+        for text, tokens in reversed(lines):
+            if used + tokens > self.budget:
+                break
+            kept.append(text)
+            used += tokens
+
+        parts = [details] if details else []
+        if kept:
+            parts.append("Recent conversation:\n" + "\n".join(reversed(kept)))
+
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens += used
+            self.max_prompt_tokens = max(self.max_prompt_tokens, used)
+            self.messages_dropped += len(lines) - len(kept)
+        return "\n\n".join(parts)
+
+    def forget(self, chat_key):
+        """Drop a chat's cached history; call when the chat is deleted."""
+        with self._lock:
+            self._chats.pop(chat_key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "token_budget": self.budget,
+                "prompts": self.prompts,
+                "avg_context_tokens": round(self.prompt_tokens / self.prompts, 1) if self.prompts else 0.0,
+                "max_context_tokens": self.max_prompt_tokens,
+                "history_cache_hits": self.cache_hits,
+                "cached_chats": len(self._chats),
+                "messages_dropped_for_budget": self.messages_dropped,
+            }
+
+
+prompt_builder = PromptBuilder()
+
+
+def list_fetcher(messages: list):
+    """fetch_since for an in-memory message list (guest sessions), used with chat_key=None."""
+    def fetch_since(last_id):
+        recent = messages[-PROMPT_HISTORY_MESSAGES:]
+        return [(i, m["role"], m["content"]) for i, m in enumerate(recent)]
+    return fetch_since
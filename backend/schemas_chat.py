@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 
 class CreateChatResponse(BaseModel):
@@ -13,6 +13,8 @@ class ChatHistoryItem(BaseModel):
     chat_id: int
     title: str
     created_at: datetime
+    last_message: Optional[str] = None  # preview, clipped
+    latest_severity: Optional[str] = None
 
 
 class MessageCreateRequest(BaseModel):
@@ -33,7 +35,9 @@ class ChatWithMessagesResponse(BaseModel):
     chat_id: int
     title: str
     created_at: datetime
-    messages: List[MessageResponse]
+    messages: List[MessageResponse]  # oldest first
+    next_cursor: Optional[str] = None  # pass as ?before= to load older messages
+    has_more: bool = False
 
 class AIMessageRequest(BaseModel):
     content: str
\ No newline at end of file
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Modules read their config at import time, so the environment is set before any import.
+# DATABASE_URL is overridden, never defaulted: the tests create and fill tables.
+_tmp = tempfile.mkdtemp(prefix="diasure-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["GUEST_STORE_BACKEND"] = "memory"
+os.environ["PLACES_CACHE_FILE"] = ""
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("JWT_SECRET_KEY", "test")
+os.environ.setdefault("GOOGLE_PLACES_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,62 @@
+import threading
+
+import numpy as np
+
+from batch_inference import MicroBatcher
+
+
+class RecordingModel:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, x, verbose=0):
+        self.batch_sizes.append(x.shape[0])
+        return x.reshape(x.shape[0], -1).sum(axis=1, keepdims=True)
+
+
+def test_concurrent_requests_share_a_forward_pass_and_get_their_own_rows():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, "test", max_batch_size=8, max_wait_ms=200)
+    results = {}
+
+    def call(i):
+        results[i] = batcher.predict(np.full((1, 2, 2, 1), i, dtype=np.float32))
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert sum(model.batch_sizes) == 4 and len(model.batch_sizes) < 4
+    assert all(results[i][0, 0] == 4 * i for i in range(4))
+
+
+def test_stats_count_rows_not_requests():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, "test", max_batch_size=8, max_wait_ms=0)
+
+    batcher.predict(np.ones((6, 2, 2, 1), dtype=np.float32))
+    stats = batcher.stats()
+    batcher.close()
+
+    assert stats["batches"] == 1 and stats["requests"] == 1
+    assert stats["avg_batch_size"] == 6 and stats["largest_batch"] == 6
+    assert stats["batch_fill_ratio"] == 0.75
+
+
+def test_model_errors_reach_every_caller():
+    class Broken:
+        def predict(self, x, verbose=0):
+            raise RuntimeError("boom")
+
+    batcher = MicroBatcher(Broken(), "test", max_wait_ms=0)
+    future = batcher.submit(np.ones((1, 2, 2, 1), dtype=np.float32))
+    try:
+        future.result(timeout=5)
+        raised = False
+    except RuntimeError:
+        raised = True
+    batcher.close()
+    assert raised
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+import prediction_cache as pc
+from llm_cache import LLMResponseCache, normalize_question
+from prediction_cache import PredictionCache, bytes_key, pixel_key
+
+RESULT = {"is_foot": True, "p_foot": 0.9, "p_random": 0.1, "severity": "low"}
+
+
+# -------------------- Prediction cache --------------------
+def test_prediction_keys():
+    x = np.zeros((2, 2, 3), dtype=np.float32)
+    assert bytes_key(b"abc") == bytes_key(b"abc") != bytes_key(b"abd")
+    assert bytes_key(b"abc").startswith("b:") and pixel_key(x).startswith("p:")
+    assert pixel_key(x) != pixel_key(x + 1)
+
+
+def test_prediction_cache_returns_copies():
+    cache = PredictionCache()
+    cache.put("b:1", RESULT)
+    cache.get("b:1")["severity"] = "high"
+    assert cache.get("b:1")["severity"] == "low"
+
+
+def test_prediction_cache_evicts_least_recently_used():
+    cache = PredictionCache(max_entries=2)
+    cache.put("b:1", RESULT)
+    cache.put("b:2", RESULT)
+    cache.get("b:1")
+    cache.put("b:3", RESULT)
+
+    assert cache.get("b:2") is None
+    assert cache.get("b:1") is not None and cache.get("b:3") is not None
+
+
+def test_prediction_cache_byte_budget():
+    cache = PredictionCache(max_bytes=1200)
+    for i in range(5):
+        cache.put(f"b:{i}", RESULT)
+    assert 0 < cache.stats()["entries"] < 5
+    assert cache.get("b:4") is not None
+
+    cache.put("b:huge", {"x": "y" * 5000})  # bigger than the whole budget: not stored
+    assert cache.get("b:huge") is None
+
+
+def test_prediction_cache_clears_when_a_model_file_changes(tmp_path, monkeypatch):
+    model = tmp_path / "model.h5"
+    model.write_bytes(b"v1")
+    monkeypatch.setattr(pc, "PREDICTION_CACHE_CHECK_INTERVAL", 0)
+    cache = PredictionCache(model_paths=[str(model)])
+    cache.put("b:1", RESULT)
+
+    model.write_bytes(b"version 2")
+
+    assert cache.get("b:1") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+# -------------------- LLM cache --------------------
+SYSTEM = "You are a diabetic foot care assistant."
+
+
+def test_question_normalization():
+    assert normalize_question("Hi, What is a Diabetic Foot Ulcer??") == "what is a diabetic foot ulcer"
+    assert normalize_question("I don't have fever") == "i do not have fever"
+
+
+def test_llm_cache_exact_and_similar_hits():
+    cache = LLMResponseCache(min_similarity=0.6)
+    cache.put(SYSTEM, "what are the early signs of a diabetic foot ulcer", "answer")
+
+    assert cache.get(SYSTEM, "What are the early signs of a diabetic foot ulcer?") == "answer"
+    assert cache.get(SYSTEM, "what are the early signs of diabetic foot ulcer") == "answer"
+    assert cache.stats()["hits_exact"] == 1 and cache.stats()["hits_similar"] == 1
+
+
+@pytest.mark.parametrize("question", [
+    "can i not walk with a diabetic foot ulcer on my heel",
+    "can i never walk with a diabetic foot ulcer on my heel",
+    "can i walk with a diabetic foot ulcer without my heel",
+])
+def test_llm_cache_never_answers_across_a_negation(question):
+    cache = LLMResponseCache(min_similarity=0.5)
+    cache.put(SYSTEM, "can i walk with a diabetic foot ulcer on my heel", "yes, carefully")
+    assert cache.get(SYSTEM, question) is None
+
+
+def test_llm_cache_never_answers_across_a_number():
+    cache = LLMResponseCache(min_similarity=0.5)
+    cache.put(SYSTEM, "is a blood sugar of 180 too high for healing", "answer")
+    assert cache.get(SYSTEM, "is a blood sugar of 280 too high for healing") is None
+
+
+def test_llm_cache_is_scoped_by_prompt_and_model():
+    cache = LLMResponseCache()
+    cache.put(SYSTEM, "what is a foot ulcer", "answer", model="a")
+    assert cache.get(SYSTEM, "what is a foot ulcer", model="b") is None
+    assert cache.get("Another prompt", "what is a foot ulcer", model="a") is None
+
+
+def test_llm_cache_evicts_and_unindexes():
+    cache = LLMResponseCache(max_entries=2)
+    for i, topic in enumerate(["fever", "swelling", "discharge"]):
+        cache.put(SYSTEM, f"what does {topic} around the ulcer mean", f"answer {i}")
+
+    assert cache.get(SYSTEM, "what does fever around the ulcer mean") is None
+    assert cache.stats()["evictions"] == 1
+    assert all(keys <= cache._entries.keys() for keys in cache._index.values())
+
+
+def test_llm_cache_expires():
+    cache = LLMResponseCache(ttl=10)
+    cache.put(SYSTEM, "what is a foot ulcer", "answer")
+
+    for entry in cache._entries.values():
+        entry["expires"] -= 11
+    assert cache.get(SYSTEM, "what is a foot ulcer") is None
+    assert cache.stats()["expirations"] == 1
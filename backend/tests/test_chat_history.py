@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from auth_routes import get_current_user
+from chat_routes import router, encode_cursor, decode_cursor, etag_matches
+from database import Base, SessionLocal, engine
+from models_db import Chat, Message, User
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = User(name="Test", email="test@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def client(user):
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_current_user] = lambda: user
+    return TestClient(app)
+
+
+def add_chats(db, user, n):
+    start = datetime(2026, 1, 1)
+    chats = [Chat(user_id=user.id, title=f"Chat {i}", created_at=start + timedelta(minutes=i)) for i in range(n)]
+    db.add_all(chats)
+    db.commit()
+    return chats
+
+
+# -------------------- Cursors --------------------
+def test_cursor_round_trip():
+    created_at = datetime(2026, 3, 4, 5, 6, 7, 891011)
+    cursor = encode_cursor(created_at, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "", encode_cursor(datetime(2026, 1, 1), 1)[:-3] + "!!!"])
+def test_bad_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_history_pages_cover_every_chat_once(client, db, user):
+    add_chats(db, user, 7)
+
+    seen, cursor = [], None
+    while True:
+        response = client.get("/chat/history", params={"limit": 3, **({"before": cursor} if cursor else {})})
+        assert response.status_code == 200
+        seen += [item["title"] for item in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == [f"Chat {i}" for i in reversed(range(7))]
+
+
+def test_history_rejects_bad_cursor(client):
+    assert client.get("/chat/history", params={"before": "garbage"}).status_code == 400
+
+
+def test_messages_page_backwards(client, db, user):
+    chat = add_chats(db, user, 1)[0]
+    db.add_all([Message(chat_id=chat.id, role="user", content=f"m{i}",
+                        created_at=datetime(2026, 1, 1) + timedelta(seconds=i)) for i in range(5)])
+    db.commit()
+
+    first = client.get(f"/chat/{chat.id}", params={"limit": 3}).json()
+    older = client.get(f"/chat/{chat.id}", params={"limit": 3, "before": first["next_cursor"]}).json()
+
+    assert [m["content"] for m in first["messages"]] == ["m2", "m3", "m4"]
+    assert [m["content"] for m in older["messages"]] == ["m0", "m1"]
+    assert not older["has_more"]
+
+
+# -------------------- ETag / 304 --------------------
+def test_unchanged_history_is_304(client, db, user):
+    add_chats(db, user, 2)
+    first = client.get("/chat/history")
+    etag = first.headers["ETag"]
+
+    again = client.get("/chat/history", headers={"If-None-Match": etag})
+
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+    assert again.headers["Cache-Control"] == "private, no-cache"
+
+
+def test_new_message_changes_etag(client, db, user):
+    chat = add_chats(db, user, 1)[0]
+    etag = client.get("/chat/history").headers["ETag"]
+
+    db.add(Message(chat_id=chat.id, role="user", content="hello"))
+    db.commit()
+    response = client.get("/chat/history", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["last_message"] == "hello"
+
+
+def test_etag_depends_on_page(client, db, user):
+    add_chats(db, user, 3)
+    assert client.get("/chat/history", params={"limit": 1}).headers["ETag"] != \
+        client.get("/chat/history", params={"limit": 2}).headers["ETag"]
+
+
+def test_etag_matching():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
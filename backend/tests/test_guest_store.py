@@ -0,0 +1,52 @@
+from guest_store import GuestSessionStore, decode_session, encode_session, new_session
+
+
+def test_sessions_expire():
+    store = GuestSessionStore(ttl=10)
+    session_id = store.create()
+
+    store._sessions[session_id]["last_seen"] -= 11
+    assert store.get(session_id) is None
+    assert store.stats()["expired"] == 1
+
+
+def test_least_recently_used_session_is_evicted():
+    store = GuestSessionStore(max_sessions=2)
+    a, b = store.create(), store.create()
+    store.get(a)
+    c = store.create()
+
+    assert store.get(b) is None
+    assert store.get(a) is not None and store.get(c) is not None
+
+
+def test_save_applies_the_byte_cap_right_away():
+    store = GuestSessionStore(max_bytes=6000)
+    idle, active = store.create(), store.create()
+    session = store.get(active)
+
+    session["messages"].append({"role": "user", "content": "x" * 5000})
+    store.save(active, session)
+
+    stats = store.stats()
+    assert stats["evicted_for_bytes"] == 1 and stats["sessions"] == 1
+    assert stats["approx_bytes"] > 5000
+    assert store.get(idle) is None
+
+
+def test_save_keeps_only_the_newest_messages():
+    store = GuestSessionStore(max_messages=3)
+    session_id = store.create()
+    session = store.get(session_id)
+    session["messages"] += [{"role": "user", "content": str(i)} for i in range(5)]
+    store.save(session_id, session)
+
+    assert [m["content"] for m in store.get(session_id)["messages"]] == ["2", "3", "4"]
+
+
+def test_encoded_session_round_trip():
+    session = new_session()
+    session["state"]["severity"] = "high"
+    session["messages"].append({"role": "user", "content": "hello"})
+
+    assert decode_session(encode_session(session)) == session
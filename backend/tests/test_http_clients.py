@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+
+import http_clients
+from http_clients import CircuitBreaker, CircuitOpenError, OutboundHTTP
+
+URL = "https://example.test/api"
+
+
+def outbound(handler, monkeypatch):
+    monkeypatch.setattr(http_clients, "HTTP_RETRY_BACKOFF", 0)
+    client = OutboundHTTP()
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_breaker_opens_after_threshold_and_half_opens():
+    breaker = CircuitBreaker(threshold=2, reset_after=10)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    breaker.opened_at -= 10
+    assert breaker.allow()  # the one trial request
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_retries_then_returns_last_error_response(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    client = outbound(handler, monkeypatch)
+    response = asyncio.run(client.request("GET", URL, upstream="test", retries=2))
+
+    assert response.status_code == 503
+    assert len(calls) == 3
+    assert client.breaker("example.test").failures == 3
+
+
+def test_open_circuit_short_circuits(monkeypatch):
+    client = outbound(lambda request: httpx.Response(500), monkeypatch)
+    breaker = client.breaker("example.test")
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.request("GET", URL, upstream="test"))
+    assert client.stats()["short_circuited"] == 1
+
+
+def test_cancelled_trial_releases_the_half_open_slot(monkeypatch):
+    async def slow(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    client = outbound(slow, monkeypatch)
+    breaker = client.breaker("example.test")
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+    breaker.opened_at -= breaker.reset_after
+
+    async def cancelled_trial():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.request("GET", URL, upstream="test"), 0.05)
+
+    asyncio.run(cancelled_trial())
+
+    assert not breaker.trial_running
+    assert breaker.allow()
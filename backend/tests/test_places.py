@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import http_clients
+import places_routes
+from http_clients import outbound_http
+from places_cache import PlacesCache, places_cache
+
+LAT, LNG = 28.6139, 77.2090
+
+
+def place(place_id, lat=LAT + 0.005, lng=LNG):
+    return {"id": place_id, "displayName": {"text": place_id}, "location": {"latitude": lat, "longitude": lng}}
+
+
+def road(n):
+    return {"distance": {"text": f"{n} km", "value": n * 1000}, "duration": {"text": f"{n} mins"}, "status": "OK"}
+
+
+class FakeGoogle:
+    """Answers Text Search and Distance Matrix requests from canned responses."""
+
+    def __init__(self, search=None, distance_status="OK"):
+        # text query -> (status code, places)
+        self.search = search or {}
+        self.distance_status = distance_status
+        self.search_bodies = []
+
+    def __call__(self, request: httpx.Request):
+        if request.url.path == "/v1/places:searchText":
+            body = json.loads(request.content)
+            self.search_bodies.append(body)
+            status, places = self.search.get(body["textQuery"], (200, []))
+            payload = {"places": places} if status == 200 else {"error": {"code": status}}
+            return httpx.Response(status, json=payload)
+
+        destinations = request.url.params["destinations"].split("|")
+        if self.distance_status != "OK":
+            return httpx.Response(200, json={"status": self.distance_status})
+        return httpx.Response(200, json={"status": "OK", "rows": [{"elements": [road(1) for _ in destinations]}]})
+
+
+@pytest.fixture
+def google(monkeypatch):
+    fake = FakeGoogle()
+    monkeypatch.setattr(http_clients, "HTTP_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(outbound_http, "_client", httpx.AsyncClient(transport=httpx.MockTransport(fake)))
+    monkeypatch.setattr(outbound_http, "_breakers", {})
+    places_cache.clear()
+    yield fake
+    places_cache.clear()
+
+
+def nearby(radius=5000, doctor_types=None):
+    return asyncio.run(places_routes.get_nearby_doctors(
+        latitude=LAT, longitude=LNG, radius=radius, doctor_types=doctor_types
+    ))
+
+
+# -------------------- Failure paths --------------------
+@pytest.mark.parametrize("status", [403, 429, 500])
+def test_error_status_counts_as_failed_search(google, status):
+    google.search["hospital near me"] = (status, [place("a")])
+
+    places, failed = asyncio.run(places_routes.search_all(["hospital near me"], LAT, LNG, 5000))
+
+    assert places == [] and failed == 1
+
+
+def test_every_search_failing_is_502_and_not_cached(google):
+    google.search["hospital near me"] = (403, [])
+
+    with pytest.raises(HTTPException) as exc:
+        nearby()
+
+    assert exc.value.status_code == 502
+    assert places_cache.stats()["entries"] == 0
+
+
+def test_partial_search_failure_is_served_but_not_cached(google):
+    google.search["podiatrist doctor near me"] = (200, [place("pod")])
+    google.search["physician doctor near me"] = (503, [])
+
+    result = nearby(doctor_types="podiatrist,physician")
+
+    assert [p["place_id"] for p in result["places"]] == ["pod"]
+    assert places_cache.stats()["entries"] == 0
+
+
+def test_missing_road_distances_are_not_cached(google):
+    google.search["hospital near me"] = (200, [place("a")])
+    google.distance_status = "OVER_QUERY_LIMIT"
+
+    result = nearby()
+
+    assert result["places"][0]["distance_text"].endswith(" km")  # straight-line fallback
+    assert places_cache.stats()["entries"] == 0
+
+
+# -------------------- Caching --------------------
+def test_complete_result_is_cached_and_reused(google):
+    google.search["hospital near me"] = (200, [place("a"), place("far", lat=LAT + 1)])
+
+    first = nearby()
+    second = nearby()
+
+    assert len(google.search_bodies) == 1
+    assert [p["place_id"] for p in first["places"]] == ["a"]
+    assert [p["place_id"] for p in second["places"]] == ["a"]
+
+
+def test_search_covers_the_requested_radius(google):
+    nearby(radius=3000)
+    nearby(radius=80000)
+
+    radii = [body["locationBias"]["circle"]["radius"] for body in google.search_bodies]
+    assert radii == [3000.0, float(places_routes.PLACES_MAX_SEARCH_RADIUS)]
+
+
+def test_cache_key_ignores_doctor_type_order():
+    assert PlacesCache.key(LAT, LNG, 5000, ["physician", "podiatrist"]) == \
+        PlacesCache.key(LAT, LNG, 5000, ["podiatrist", "physician"])
+    assert PlacesCache.key(LAT, LNG, 5000, []) != PlacesCache.key(LAT, LNG, 3000, [])
+
+
+def test_places_cache_evicts_least_recently_used():
+    cache = PlacesCache(max_entries=2, path="")
+    for key in ("a", "b"):
+        cache.put(key, [place(key)], (LAT, LNG), {})
+    cache.get("a")
+    cache.put("c", [place("c")], (LAT, LNG), {})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_places_cache_expires_records_and_opening_hours():
+    cache = PlacesCache(ttl=100, hours_ttl=10, path="")
+    cache.put("k", [place("a")], (LAT, LNG), {})
+
+    entry, hours_stale = cache.get("k")
+    assert not hours_stale
+    entry["hours_fetched"] -= 20
+    entry, hours_stale = cache.get("k")
+    assert hours_stale
+
+    entry["fetched"] -= 101
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
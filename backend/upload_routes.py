@@ -1,28 +1,51 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from sqlalchemy.orm import Session
 from datetime import datetime
-from PIL import Image, UnidentifiedImageError
-import io
 
 from database import get_db
 from auth_routes import get_current_user
 from models_db import User, Chat, Message, Prediction, PatientState
 from dfu_state import default_patient_state
-from predict_service import predict_ulcer
+from predict_service import get_pipeline, InvalidImageError, ImageTooLargeError, MAX_UPLOAD_BYTES
+from inference_executor import inference_executor
+from model_lifecycle import model_lifecycle
+from metrics import stage_timer
 from ai_chat_routes import next_unanswered_key, format_question
 
 router = APIRouter(prefix="/chat", tags=["Upload + Predict"])
 
 
-# These will be injected from main.py (global loaded models)
-foot_random_model = None
-severity_model = None
+ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/png", "image/jpg"]
 
 
-def set_models(filter_model, sev_model):
-    global foot_random_model, severity_model
-    foot_random_model = filter_model
-    severity_model = sev_model
+async def read_and_predict(file: UploadFile, route: str) -> dict:
+    """
+    Shared upload handling for /predict, /chat/{id}/upload-image and
+    /guest/{id}/upload-image: validate, read and run the inference pipeline
+    on the inference executor.
+    """
+    if file.content_type not in ALLOWED_IMAGE_TYPES:
+        raise HTTPException(status_code=400, detail="Only JPG/PNG images are allowed.")
+
+    try:
+        with stage_timer("image_read", route):
+            contents = await file.read()
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to read image.")
+
+    if len(contents) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image is too large. Please upload a smaller photo.")
+
+    pipeline = get_pipeline()
+    if pipeline is None:
+        raise model_lifecycle.not_ready_error()
+
+    try:
+        return await inference_executor.run(pipeline.predict_bytes, contents, route)
+    except ImageTooLargeError:
+        raise HTTPException(status_code=413, detail="Image is too large. Please upload a smaller photo.")
+    except InvalidImageError:
+        raise HTTPException(status_code=400, detail="Invalid image file or corrupted image.")
 
 
 @router.post("/{chat_id}/upload-image")
@@ -37,26 +60,10 @@ async def upload_image_and_predict(
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    # 2) validate file
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
-        raise HTTPException(status_code=400, detail="Only JPG/PNG images are allowed.")
-
-    # 3) read image
-    try:
-        contents = await file.read()
-        pil_img = Image.open(io.BytesIO(contents))
-    except UnidentifiedImageError:
-        raise HTTPException(status_code=400, detail="Invalid image file or corrupted image.")
-    except Exception:
-        raise HTTPException(status_code=500, detail="Failed to read image.")
-
-    # 4) predict
-    if foot_random_model is None or severity_model is None:
-        raise HTTPException(status_code=500, detail="Models not loaded on server")
-
-    result = predict_ulcer(pil_img, foot_random_model, severity_model)
+    # 2) validate, read and predict
+    result = await read_and_predict(file, route="/chat/{chat_id}/upload-image")
 
-    # 5) save prediction
+    # 3) save prediction
     pred = Prediction(
         chat_id=chat.id,
         is_foot="yes" if result["is_foot"] else "no",
@@ -66,7 +73,7 @@ async def upload_image_and_predict(
     )
     db.add(pred)
 
-    # 6) reset patient state completely on new image upload
+    # 4) reset patient state completely on new image upload
     state_row = db.query(PatientState).filter(PatientState.chat_id == chat.id).first()
     
     # Create fresh state - clear all previous Q&A answers
@@ -89,7 +96,7 @@ async def upload_image_and_predict(
 
     state = dict(state_row.state_json)
 
-    # 7) update state severity and activate Q&A
+    # 5) update state severity and activate Q&A
     if result["is_foot"]:
         state["severity"] = result["severity"]
 
@@ -101,7 +108,7 @@ async def upload_image_and_predict(
     state_row.state_json = dict(state)
     state_row.updated_at = datetime.utcnow()
 
-    # 8) assistant message after upload
+    # 6) assistant message after upload
     if not result["is_foot"]:
         assistant_text = (
             "This image does not look like a foot/DFU image. "
@@ -10,21 +10,32 @@ export const createChat = async () => {
 };
 
 /**
- * Get chat history (authenticated users only)
- * @returns {Promise} Array of chat history items
+ * Get one page of chat history, newest first (authenticated users only).
+ * The server sends an ETag, so the browser revalidates repeat loads and an
+ * unchanged list comes back as a cheap 304.
+ * @param {string} [before] - nextCursor from the previous page
+ * @returns {Promise<{chats: Array, nextCursor: string|null}>} Chat history items and the cursor for older chats
  */
-export const getChatHistory = async () => {
-    const response = await apiClient.get('/chat/history');
-    return response.data;
+export const getChatHistory = async (before = null) => {
+    const response = await apiClient.get('/chat/history', {
+        params: before ? { before } : {},
+    });
+    return {
+        chats: response.data,
+        nextCursor: response.headers['x-next-cursor'] || null,
+    };
 };
 
 /**
- * Get a specific chat by ID with messages
+ * Get a specific chat by ID with its most recent messages
  * @param {number} chatId - Chat ID
- * @returns {Promise} Chat with messages
+ * @param {string} [before] - next_cursor from a previous page, to load older messages
+ * @returns {Promise} Chat with messages (oldest first), next_cursor and has_more
  */
-export const getChatById = async (chatId) => {
-    const response = await apiClient.get(`/chat/${chatId}`);
+export const getChatById = async (chatId, before = null) => {
+    const response = await apiClient.get(`/chat/${chatId}`, {
+        params: before ? { before } : {},
+    });
     return response.data;
 };
 
@@ -8,7 +8,10 @@ const ChatSidebar = ({
     onNewChat,
     onDeleteChat,
     loading = false,
-    mobileOpen = false
+    mobileOpen = false,
+    hasMore = false,
+    loadingMore = false,
+    onLoadMore,
 }) => {
     const handleDelete = (e, chatId) => {
         e.stopPropagation();
@@ -55,8 +58,16 @@ const ChatSidebar = ({
                         >
                             <div className="chat-item-content">
                                 <div className="chat-title">{chat.title || 'New Chat'}</div>
+                                {chat.last_message && (
+                                    <div className="chat-preview">{chat.last_message}</div>
+                                )}
                                 <div className="chat-date">
                                     {new Date(chat.created_at).toLocaleDateString()}
+                                    {chat.latest_severity && (
+                                        <span className="chat-severity">
+                                            {chat.latest_severity}
+                                        </span>
+                                    )}
                                 </div>
                             </div>
                             <button
@@ -69,6 +80,11 @@ const ChatSidebar = ({
                         </div>
                     ))
                 )}
+                {hasMore && onLoadMore && (
+                    <button className="chat-load-more" onClick={onLoadMore} disabled={loadingMore}>
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                )}
             </div>
         </div>
     );
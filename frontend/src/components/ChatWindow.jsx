@@ -9,17 +9,37 @@ const ChatWindow = ({
     loading = false,
     showImageUpload = false,
     onImageUpload,
+    hasOlder = false,
+    loadingOlder = false,
+    onLoadOlder,
 }) => {
     const messagesEndRef = useRef(null);
     const messagesContainerRef = useRef(null);
+    const lastMessageRef = useRef(null);
+    const scrollFromBottomRef = useRef(0);
 
-    // Auto-scroll to bottom when new messages arrive
-    React.useEffect(() => {
-        if (messagesContainerRef.current) {
-            messagesContainerRef.current.scrollTop = messagesContainerRef.current.scrollHeight;
+    // Auto-scroll to bottom when new messages arrive; when older messages are
+    // prepended, keep the messages the user was reading in place instead
+    React.useLayoutEffect(() => {
+        const container = messagesContainerRef.current;
+        if (!container) return;
+        const last = messages[messages.length - 1];
+        if (last && last === lastMessageRef.current) {
+            container.scrollTop = container.scrollHeight - scrollFromBottomRef.current;
+        } else {
+            container.scrollTop = container.scrollHeight;
         }
+        lastMessageRef.current = last;
     }, [messages]);
 
+    const handleLoadOlder = () => {
+        const container = messagesContainerRef.current;
+        if (container) {
+            scrollFromBottomRef.current = container.scrollHeight - container.scrollTop;
+        }
+        onLoadOlder();
+    };
+
     return (
         <div className="chat-window">
             <div className="chat-messages" ref={messagesContainerRef}>
@@ -33,9 +53,18 @@ const ChatWindow = ({
                     </div>
                 ) : (
                     <>
+                        {hasOlder && onLoadOlder && (
+                            <button
+                                className="load-older-button"
+                                onClick={handleLoadOlder}
+                                disabled={loadingOlder}
+                            >
+                                {loadingOlder ? 'Loading...' : 'Load older messages'}
+                            </button>
+                        )}
                         {messages.map((msg, index) => (
                             <MessageBubble
-                                key={index}
+                                key={msg.id ?? index}
                                 role={msg.role}
                                 content={msg.content}
                                 timestamp={msg.created_at || msg.timestamp}
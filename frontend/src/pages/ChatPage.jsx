@@ -25,8 +25,12 @@ const ChatPage = () => {
 
     // Authenticated mode state
     const [chats, setChats] = useState([]);
+    const [historyCursor, setHistoryCursor] = useState(null);
+    const [loadingMoreChats, setLoadingMoreChats] = useState(false);
     const [activeChatId, setActiveChatId] = useState(null);
     const [messages, setMessages] = useState([]);
+    const [olderCursor, setOlderCursor] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
 
     // UI state
     const [loading, setLoading] = useState(false);
@@ -64,8 +68,9 @@ const ChatPage = () => {
     const loadChatHistory = async () => {
         setChatListLoading(true);
         try {
-            const history = await getChatHistory();
+            const { chats: history, nextCursor } = await getChatHistory();
             setChats(history);
+            setHistoryCursor(nextCursor);
 
             // Auto-select first chat if available
             if (history.length > 0 && !activeChatId) {
@@ -78,6 +83,45 @@ const ChatPage = () => {
         }
     };
 
+    // Pick up new previews / severities without a spinner; unchanged lists are a 304
+    const refreshChatHistory = async () => {
+        try {
+            const { chats: page, nextCursor } = await getChatHistory();
+            if (!nextCursor) {
+                setChats(page);
+                setHistoryCursor(null);
+                return;
+            }
+            // Keep older chats already loaded through "Load more"
+            const pageIds = new Set(page.map((c) => c.chat_id));
+            const oldest = new Date(page[page.length - 1].created_at);
+            setChats((prev) => [
+                ...page,
+                ...prev.filter((c) => !pageIds.has(c.chat_id) && new Date(c.created_at) < oldest),
+            ]);
+            setHistoryCursor((prev) => prev || nextCursor);
+        } catch (error) {
+            console.error('Failed to refresh chat history:', error);
+        }
+    };
+
+    const handleLoadMoreChats = async () => {
+        if (!historyCursor || loadingMoreChats) return;
+        setLoadingMoreChats(true);
+        try {
+            const { chats: page, nextCursor } = await getChatHistory(historyCursor);
+            setChats((prev) => {
+                const known = new Set(prev.map((c) => c.chat_id));
+                return [...prev, ...page.filter((c) => !known.has(c.chat_id))];
+            });
+            setHistoryCursor(nextCursor);
+        } catch (error) {
+            console.error('Failed to load more chats:', error);
+        } finally {
+            setLoadingMoreChats(false);
+        }
+    };
+
     const initGuestSession = async () => {
         try {
             const response = await startGuestChat();
@@ -94,6 +138,7 @@ const ChatPage = () => {
             setChats([newChat, ...chats]);
             setActiveChatId(newChat.chat_id);
             setMessages([]);
+            setOlderCursor(null);
         } catch (error) {
             console.error('Failed to create chat:', error);
             alert('Failed to create new chat');
@@ -106,14 +151,30 @@ const ChatPage = () => {
         try {
             const chatData = await getChatById(chatId);
             setMessages(chatData.messages || []);
+            setOlderCursor(chatData.next_cursor || null);
         } catch (error) {
             console.error('Failed to load chat:', error);
             setMessages([]);
+            setOlderCursor(null);
         } finally {
             setLoading(false);
         }
     };
 
+    const handleLoadOlder = async () => {
+        if (!activeChatId || !olderCursor || loadingOlder) return;
+        setLoadingOlder(true);
+        try {
+            const chatData = await getChatById(activeChatId, olderCursor);
+            setMessages((prev) => [...(chatData.messages || []), ...prev]);
+            setOlderCursor(chatData.next_cursor || null);
+        } catch (error) {
+            console.error('Failed to load older messages:', error);
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
     const handleDeleteChat = async (chatId) => {
         try {
             await deleteChatApi(chatId);
@@ -123,6 +184,7 @@ const ChatPage = () => {
             if (activeChatId === chatId) {
                 setActiveChatId(null);
                 setMessages([]);
+                setOlderCursor(null);
             }
         } catch (error) {
             console.error('Failed to delete chat:', error);
@@ -199,6 +261,7 @@ const ChatPage = () => {
                 created_at: new Date().toISOString(),
             };
             setMessages((prev) => [...prev, aiMessage]);
+            refreshChatHistory();
         } catch (error) {
             console.error('Failed to send message:', error);
             const errorMessage = {
@@ -273,6 +336,7 @@ const ChatPage = () => {
             };
             setMessages((prev) => [...prev, aiMessage]);
             setShowImageUploader(false);
+            refreshChatHistory();
         } catch (error) {
             console.error('Failed to upload image:', error);
             throw new Error(error.response?.data?.detail || 'Upload failed');
@@ -344,6 +408,9 @@ const ChatPage = () => {
                     onDeleteChat={handleDeleteChat}
                     loading={chatListLoading}
                     mobileOpen={mobileMenuOpen}
+                    hasMore={historyCursor !== null}
+                    loadingMore={loadingMoreChats}
+                    onLoadMore={handleLoadMoreChats}
                 />
             )}
 
@@ -386,6 +453,9 @@ const ChatPage = () => {
                     loading={loading}
                     showImageUpload={isAuthenticated || (guestSessionId !== null)}
                     onImageUpload={handleImageUploadClick}
+                    hasOlder={isAuthenticated && olderCursor !== null}
+                    loadingOlder={loadingOlder}
+                    onLoadOlder={handleLoadOlder}
                 />
             </div>
 